@@ -0,0 +1,114 @@
+# coding=utf-8
+"""
+Microbenchmark of opcode dispatch cost.
+
+Every snippet is repeated inside a counted loop, the time of the same loop with empty body is subtracted and the
+rest is divided by the number of executed snippet instructions. CREATEFRAME was the first opcode of the old
+if/elif chain, STRI2INTS and JUMPIFNEQS were the last ones, so with the old chain their cost per instruction
+differs a lot, with the dispatch table it does not.
+
+Pouziti:
+    python3 benchmarks/dispatch.py [--iterations=<n>] [<interpret.py> ...]
+
+Old interpreter can be compared by exporting it from git, e.g.
+    git show <revision>:interpret.py > /tmp/old_interpret.py
+    python3 benchmarks/dispatch.py interpret.py /tmp/old_interpret.py
+"""
+
+import getopt
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SNIPPETS = [
+    ("CREATEFRAME", ["CREATEFRAME"]),
+    ("MOVE", ["MOVE GF@x int@1"]),
+    ("ADD", ["ADD GF@x GF@x int@1"]),
+    ("PUSHS/CLEARS", ["PUSHS int@1", "CLEARS"]),
+    ("STRI2INTS", ["PUSHS string@a", "PUSHS int@0", "STRI2INTS", "CLEARS"]),
+    ("JUMPIFNEQS", ["PUSHS int@1", "PUSHS int@1", "JUMPIFNEQS end"]),
+]
+REPEAT = 10  # snippet copies in loop body
+
+
+def emit(lines):
+    """
+    Build XML program from lines in IPPcode18 syntax (operands without spaces).
+    # type: (list) -> str
+    """
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n<program language="IPPcode18">\n']
+    for order, line in enumerate(lines, 1):
+        parts = line.split()
+        out.append('<instruction order="' + str(order) + '" opcode="' + parts[0] + '">')
+        for i, operand in enumerate(parts[1:], 1):
+            if operand[:3] in ("GF@", "LF@", "TF@"):
+                argtype, value = "var", operand
+            elif "@" in operand:
+                argtype, value = operand.split("@", 1)
+            else:
+                argtype, value = "label", operand
+            out.append('<arg' + str(i) + ' type="' + argtype + '">' + value + '</arg' + str(i) + '>')
+        out.append('</instruction>\n')
+    out.append('</program>\n')
+    return "".join(out)
+
+
+def program(body, iterations):
+    """
+    Build counted loop executing body iterations times.
+    # type: (list, int) -> str
+    """
+    lines = ["DEFVAR GF@x", "DEFVAR GF@i", "MOVE GF@x int@0", "MOVE GF@i int@" + str(iterations), "LABEL loop"]
+    lines += body
+    lines += ["SUB GF@i GF@i int@1", "JUMPIFNEQ loop GF@i int@0", "LABEL end"]
+    return emit(lines)
+
+
+def measure(interpret, source):
+    """
+    Return best wall time of three runs of interpret.py with specified source.
+    # type: (str, str) -> float
+    """
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, interpret, "--source=" + source], stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    (opts, interprets) = getopt.getopt(sys.argv[1:], "", ["iterations="])
+    iterations = 20000
+    for option, value in opts:
+        if option == "--iterations":
+            iterations = int(value)
+    if not interprets:
+        interprets = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "interpret.py")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        empty = os.path.join(tmp, "empty.xml")
+        with open(empty, "w") as file:
+            file.write(program([], iterations))
+        sources = []
+        for name, snippet in SNIPPETS:
+            path = os.path.join(tmp, name.replace("/", "_") + ".xml")
+            with open(path, "w") as file:
+                file.write(program(snippet * REPEAT, iterations))
+            sources.append((name, path, len(snippet) * REPEAT * iterations))
+
+        print("%-14s" % "ns/instrukce" + "".join("%22s" % os.path.basename(i)[:22] for i in interprets))
+        base = [measure(i, empty) for i in interprets]
+        for name, path, count in sources:
+            row = "%-14s" % name
+            for interpret, overhead in zip(interprets, base):
+                row += "%22.0f" % ((measure(interpret, path) - overhead) / count * 1e9)
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# coding=utf-8
+"""
+Memory benchmark of deep recursion and tail calls.
+
+Every pattern is a function calling itself the given number of times. Maximal RSS of the interpreter process,
+the deepest call stack and the highest number of existing frames are printed:
+
+    call-return   CALL followed by RETURN without frames, tail call, memory is bounded
+    frame-tail    PUSHFRAME at function start, CALL followed by POPFRAME and RETURN; tail call keeps the call
+                  stack bounded, but every level keeps its local frame until the POPFRAMEs run at the end,
+                  because they stay observable (POPFRAME makes the frame below temporary frame)
+    frame-call    the same function with another instruction after CALL, no tail call, both stacks grow
+
+With --names=<n> the program also contains a function which is never called and defines n other local
+variables. Local frames of programs with more than LOCAL_SLOTS local names are sparse, so their size does not
+depend on the names of other functions.
+
+Pouziti:
+    python3 benchmarks/recursion_memory.py [--depth=<n>] [--names=<n>] [<interpret.py> ...]
+"""
+
+import getopt
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dispatch import emit  # noqa: E402
+
+PATTERNS = [
+    ("call-return", ["LABEL f",
+                     "JUMPIFEQ end GF@n int@0",
+                     "SUB GF@n GF@n int@1",
+                     "CALL f",
+                     "RETURN"]),
+    ("frame-tail", ["LABEL f",
+                    "PUSHFRAME",
+                    "JUMPIFEQ end LF@n int@0",
+                    "CREATEFRAME",
+                    "DEFVAR TF@n",
+                    "SUB TF@n LF@n int@1",
+                    "CALL f",
+                    "POPFRAME",
+                    "RETURN"]),
+    ("frame-call", ["LABEL f",
+                    "PUSHFRAME",
+                    "JUMPIFEQ end LF@n int@0",
+                    "CREATEFRAME",
+                    "DEFVAR TF@n",
+                    "SUB TF@n LF@n int@1",
+                    "CALL f",
+                    "MOVE GF@n LF@n",
+                    "POPFRAME",
+                    "RETURN"]),
+]
+
+
+def program(function, depth, names=0):
+    """
+    Build program calling recursive function with argument depth in GF@n and in TF@n, with names unused
+    local variables in function which is never called.
+    # type: (list, int, int) -> str
+    """
+    lines = ["DEFVAR GF@n", "MOVE GF@n int@" + str(depth),
+             "CREATEFRAME", "DEFVAR TF@n", "MOVE TF@n int@" + str(depth),
+             "CALL f", "JUMP finish"]
+    lines += function
+    lines += ["LABEL end", "POPFRAME", "RETURN"] if "PUSHFRAME" in function else ["LABEL end", "RETURN"]
+    lines += ["LABEL unused", "CREATEFRAME"] + ["DEFVAR TF@unused" + str(i) for i in range(names)] + ["RETURN"]
+    lines += ["LABEL finish"]
+    return emit(lines)
+
+
+def run(interpret, source, stats):
+    """
+    Run interpret.py in a child process, return its maximal RSS in kB, call stack depth and number of frames.
+    # type: (str, str, str) -> tuple
+    """
+    pid = os.fork()
+    if pid == 0:
+        with open(os.devnull, "w") as null:
+            os.dup2(null.fileno(), 1)
+        os.execv(sys.executable, [sys.executable, interpret, "--source=" + source, "--stats=" + stats,
+                                  "--call-depth", "--frames"])
+    _, status, usage = os.wait4(pid, 0)
+    if status != 0:
+        raise OSError("interpret skoncil se stavem " + str(status))
+    with open(stats) as file:
+        call_depth, frames = (int(line) for line in file)
+    return usage.ru_maxrss, call_depth, frames
+
+
+def main():
+    (opts, interprets) = getopt.getopt(sys.argv[1:], "", ["depth=", "names="])
+    depth = 300000
+    names = 0
+    for option, value in opts:
+        if option == "--depth":
+            depth = int(value)
+        elif option == "--names":
+            names = int(value)
+    if not interprets:
+        interprets = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "interpret.py")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = os.path.join(tmp, "stats")
+        for name, function in PATTERNS:
+            source = os.path.join(tmp, name + ".xml")
+            with open(source, "w") as file:
+                file.write(program(function, depth, names))
+            for interpret in interprets:
+                rss, call_depth, frames = run(interpret, source, stats)
+                print("%-12s %-24s %8d kB max RSS, hloubka volani %8d, ramcu %8d" % (
+                    name, os.path.basename(interpret)[:24], rss, call_depth, frames))
+
+
+if __name__ == "__main__":
+    main()
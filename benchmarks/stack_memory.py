@@ -0,0 +1,77 @@
+# coding=utf-8
+"""
+Memory benchmark of the data stack (STACK extension).
+
+The program pushes the given number of values (ints, bools and strings computed by stack instructions) onto
+the data stack and keeps them there until the end. Maximal RSS of the interpreter process and of a program
+with empty loop body are printed, their difference is the memory used by the stack.
+
+Pouziti:
+    python3 benchmarks/stack_memory.py [--values=<n>] [<interpret.py> ...]
+"""
+
+import getopt
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dispatch import emit  # noqa: E402
+
+
+def program(values, body):
+    """
+    Build loop executed values/3 times, every iteration keeps 3 values on the stack when body is used.
+    # type: (int, bool) -> str
+    """
+    lines = ["DEFVAR GF@i", "MOVE GF@i int@" + str(values // 3), "LABEL loop"]
+    if body:
+        lines += ["PUSHS GF@i", "PUSHS int@1", "ADDS",  # int
+                  "PUSHS GF@i", "PUSHS int@0", "GTS",  # bool
+                  "PUSHS string@x"]  # string
+    lines += ["SUB GF@i GF@i int@1", "JUMPIFNEQ loop GF@i int@0"]
+    return emit(lines)
+
+
+def max_rss(interpret, source):
+    """
+    Run interpret.py in a child process and return its maximal RSS in kB.
+    # type: (str, str) -> int
+    """
+    pid = os.fork()
+    if pid == 0:
+        with open(os.devnull, "w") as null:
+            os.dup2(null.fileno(), 1)
+        os.execv(sys.executable, [sys.executable, interpret, "--source=" + source])
+    _, status, usage = os.wait4(pid, 0)
+    if status != 0:
+        raise subprocess.CalledProcessError(status, interpret)
+    return usage.ru_maxrss
+
+
+def main():
+    (opts, interprets) = getopt.getopt(sys.argv[1:], "", ["values="])
+    values = 1000000
+    for option, value in opts:
+        if option == "--values":
+            values = int(value)
+    if not interprets:
+        interprets = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "interpret.py")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full = os.path.join(tmp, "stack.xml")
+        empty = os.path.join(tmp, "empty.xml")
+        with open(full, "w") as file:
+            file.write(program(values, True))
+        with open(empty, "w") as file:
+            file.write(program(values, False))
+        for interpret in interprets:
+            used = max_rss(interpret, full)
+            base = max_rss(interpret, empty)
+            print("%-24s %8d kB max RSS, %8d kB stack, %6.1f B/hodnota" % (
+                os.path.basename(interpret)[:24], used, used - base, (used - base) * 1024.0 / values))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# coding=utf-8
+"""
+Benchmark of string building and editing.
+
+The first program builds string of the given length character by character by CONCAT, the second one builds
+it the same way and then rewrites and reads every character by SETCHAR and GETCHAR. With immutable strings
+every CONCAT and SETCHAR copies the whole string, so the time grows quadratically with the length.
+
+Pouziti:
+    python3 benchmarks/strings.py [--length=<n>] [<interpret.py> ...]
+"""
+
+import getopt
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dispatch import emit, measure  # noqa: E402
+
+
+def program(length, edit):
+    """
+    Build string of length characters, rewrite and read all of them when edit is set.
+    # type: (int, bool) -> str
+    """
+    lines = ["DEFVAR GF@s", "DEFVAR GF@i", "DEFVAR GF@c", "MOVE GF@s string@", "MOVE GF@i int@" + str(length),
+             "LABEL build", "CONCAT GF@s GF@s string@x", "SUB GF@i GF@i int@1", "JUMPIFNEQ build GF@i int@0"]
+    if edit:
+        lines += ["LABEL edit", "SETCHAR GF@s GF@i string@y", "GETCHAR GF@c GF@s GF@i", "ADD GF@i GF@i int@1",
+                  "JUMPIFNEQ edit GF@i int@" + str(length)]
+    lines += ["STRLEN GF@i GF@s", "WRITE GF@i"]
+    return emit(lines)
+
+
+def main():
+    (opts, interprets) = getopt.getopt(sys.argv[1:], "", ["length="])
+    length = 1 << 20
+    for option, value in opts:
+        if option == "--length":
+            length = int(value)
+    if not interprets:
+        interprets = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "interpret.py")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build = os.path.join(tmp, "build.xml")
+        edit = os.path.join(tmp, "edit.xml")
+        with open(build, "w") as file:
+            file.write(program(length, False))
+        with open(edit, "w") as file:
+            file.write(program(length, True))
+        print("%-24s %12s %12s" % ("delka " + str(length), "CONCAT [s]", "+SETCHAR [s]"))
+        for interpret in interprets:
+            print("%-24s %12.2f %12.2f" % (os.path.basename(interpret)[:24], measure(interpret, build),
+                                           measure(interpret, edit)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# coding=utf-8
+"""
+Benchmark suite of interpret.py on generated workloads.
+
+Every workload is generated in size given by --scale (1 = about 10^5 - 10^6 executed instructions):
+    arith    counted loop of ADD, SUB, MUL and IDIV
+    calls    recursive CALL chain with local frames
+    strings  string building with CONCAT and SETCHAR
+    stack    STACK extension loop of PUSHS, ADDS and JUMPIFEQS
+    io       READ of integers from input and WRITE of them
+    load     straight program of 10^5 instructions, most of the time is spent by loading
+
+Load time is the wall time of the same program which jumps to its end by the first instruction, so it is
+measured the same way for any version of interpret.py. Instructions per second are counted from the rest of
+wall time and --stats --insts, peak RSS is taken from the child process. Best of --repeat runs is reported.
+The result is written as JSON to the standard output or to --output.
+
+Pouziti:
+    python3 benchmarks/suite.py [--scale=<n>] [--repeat=<n>] [--workloads=<name,...>] [--output=<file>]
+                                [<interpret.py> ...]
+"""
+
+import getopt
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dispatch import emit  # noqa: E402
+
+
+def loop(count, body):
+    """
+    Wrap body into loop executed count times (GF@i is the counter).
+    # type: (int, list) -> list
+    """
+    return (["DEFVAR GF@i", "MOVE GF@i int@" + str(count), "LABEL loop"] + body +
+            ["SUB GF@i GF@i int@1", "JUMPIFNEQ loop GF@i int@0"])
+
+
+def arith(scale):
+    """
+    Counted loop of arithmetic instructions.
+    # type: (int) -> tuple
+    """
+    body = ["ADD GF@x GF@x int@7", "MUL GF@y GF@x int@3", "SUB GF@y GF@y int@5", "IDIV GF@x GF@y int@3"]
+    return ["DEFVAR GF@x", "DEFVAR GF@y", "MOVE GF@x int@1"] + loop(50000 * scale, body), ""
+
+
+def calls(scale):
+    """
+    Recursive calls, every level creates local frame with one variable.
+    # type: (int) -> tuple
+    """
+    lines = ["DEFVAR GF@n", "DEFVAR GF@depth"]
+    lines += loop(100 * scale, ["MOVE GF@n int@500", "CALL count"])
+    lines += ["JUMP end",
+              "LABEL count",
+              "JUMPIFEQ return GF@n int@0",
+              "SUB GF@n GF@n int@1",
+              "CREATEFRAME", "PUSHFRAME",
+              "DEFVAR LF@n", "MOVE LF@n GF@n",
+              "CALL count",
+              "POPFRAME",
+              "LABEL return",
+              "RETURN",
+              "LABEL end"]
+    return lines, ""
+
+
+def strings(scale):
+    """
+    Build string of 100 characters by CONCAT and rewrite every character by SETCHAR, repeatedly.
+    # type: (int) -> tuple
+    """
+    lines = ["DEFVAR GF@s", "DEFVAR GF@j", "DEFVAR GF@len"]
+    body = ["MOVE GF@s string@", "MOVE GF@j int@0",
+            "LABEL build", "CONCAT GF@s GF@s string@ab", "ADD GF@j GF@j int@1", "JUMPIFNEQ build GF@j int@50",
+            "STRLEN GF@len GF@s",
+            "LABEL rewrite", "SUB GF@j GF@j int@1", "SETCHAR GF@s GF@j string@x", "JUMPIFNEQ rewrite GF@j int@0"]
+    return lines + loop(1000 * scale, body), ""
+
+
+def stack(scale):
+    """
+    Loop of STACK extension instructions, the loop condition is computed on the stack.
+    # type: (int) -> tuple
+    """
+    lines = ["DEFVAR GF@i", "MOVE GF@i int@" + str(50000 * scale),
+             "LABEL loop",
+             "PUSHS GF@i", "PUSHS int@3", "ADDS", "PUSHS int@2", "MULS", "POPS GF@x",
+             "PUSHS GF@i", "PUSHS int@1", "SUBS", "POPS GF@i",
+             "PUSHS GF@i", "PUSHS int@0", "JUMPIFNEQS loop"]
+    return ["DEFVAR GF@x"] + lines, ""
+
+
+def io(scale):
+    """
+    Read integers from input and write them.
+    # type: (int) -> tuple
+    """
+    count = 50000 * scale
+    body = ["READ GF@x type@int", "WRITE GF@x", "WRITE string@\\010"]
+    return ["DEFVAR GF@x"] + loop(count, body), "".join(str(i) + "\n" for i in range(count))
+
+
+def load(scale):
+    """
+    Straight program, every instruction is executed once.
+    # type: (int) -> tuple
+    """
+    lines = ["DEFVAR GF@x", "MOVE GF@x int@0"]
+    for i in range(100000 * scale // 2):
+        lines += ["ADD GF@x GF@x int@" + str(i % 100), "MOVE GF@y GF@x" if i == 0 else "TYPE GF@y GF@x"]
+    return ["DEFVAR GF@y"] + lines, ""
+
+
+WORKLOADS = [("arith", arith), ("calls", calls), ("strings", strings), ("stack", stack), ("io", io),
+             ("load", load)]
+
+
+def run(interpret, source, inputpath, statpath):
+    """
+    Run interpret.py in a child process, return wall time in seconds and maximal RSS in kB.
+    # type: (str, str, str, str) -> tuple
+    """
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        with open(os.devnull, "w") as null:
+            os.dup2(null.fileno(), 1)
+        with open(inputpath) as file:
+            os.dup2(file.fileno(), 0)
+        os.execv(sys.executable, [sys.executable, interpret, "--source=" + source, "--stats=" + statpath,
+                                  "--insts"])
+    _, status, usage = os.wait4(pid, 0)
+    elapsed = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError(interpret + " skoncil s chybou " + str(status >> 8) + " na " + source)
+    return elapsed, usage.ru_maxrss
+
+
+def measure(interpret, source, skip, inputpath, statpath, repeat):
+    """
+    Measure one workload, return its result record.
+    # type: (str, str, str, str, str, int) -> dict
+    """
+    load_time = min(run(interpret, skip, inputpath, statpath)[0] for _ in range(repeat))
+    runs = [run(interpret, source, inputpath, statpath) for _ in range(repeat)]
+    run_time = min(elapsed for elapsed, _ in runs)
+    with open(statpath) as file:
+        instructions = int(file.read())
+    return {"load_time": round(load_time, 4), "run_time": round(run_time, 4), "instructions": instructions,
+            "ips": round(instructions / max(run_time - load_time, 1e-6)),
+            "peak_rss_kb": max(rss for _, rss in runs)}
+
+
+def main():
+    (opts, interprets) = getopt.getopt(sys.argv[1:], "", ["scale=", "repeat=", "workloads=", "output="])
+    scale = 1
+    repeat = 3
+    names = [name for name, _ in WORKLOADS]
+    output = ""
+    for option, value in opts:
+        if option == "--scale":
+            scale = int(value)
+        elif option == "--repeat":
+            repeat = int(value)
+        elif option == "--workloads":
+            names = value.split(",")
+        elif option == "--output":
+            output = value
+    if not interprets:
+        interprets = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "interpret.py")]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        statpath = os.path.join(tmp, "stats")
+        for name, workload in WORKLOADS:
+            if name not in names:
+                continue
+            lines, text = workload(scale)
+            source = os.path.join(tmp, name + ".xml")
+            skip = os.path.join(tmp, name + "_load.xml")
+            inputpath = os.path.join(tmp, name + ".in")
+            with open(source, "w") as file:
+                file.write(emit(lines))
+            with open(skip, "w") as file:
+                file.write(emit(["JUMP skip__"] + lines + ["LABEL skip__"]))
+            with open(inputpath, "w") as file:
+                file.write(text)
+            for interpret in interprets:
+                record = {"workload": name, "interpret": interpret, "instructions_in_program": len(lines)}
+                record.update(measure(interpret, source, skip, inputpath, statpath, repeat))
+                results.append(record)
+                sys.stderr.write("%-8s %-24s %8.3f s nacteni %12d instrukci/s %8d kB\n" % (
+                    name, os.path.basename(interpret)[:24], record["load_time"], record["ips"],
+                    record["peak_rss_kb"]))
+
+    report = {"python": platform.python_version(), "scale": scale, "repeat": repeat, "results": results}
+    if output != "":
+        with open(output, "w") as file:
+            json.dump(report, file, indent=1)
+            file.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# coding=utf-8
+"""
+Decoder of binary trace written by interpret.py --trace.
+
+Trace keeps the last executed instructions, every one with its operands read before it was executed. Records
+are printed from the oldest one: number of executed instruction, order of instruction, opcode and operands.
+Operand is shown by its type and value (number, bool, length of string), "zasobnik:" marks value from the top
+of data stack taken by stack instruction, "(oriznuto)" marks int which did not fit into 64 bits. The last
+record of program which failed is the failing instruction.
+
+Pouziti:
+    python3 decode_trace.py [--last=<n>] <file>
+"""
+
+import getopt
+import struct
+import sys
+
+HEADER = struct.Struct("<8sHHIQ")  # magic, version, record size, records in file, executed instructions
+RECORD = struct.Struct("<IH3B3q")  # order, opcode id, kinds of three operands, their values
+FLOAT = struct.Struct("<d")
+FLOAT_BITS = struct.Struct("<q")  # float value is stored as its bits
+MAGIC = b"IPPTRACE"
+VERSION = 2
+CLIPPED = 0x40  # flag of int which did not fit into 64 bits
+STACK = 0x80  # flag of value from data stack
+
+
+def operand(kind, value):
+    """
+    Format operand of record.
+    # type: (int, int) -> str
+    """
+    prefix = "zasobnik:" if kind & STACK else ""
+    suffix = "(oriznuto)" if kind & CLIPPED else ""
+    kind &= ~(STACK | CLIPPED)
+    if kind == 1:
+        text = "int@" + str(value)
+    elif kind == 2:
+        text = "bool@" + ("true" if value else "false")
+    elif kind == 3:
+        text = "string(" + str(int(value)) + ")"
+    elif kind == 4:
+        text = "float@" + repr(FLOAT.unpack(FLOAT_BITS.pack(value))[0])
+    elif kind == 5:
+        text = "bez hodnoty"
+    elif kind == 6:
+        text = "nedefinovana"
+    elif kind == 7:
+        text = "navesti/typ"
+    else:
+        text = "?" + str(kind)
+    return prefix + text + suffix
+
+
+def decode(filepath, last):
+    """
+    Print records of trace file, only the last ones when last is not 0.
+    # type: (str, int) -> None
+    """
+    with open(filepath, "rb") as file:
+        data = file.read()
+    magic, version, record_size, records, executed = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError("neznamy format souboru")
+    offset = HEADER.size
+    (length,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    opcodes = data[offset:offset + length].decode().split("\n")
+    offset += length
+
+    first = records - last if 0 < last < records else 0
+    print("%12s %8s  %-12s %s" % ("vykonana", "poradi", "instrukce", "operandy"))
+    for i in range(first, records):
+        order, op, *rest = RECORD.unpack_from(data, offset + i * RECORD.size)
+        kinds, values = rest[:3], rest[3:]
+        operands = [operand(kind, value) for kind, value in zip(kinds, values) if kind != 0]
+        name = opcodes[op] if op < len(opcodes) else "?" + str(op)
+        print("%12d %8d  %-12s %s" % (executed - records + i + 1, order, name, " ".join(operands)))
+
+
+def main():
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "h", ["help", "last="])
+        last = 0
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                print(__doc__.strip())
+                sys.exit(0)
+            elif option == "--last":
+                last = int(value)
+                if last <= 0:
+                    raise ValueError
+        if len(args) != 1:
+            raise getopt.GetoptError("")
+    except (getopt.GetoptError, ValueError):
+        sys.stderr.write("Nespravne parametry, pouziti: python3 decode_trace.py [--last=<n>] <file>\n")
+        sys.exit(10)
+    try:
+        decode(args[0], last)
+    except (OSError, ValueError, struct.error) as err:
+        sys.stderr.write('Soubor "' + args[0] + '" nelze precist: ' + str(err) + "\n")
+        sys.exit(11)
+
+
+if __name__ == "__main__":
+    main()
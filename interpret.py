@@ -1,24 +1,204 @@
 # coding=utf-8
 
+from array import array
+import asyncio
+import codecs
+import gc
 import getopt
+import hashlib
+import io
+import mmap
+import operator
+import os
+import json
+import pickle
+import signal
+import socket
+import struct
 import sys
+import tempfile
+import time
+import traceback
 import xml.etree.ElementTree as etree
 import re
+import zlib
+
+
+# Operand kinds of every instruction, same table as in parse.php. None = operands are not checked (STACK extension).
+SIGNATURES = {
+    "MOVE": ("var", "symb"),
+    "CREATEFRAME": (),
+    "PUSHFRAME": (),
+    "POPFRAME": (),
+    "DEFVAR": ("var",),
+    "CALL": ("label",),
+    "RETURN": (),
+    "PUSHS": ("symb",),
+    "POPS": ("var",),
+    "ADD": ("var", "symb", "symb"),
+    "SUB": ("var", "symb", "symb"),
+    "MUL": ("var", "symb", "symb"),
+    "IDIV": ("var", "symb", "symb"),
+    "LT": ("var", "symb", "symb"),
+    "GT": ("var", "symb", "symb"),
+    "EQ": ("var", "symb", "symb"),
+    "AND": ("var", "symb", "symb"),
+    "OR": ("var", "symb", "symb"),
+    "NOT": ("var", "symb"),
+    "INT2CHAR": ("var", "symb"),
+    "STRI2INT": ("var", "symb", "symb"),
+    "READ": ("var", "type"),
+    "WRITE": ("symb",),
+    "CONCAT": ("var", "symb", "symb"),
+    "STRLEN": ("var", "symb"),
+    "GETCHAR": ("var", "symb", "symb"),
+    "SETCHAR": ("var", "symb", "symb"),
+    "TYPE": ("var", "symb"),
+    "LABEL": ("label",),
+    "JUMP": ("label",),
+    "JUMPIFEQ": ("label", "symb", "symb"),
+    "JUMPIFNEQ": ("label", "symb", "symb"),
+    "DPRINT": ("symb",),
+    "BREAK": (),
+    # FLOAT
+    "INT2FLOAT": ("var", "symb"),
+    "FLOAT2INT": ("var", "symb"),
+    # STACK
+    "CLEARS": None,
+    "ADDS": None,
+    "SUBS": None,
+    "MULS": None,
+    "IDIVS": None,
+    "LTS": None,
+    "GTS": None,
+    "EQS": None,
+    "ANDS": None,
+    "ORS": None,
+    "NOTS": None,
+    "INT2CHARS": None,
+    "STRI2INTS": None,
+    "JUMPIFEQS": ("label",),
+    "JUMPIFNEQS": ("label",),
+}
+
+# Opcode id is index in this list, pseudo-opcode INVALID marks instruction which failed to decode,
+# TAILCALL is CALL followed by RETURN (or POPFRAME and RETURN) which does not need its own return address,
+# CMPJUMP, STACKOP and MOVEOP are superinstructions made by peephole()
+OPCODES = list(SIGNATURES) + ["INVALID", "TAILCALL", "CMPJUMP", "STACKOP", "MOVEOP"]  # UNCHECKED are appended
+OPCODE_ID = {name: i for i, name in enumerate(OPCODES)}
+
+LABEL_RE = re.compile(r"[a-zA-Z_\-$&%*][\w_\-$&%*]*")
+VAR_RE = re.compile(r"(LF|TF|GF)@([a-zA-Z_\-$&%*][\w_\-$&%*]*)")
+STRING_RE = re.compile(r"([^\s#\\]|\\\d{3})+")
+ESCAPE_RE = re.compile(r"\\(\d{3})")
+
+BLOCK_SIZE = 1 << 16  # bytes of program input read at once
+BUFFER_SIZE = 1 << 16  # default number of buffered characters of program output
+BLOCK_LENGTH = 200  # maximal number of instructions in compiled basic block
+HOT_BLOCK = 20  # number of entries of basic block after which it is compiled
+ROPE_MIN = 256  # length of string from which CONCAT appending to itself and SETCHAR edit it in place
+PROGRAM_CACHE = 64  # number of loaded programs kept by server worker
+MAX_SAMPLE_DEPTH = 256  # maximal depth of call stack distinguished by --samples
+LOOP_JUMPS = ("JUMP", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS")  # backward jump of these closes loop
+STATS = ("insts", "vars", "stack-depth", "call-depth", "frames")  # statistics which --stats can write
+TRACE_SIZE = 1 << 12  # default number of the last executed instructions kept by --trace
+LIMIT_INTERVAL = 1 << 14  # executed instructions between checks of --timeout and of SIGTERM with --checkpoint
+QUANTUM = 1 << 10  # default number of executed instructions after which session of --sessions yields to others
+LOCAL_SLOTS = 64  # maximal number of LF/TF names for which local frames are lists with slot for every name
+
+# Trace file: header (magic, version, record size, records in file, executed instructions), length of opcode
+# names and names separated by LF, records from the oldest one. Record is order, opcode id, kinds of three
+# operands and their values as 64-bit integers (int, bool as 0/1, length of string, bits of float),
+# decode_trace.py prints it.
+TRACE_HEADER = struct.Struct("<8sHHIQ")
+TRACE_RECORD = struct.Struct("<IH3B3q")
+TRACE_MAGIC = b"IPPTRACE"
+TRACE_VERSION = 2
+TRACE_KINDS = {"int": 1, "bool": 2, "string": 3, "float": 4}  # 0 = no operand
+TRACE_UNSET = 5  # variable without value
+TRACE_UNDEFINED = 6  # undefined variable or missing frame
+TRACE_NAME = 7  # label or type
+TRACE_CLIPPED = 0x40  # flag of int which does not fit into 64 bits, the nearest 64-bit value is stored
+TRACE_STACK = 0x80  # flag of value from the top of data stack (stack instructions)
+
+# Frame of VarRef
+GF = 0
+LF = 1
+TF = 2
+
+
+class Program:
+    """
+    The class represents loaded program. Contains decoded instructions, labels and slot layouts of frames.
+
+    Frame is a plain list: slot 0 holds number of defined variables, other slots hold Variable (None = undefined).
+    Every variable name used with GF@ gets its slot in global frame, names used with LF@ or TF@ share one
+    layout of local frames (a frame is temporary first and local after PUSHFRAME). Program with more than
+    LOCAL_SLOTS local names has SparseFrame local frames instead, so a frame costs its defined variables
+    and not the whole layout.
+    """
+    def __init__(self):
+        self.code = []  # Instruction[] indexed by order-1
+        self.label = {}  # {string: int}
+        self.gf_names = []  # string[] indexed by slot-1
+        self.lf_names = []  # string[] indexed by slot-1
+        self.blocks = None  # Block[] indexed by index of first instruction, made by split_blocks()
+
+    def __reduce__(self):
+        """
+        Pickle program in columns (opcode ids, operand counts and all operands in one list) instead of one object
+        per instruction, it is much faster to store and load. Jump targets are resolved again when loaded.
+        # type: () -> tuple
+        """
+        code = self.code
+        ops = bytes(OPCODE_ID[ins.opcode] for ins in code)
+        counts = bytes(len(ins.args) for ins in code)
+        operands = [arg for ins in code for arg in ins.args]
+        invalid = {i: (ins.error, ins.kinds) for i, ins in enumerate(code) if ins.error is not None}
+        return restore_program, (ops, counts, operands, invalid, self.label, self.gf_names, self.lf_names)
 
 
 class Enviroment:
     """The class represents enviroment of process. Contains stacks and frame (variables storage)"""
-    def __init__(self):
-        self.gf = {}
+    def __init__(self, program, reader, writer, stderr=None, limits=None, checkpoint=None):
+        self.program = program
+        self.reader = reader  # Reader of program input
+        self.writer = writer  # Writer of program output
+        self.stderr = sys.stderr if stderr is None else stderr  # stream of DPRINT and BREAK
+        self.gf = [0] + [None] * len(program.gf_names)
         self.lf = None
         self.tf = None
-        self.stack = []
-        self.label = {}  # {string: int}
-        self.call = []  # int[]
+        self.pool = []  # released frames ready for reuse
+        # content of empty local frame, None = local frames are SparseFrame
+        self.blank = [0] + [None] * len(program.lf_names) if len(program.lf_names) <= LOCAL_SLOTS else None
+        # Data stack is kept as two parallel lists, so stack instructions do not allocate Variable objects
+        self.stack_types = []  # string[] type of value
+        self.stack_values = []
+        self.call = array("i")  # int[] return addresses
+        self.call_tail = {}  # {call depth: [skipped instructions, skipped POPFRAMEs]} left by tail calls
+        self.ip = 0  # index of next instruction
+        self.i_count = 0  # executed instructions
+        self.vars = 0  # defined variables in existing frames
+        self.v_count = 0  # maximal number of defined variables
+        self.frames = 1  # existing frames (global, temporary and local ones)
+        self.frame_peak = 1  # maximal number of existing frames
+        self.stack_peak = 0  # maximal depth of data stack
+        self.call_peak = 0  # maximal depth of call stack (tail calls do not grow it)
+        # Limits of stack, call stack and strings are checked when they grow (peaks are updated), sys.maxsize = off
+        self.limits = Limits() if limits is None else limits
+        self.max_stack = self.limits.stack or sys.maxsize
+        self.max_call = self.limits.call_depth or sys.maxsize
+        self.max_string = self.limits.string_len or sys.maxsize
+        self.deadline = time.monotonic() + self.limits.timeout if self.limits.timeout else None
+        self.checkpoint = checkpoint  # Checkpoint or None
+        self.quantum_end = None  # executed instructions after which the program yields to other sessions, None = never
+        self.check_at = next_check(self)  # executed instructions after which check_run is called
 
 
 class Variable:
     """The class used for storing any value. Contains value and it's type"""
+    __slots__ = ("type", "value")
+
     def __init__(self, datatype=None, value=None):
         self.type = datatype
         self.value = value
@@ -27,13 +207,462 @@ class Variable:
         return str(self.type)+"@"+str(self.value)
 
 
+class SparseFrame(dict):
+    """
+    Local frame of program with many local names: {slot: Variable} of defined variables and {0: number of them}.
+    Missing slot reads as None like undefined slot of list frame.
+    """
+    __slots__ = ()
+
+    def __missing__(self, slot):
+        return None
+
+
+class StringBuffer(Variable):
+    """
+    The class is Variable holding string which is edited in place by CONCAT appending to itself and by SETCHAR.
+
+    Characters are kept in list (None until the string is edited), plain string is built when value is read
+    and kept until the next edit, so the variable looks like any other Variable. Assigned value replaces both.
+    """
+    __slots__ = ("chars", "text")
+
+    def __init__(self, text):
+        self.type = "string"
+        self.chars = list(text)
+        self.text = text
+
+    @property
+    def value(self):
+        text = self.text
+        if text is None:
+            text = self.text = "".join(self.chars)
+        return text
+
+    @value.setter
+    def value(self, value):
+        self.text = value
+        self.chars = None
+
+    def edit(self):
+        """
+        Return list of characters to be edited, plain string is dropped.
+        # type: () -> list
+        """
+        chars = self.chars
+        if chars is None:
+            chars = self.chars = list(self.text)
+        self.text = None
+        return chars
+
+
 class Argument:
     """The class represents argX element. Contains value and it's type (eg. int, var, type...)"""
+    __slots__ = ("type", "value")
+
     def __init__(self, argtype, value):
         self.type = argtype
         self.value = value
 
 
+class VarRef:
+    """
+    The class represents decoded variable identificator. Contains frame (GF/LF/TF), name and origin string.
+    Slot of the variable in its frame is assigned after loading.
+    """
+    __slots__ = ("frame", "name", "text", "slot")
+
+    def __init__(self, frame, name, text):
+        self.frame = frame
+        self.name = name
+        self.text = text
+        self.slot = None
+
+
+class Instruction:
+    """
+    The class represents decoded instruction, so execution never touches XML again.
+
+    Operands are already decoded: "var" to VarRef, "symb" to VarRef or constant Variable, "label" to name
+    and "type" to name of type. Jump target (index of instruction following the LABEL) is resolved after loading.
+    Instruction which failed to decode has opcode "INVALID", keeps operands decoded before the failing one
+    and reports the error when (and only when) it is executed.
+    Superinstruction replaces the first of fused instructions, the others stay in program after it.
+    """
+    __slots__ = ("order", "opcode", "op", "args", "target", "error", "kinds", "pops", "fused", "hits", "unchecked")
+
+    def __init__(self, order, opcode, args, error=None):
+        self.order = order
+        self.opcode = opcode
+        self.op = OPCODE_ID[opcode]
+        self.args = args
+        self.target = None
+        self.error = error  # (errno, msg) or None
+        self.kinds = None  # operand kinds of INVALID instruction
+        self.pops = 0  # POPFRAME instructions skipped by TAILCALL
+        self.fused = None  # Instruction[] replaced by superinstruction
+        self.hits = 0  # executions of superinstruction
+        self.unchecked = None  # operands of UNCHECKED handler
+
+
+class Block:
+    """
+    The class represents basic block: instructions executed one after another, only the last one may jump.
+
+    Instructions fused into superinstruction are not in the block, only the superinstruction is. Length is
+    the number of dispatched instructions, it is added to executed instructions after the whole block.
+    """
+    __slots__ = ("start", "body", "last", "length", "next")
+
+    def __init__(self, code):
+        self.start = code[0].order - 1  # index of the first instruction
+        self.body = code[:-1]  # Instruction[] all but the last one
+        self.last = code[-1]
+        self.length = len(code)
+        self.next = None  # Block following the last instruction or None at the end of program
+
+
+class Reader:
+    """
+    The class reads lines of program input in large blocks.
+
+    Lines are split the same way as input() does it on standard input: only LF ends line (CR is kept),
+    last line does not need to be terminated. Function flush is called before reading may block. Block which
+    cannot be decoded is decoded with surrogateescape, so invalid line does not lose the lines read with it.
+    """
+    def __init__(self, read, encoding, errors="strict", flush=None):
+        self.read = read  # function(size) -> bytes, empty at the end of input
+        self.encoding = encoding
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors)
+        self.flush = flush
+        self.lines = []  # complete lines of the last block
+        self.index = 0  # index of next line in lines
+        self.rest = []  # parts of unterminated line
+        self.eof = False
+        self.count = 0  # lines returned, position of input in checkpoint
+
+    def readline(self):
+        """
+        Return next line without line terminator, None at the end of input.
+        # type: () -> str|None
+        """
+        while self.index == len(self.lines):
+            if self.eof:
+                if not self.rest:
+                    return None
+                line = "".join(self.rest)
+                self.rest = []
+                self.count += 1
+                return line
+            if self.flush is not None:
+                self.flush()
+            block = self.read(BLOCK_SIZE)
+            self.eof = not block
+            try:
+                text = self.decoder.decode(block, self.eof)
+            except UnicodeDecodeError:
+                text = self.escape(block)
+            if "\n" not in text:
+                if text:
+                    self.rest.append(text)
+                continue
+            self.rest.append(text)
+            self.lines = "".join(self.rest).split("\n")
+            self.rest = [self.lines.pop()]
+            self.index = 0
+        line = self.lines[self.index]
+        self.index += 1
+        self.count += 1
+        return line
+
+    def escape(self, block):
+        """
+        Decode block with surrogateescape (as standard input is decoded in C locale), continue after the bytes
+        of incomplete character left by the previous block.
+        # type: (bytes) -> str
+        """
+        decoder = codecs.getincrementaldecoder(self.encoding)("surrogateescape")
+        decoder.setstate(self.decoder.getstate())
+        text = decoder.decode(block, self.eof)
+        self.decoder.setstate(decoder.getstate())
+        return text
+
+
+class Writer:
+    """
+    The class collects program output and writes it to stream in large blocks.
+
+    Output is written when more than limit characters are collected and by flush(), limit 0 writes every part
+    immediately.
+    """
+    def __init__(self, stream, limit=BUFFER_SIZE):
+        self.stream = stream
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        """
+        Append text to output.
+        # type: (str) -> None
+        """
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size > self.limit:
+            self.flush()
+
+    def flush(self):
+        """
+        Write collected output to stream.
+        # type: () -> None
+        """
+        if self.parts:
+            parts = self.parts
+            self.parts = []
+            self.size = 0
+            try:
+                self.stream.write("".join(parts))
+            except UnicodeEncodeError:
+                for part in parts:  # write output preceding the part which cannot be encoded, as print() did
+                    self.stream.write(part)
+        self.stream.flush()
+
+
+class Profile:
+    """
+    The class collects number of executions and wall time of every instruction and counts of taken backward
+    jumps (loop iterations) for --profile.
+    """
+    def __init__(self, size):
+        self.counts = [0] * size  # int[] executions indexed by order-1
+        self.times = [0.0] * size  # float[] seconds indexed by order-1
+        self.back = {}  # {index of jump: taken backward jumps}
+
+
+class Trace:
+    """
+    The class keeps the last size executed instructions for --trace in ring buffer, instruction is recorded
+    with its operands before it is executed.
+
+    Record is four items of list: index of instruction and value of every variable operand (type is given
+    by class of value), free operands of stack instructions get values from the top of data stack. Constant
+    operands are taken from the program and records are packed to TRACE_RECORDs only when the trace is written.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.records = [0, None, None, None] * size  # value of operand is None (unset) or (kind, value) of record
+        self.count = 0  # recorded instructions, the next record goes to index count % size
+        self.code = None  # Instruction[] of traced program
+
+
+class Samples:
+    """
+    The class collects call stacks sampled every interval instructions for --samples.
+
+    Call stacks are kept as a tree of calling contexts (node = parent node and called label), so a sample costs
+    the same at any call depth. Calls deeper than MAX_SAMPLE_DEPTH stay in the deepest context. Counts of labels
+    (exclusive = label is on top of call stack, inclusive = label is anywhere in it) are collected with samples.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.nodes = {(None, "<main>"): 0}  # {(parent node, label): node}
+        self.parent = [None]  # int[] indexed by node
+        self.label = ["<main>"]  # string[] indexed by node
+        self.counts = {}  # {node: samples}
+        self.path = [0]  # int[] node of every call depth
+        self.names = ["<main>"]  # string[] label of every call depth
+        self.active = {"<main>": 1}  # {label: occurrences in call stack}
+        self.exclusive = {}  # {label: samples}
+        self.inclusive = {}  # {label: samples}
+
+    def enter(self, name):
+        """
+        Record call of label name.
+        # type: (str) -> None
+        """
+        node = self.path[-1]
+        if len(self.path) < MAX_SAMPLE_DEPTH:
+            key = (node, name)
+            node = self.nodes.get(key)
+            if node is None:
+                node = self.nodes[key] = len(self.parent)
+                self.parent.append(key[0])
+                self.label.append(name)
+        self.path.append(node)
+        self.names.append(name)
+        self.active[name] = self.active.get(name, 0) + 1
+
+    def leave(self):
+        """
+        Record return from the last called label.
+        # type: () -> None
+        """
+        self.path.pop()
+        name = self.names.pop()
+        if self.active[name] == 1:
+            del self.active[name]
+        else:
+            self.active[name] -= 1
+
+    def sample(self):
+        """
+        Record current call stack.
+        # type: () -> None
+        """
+        node = self.path[-1]
+        self.counts[node] = self.counts.get(node, 0) + 1
+        name = self.names[-1]
+        self.exclusive[name] = self.exclusive.get(name, 0) + 1
+        inclusive = self.inclusive
+        for name in self.active:  # recursive label is counted once
+            inclusive[name] = inclusive.get(name, 0) + 1
+
+
+class Limits:
+    """
+    The class represents resource limits of one run, 0 = unlimited. Executed instructions and time are checked
+    after basic blocks (time every LIMIT_INTERVAL instructions), the others when they grow.
+    """
+    def __init__(self, insts=0, stack=0, call_depth=0, string_len=0, timeout=0.0):
+        self.insts = insts  # executed instructions
+        self.stack = stack  # depth of data stack
+        self.call_depth = call_depth  # depth of call stack
+        self.string_len = string_len  # length of string made by CONCAT
+        self.timeout = timeout  # seconds of run
+
+
+class Checkpoint:
+    """
+    The class represents checkpoints of run: file, interval in executed instructions (0 = only when stopped)
+    and digest of program source, which is checked on resume. Setting stop (from SIGTERM handler) saves
+    the state at the next check and stops the program.
+    """
+    def __init__(self, path, interval=0, digest=""):
+        self.path = path
+        self.interval = interval
+        self.digest = digest
+        self.stop = False
+        self.due = interval  # executed instructions at which the next checkpoint is written
+        self.pid = None  # process writing the last checkpoint
+
+
+class InterpretError(Exception):
+    """
+    The exception reports error found in program. Contains return code, message and order of instruction
+    (None when the error does not belong to any instruction). Every return code has its own subclass.
+    """
+    errno = 1
+
+    def __init__(self, msg, order=None):
+        super().__init__(msg if order is None else msg + ", instrukce " + str(order))
+        self.msg = msg
+        self.order = order
+
+
+class InputFileError(InterpretError):
+    """Input file cannot be read or output file cannot be written"""
+    errno = 11
+
+
+class XMLFormatError(InterpretError):
+    """Input file is not valid XML or its structure is not valid"""
+    errno = 31
+
+
+class LexicalError(InterpretError):
+    """Lexical or syntax error of instruction"""
+    errno = 32
+
+
+class SemanticError(InterpretError):
+    """Semantic error, e.g. jump to undefined label"""
+    errno = 52
+
+
+class OperandTypeError(InterpretError):
+    """Wrong type of operand"""
+    errno = 53
+
+
+class UndefinedVariableError(InterpretError):
+    """Access to variable which does not exist (frame exists)"""
+    errno = 54
+
+
+class MissingFrameError(InterpretError):
+    """Frame does not exist"""
+    errno = 55
+
+
+class MissingValueError(InterpretError):
+    """Missing value in variable or on stack"""
+    errno = 56
+
+
+class DivisionByZeroError(InterpretError):
+    """Division by zero"""
+    errno = 57
+
+
+class StringOperationError(InterpretError):
+    """Wrong work with string"""
+    errno = 58
+
+
+class RedefinitionError(InterpretError):
+    """Redefinition of variable"""
+    errno = 59
+
+
+class LimitError(InterpretError):
+    """Resource limit of run exceeded, every limit has its own subclass"""
+
+
+class InstructionLimitError(LimitError):
+    """Too many executed instructions"""
+    errno = 60
+
+
+class StackLimitError(LimitError):
+    """Data stack too deep"""
+    errno = 61
+
+
+class CallLimitError(LimitError):
+    """Call stack too deep"""
+    errno = 62
+
+
+class StringLimitError(LimitError):
+    """String too long"""
+    errno = 63
+
+
+class TimeLimitError(LimitError):
+    """Run takes too long"""
+    errno = 64
+
+
+class StoppedError(InterpretError):
+    """Program was stopped and its state was saved to checkpoint"""
+    errno = 65
+
+
+class Preempted(Exception):
+    """
+    The exception is not an error, it leaves execute() when session has to yield to other sessions (its quantum
+    of instructions is used or READ waits for input). Enviroment.ip is the instruction executed after it resumes.
+    """
+
+
+# Subclass of InterpretError by return code
+ERROR_TYPES = {cls.errno: cls for cls in (InputFileError, XMLFormatError, LexicalError, SemanticError,
+                                          OperandTypeError, UndefinedVariableError, MissingFrameError,
+                                          MissingValueError, DivisionByZeroError, StringOperationError,
+                                          RedefinitionError, InstructionLimitError, StackLimitError, CallLimitError,
+                                          StringLimitError, TimeLimitError, StoppedError)}
+
+
 def help_print():
     """
     Print description, usage and return codes of this script.
@@ -42,9 +671,107 @@ def help_print():
     print("Nacte a interpretuje XML reprezentaci programu ze souboru.\n"
           "\n"
           "Pouziti:\n"
-          "./interpret.py --source=<file> [--help]\n"
+          "./interpret.py --source=<file> [--input=<file>] [--buffer=<size>] [--cache-dir=<dir>] [--no-cache]\n"
+          "              [--no-peephole] [--no-tail-calls] [--fusions=<file>] [--compile] [--profile=<file>]\n"
+          "              [--samples=<file>] [--sample-labels=<file>] [--sample-interval=<n>] [--connect=<socket>]\n"
+          "              [--check] [--stats=<file> [--insts] [--vars] [--stack-depth] [--call-depth] [--frames]]\n"
+          "              [--max-insts=<n>] [--max-stack=<n>] [--max-call-depth=<n>] [--max-string-len=<n>]\n"
+          "              [--timeout=<s>] [--checkpoint=<file> [--checkpoint-interval=<n>]] [--resume=<file>]\n"
+          "              [--trace=<file> [--trace-size=<n>]] [--help]\n"
+          "./interpret.py --source=<file> --inputs=<dir> --outputs=<dir> [--workers=<n>] [--cache-dir=<dir>]\n"
+          "              [--no-cache] [--no-peephole] [--no-tail-calls] [--compile] [--max-*=<n>] [--timeout=<s>]\n"
+          "./interpret.py --source=<file> --sessions=<socket> [--quantum=<n>] [--backlog=<n>] [--cache-dir=<dir>]\n"
+          "              [--no-cache] [--no-peephole] [--no-tail-calls] [--max-*=<n>] [--timeout=<s>]\n"
+          "./interpret.py --serve=<socket> [--workers=<n>] [--backlog=<n>] [--cache-dir=<dir>] [--no-cache]\n"
+          "              [--no-peephole] [--no-tail-calls] [--compile] [--max-insts=<n>] [--max-stack=<n>]\n"
+          "              [--max-call-depth=<n>] [--max-string-len=<n>] [--timeout=<s>]\n"
           "  --source=<file>\n"
           "    vstupni soubor s XML reprezentaci zdrojoveho kodu\n"
+          "  --input=<file>\n"
+          "    soubor se vstupem interpretovaneho programu, jinak standardni vstup\n"
+          "  --buffer=<size>\n"
+          "    pocet znaku vystupu drzenych v bufferu, 0 = vypsat kazdy radek ihned\n"
+          "  --cache-dir=<dir>\n"
+          "    adresar pro prelozene programy, vychozi hodnota z promenne prostredi IPP_CACHE_DIR; programy jsou\n"
+          "    ulozeny modulem pickle a jejich nacteni spusti libovolny kod, proto se adresar ani soubor nepouzije,\n"
+          "    pokud nepatri uzivateli (nebo rootovi) nebo do nej muze zapisovat skupina ci ostatni, novy adresar\n"
+          "    ma prava 0700\n"
+          "  --no-cache\n"
+          "    program se vzdy nacte ze zdrojoveho souboru\n"
+          "  --no-peephole\n"
+          "    nespojuje caste sekvence instrukci do superinstrukci a nevynechava kontroly typu operandu,\n"
+          "    ktere jsou dokazany pri nacteni programu\n"
+          "  --no-tail-calls\n"
+          "    CALL na konci funkce (nasledovany RETURN nebo POPFRAME a RETURN) uklada navratovou adresu\n"
+          "  --fusions=<file>\n"
+          "    zapise do souboru, ktere sekvence instrukci byly spojeny a kolikrat se vykonaly\n"
+          "  --compile\n"
+          "    casto vykonavane useky programu prelozi do Pythonu\n"
+          "  --profile=<file>\n"
+          "    zapise do souboru JSON pocet provedeni a cas kazdeho opcode, instrukce a smycky,\n"
+          "    program se pritom vykonava bez optimalizaci\n"
+          "  --samples=<file>\n"
+          "    kazdych n instrukci zaznamena zasobnik volani, do souboru zapise pocty instrukci\n"
+          "    ve formatu folded stacks pro nastroje flamegraph, program se vykonava bez optimalizaci\n"
+          "  --sample-labels=<file>\n"
+          "    zapise do souboru pocty instrukci vykonanych v kazde funkci (navesti) a v jejich volanich\n"
+          "  --sample-interval=<n>\n"
+          "    pocet instrukci mezi vzorky, vychozi hodnota 100\n"
+          "  --trace=<file>\n"
+          "    uchovava v pameti posledni vykonane instrukce s hodnotami operandu, pri chybe nebo po signalu\n"
+          "    SIGUSR1 je zapise binarne do souboru (vypise je decode_trace.py), program se vykonava bez optimalizaci\n"
+          "  --trace-size=<n>\n"
+          "    pocet uchovavanych instrukci, vychozi hodnota " + str(TRACE_SIZE) + "\n"
+          "  --check\n"
+          "    program nevykona, jen vypise instrukce, ktere vzdy skonci chybou 53, 54 nebo 56 (podle odvozenych\n"
+          "    typu promennych globalniho ramce), a skonci navratovym kodem prvni z nich\n"
+          "  --stats=<file>\n"
+          "    zapise do souboru statistiky v poradi parametru, ktere je vybiraji, kazdou na jeden radek:\n"
+          "    --insts pocet vykonanych instrukci, --vars nejvyssi pocet definovanych promennych,\n"
+          "    --stack-depth nejvetsi hloubka datoveho zasobniku, --call-depth nejvetsi hloubka zasobniku volani\n"
+          "    (volani na konci funkce ho nezvetsuji), --frames nejvyssi pocet existujicich ramcu\n"
+          "  --max-insts=<n>\n"
+          "    ukonci program, ktery vykona vice nez n instrukci (kontroluje se po kazdem useku bez skoku)\n"
+          "  --max-stack=<n>\n"
+          "    ukonci program, jehoz datovy zasobnik ma vice nez n hodnot\n"
+          "  --max-call-depth=<n>\n"
+          "    ukonci program, jehoz zasobnik volani ma vice nez n adres\n"
+          "  --max-string-len=<n>\n"
+          "    ukonci program, ktery instrukci CONCAT vytvori retezec delsi nez n znaku\n"
+          "  --timeout=<s>\n"
+          "    ukonci program, ktery bezi dele nez s sekund (kontroluje se kazdych " + str(LIMIT_INTERVAL) +
+          " instrukci)\n"
+          "    pri prekroceni limitu se zapisi statistiky --stats\n"
+          "  --checkpoint=<file>\n"
+          "    po signalu SIGTERM ulozi stav programu do souboru a skonci\n"
+          "  --checkpoint-interval=<n>\n"
+          "    stav programu uklada i kazdych n vykonanych instrukci (zapisuje ho na pozadi)\n"
+          "  --resume=<file>\n"
+          "    pokracuje ve vykonavani programu ze stavu ulozeneho v souboru, vstup musi byt stejny\n"
+          "    jako pri ulozeni (jiz prectene radky se preskoci), vystup navazuje na vystup do ulozeni\n"
+          "  --connect=<socket>\n"
+          "    program vykona server naslouchajici na socketu, vstup programu se nacte cely predem\n"
+          "  --inputs=<dir>\n"
+          "    program nacte jednou a vykona ho se vstupem z kazdeho souboru adresare, nejvyse --workers\n"
+          "    vstupu najednou, kazdy ve vlastnim procesu\n"
+          "  --outputs=<dir>\n"
+          "    adresar pro vystup (.out) a chybovy vystup (.err) kazdeho vstupu (pripona .in se nahradi,\n"
+          "    vstupy <name> a <name>.in zaroven skonci chybou 11)\n"
+          "    a pro manifest.json s navratovymi kody, statistikami a casy vsech vstupu\n"
+          "  --sessions=<socket>\n"
+          "    vykonava program pro kazde spojeni na Unix socket v jednom procesu, spojeni je vstupem i vystupem\n"
+          "    programu, po skonceni kazdeho spojeni vypise na standardni vystup radek JSON s navratovym kodem,\n"
+          "    chybovym vystupem, statistikami a casem\n"
+          "  --quantum=<n>\n"
+          "    pocet instrukci, po kterych program --sessions prenecha beh ostatnim (take kdyz ceka na vstup),\n"
+          "    vychozi hodnota " + str(QUANTUM) + "\n"
+          "  --serve=<socket>\n"
+          "    spusti server, ktery vykonava programy klientu pripojenych na Unix socket\n"
+          "  --workers=<n>\n"
+          "    pocet procesu serveru ci --inputs (a soucasne vykonavanych programu), vychozi hodnota je pocet\n"
+          "    procesoru\n"
+          "  --backlog=<n>\n"
+          "    pocet spojeni cekajicich na volny proces serveru ci na prijeti --sessions, vychozi hodnota 128\n"
           "  --help\n"
           "    vypise na standardni vystup napovedu\n"
           "\n"
@@ -61,738 +788,3646 @@ def help_print():
           "  57   behová chyba interpretace – deleni nulou"
           "  58   behová chyba interpretace – chybna prace s retezcem"
           "  59   behová chyba interpretace – pokus o redefinovani promenne"
+          "  60   prekrocen limit poctu vykonanych instrukci (--max-insts)"
+          "  61   prekrocen limit hloubky datoveho zasobniku (--max-stack)"
+          "  62   prekrocen limit hloubky zasobniku volani (--max-call-depth)"
+          "  63   prekrocen limit delky retezce (--max-string-len)"
+          "  64   prekrocen casovy limit (--timeout)"
+          "  65   program zastaven signalem SIGTERM, stav ulozen (--checkpoint)"
           )
 
 
 def error(order, errno, msg):
     """
-    Print error message to stderr with number of line and exit program with specified return code.
+    Raise InterpretError of specified return code with message and order of instruction.
     # type: (int, int, str) -> None
     """
-    sys.stderr.write(msg + ", instrukce " + str(order) + "\n")
-    sys.exit(errno)
-
-
-def load_xml(filepath):
-    """
-    Get root "program" element from specified file, exit program if error occurs.
-    # type: (str) -> etree.Element
-    """
-    try:
-        tree = etree.parse(filepath)
-    except FileNotFoundError:
-        sys.stderr.write('Soubor "' + filepath + '" neexistuje\n')
-        sys.exit(11)
-    except etree.ParseError as err:
-        sys.stderr.write('Soubor "' + filepath + '" neobsahuje platny XML soubor\n' + err.msg + "\n")
-        sys.exit(31)
+    raise ERROR_TYPES[errno](msg, order)
 
-    root = tree.getroot()
-    if root.tag != "program" or root.get("language") != "IPPcode18":
-        sys.stderr.write('Chybi korenovy element "program" s atributem "language=IPPcode18"\n')
-        sys.exit(31)
-    return root
 
-
-def parse_args(child, order, argc):
+def parse_args(child, argc):
     """
     Get array of Argument from instruction xml element.
-    Also check number of arguments and exit program when element is not valid.
-    # type: (etree.Element, int, int) -> list
+    Also check number of arguments and raise InterpretError when element is not valid.
+    # type: (etree.Element, int) -> list
     """
     if len(child) != argc:
-        sys.stderr.write('Instrukce ' + str(order) + ' ocekava ' + str(argc) + ' argument(y), predano: ' + str(len(child)) + "\n")
-        sys.exit(32)
+        raise LexicalError('Instrukce ocekava ' + str(argc) + ' argument(y), predano: ' + str(len(child)))
 
     arg = []
     for i in range(1, argc+1):
         arg_tag = child.find("arg" + str(i))
         if arg_tag is None:
-            error(order, 31, 'Instrukce neobsahuje tag "arg' + str(i) + '"')
+            raise XMLFormatError('Instrukce neobsahuje tag "arg' + str(i) + '"')
         if arg_tag.get("type") is None:
-            error(order, 32, 'Argumentu ' + child[i-1].tag + ' chybi atribut "type"')
+            raise LexicalError('Argumentu ' + child[i-1].tag + ' chybi atribut "type"')
         arg.append(Argument(arg_tag.get("type"), arg_tag.text))
 
     return arg
 
 
-def parse_type(order, arg):
+def parse_type(arg):
     """
     Check whether Argument is valid type name.
 
-    Return name of type if valid, otherwise exit program.
-    # type: (int, Argument) -> str
+    Return name of type if valid, otherwise raise InterpretError.
+    # type: (Argument) -> str
     """
     if arg.type != "type":
-        error(order, 53, 'Ocekavan argument typu "type", uveden: "' + arg.type + '"')
+        raise OperandTypeError('Ocekavan argument typu "type", uveden: "' + arg.type + '"')
     if arg.value not in ["int", "string", "bool", "float"]:
-        error(order, 53, 'Argument "' + arg.value + '" typu "type" nesplnuje pozadovany tvar')
+        raise OperandTypeError('Argument "' + str(arg.value) + '" typu "type" nesplnuje pozadovany tvar')
     return arg.value
 
 
-def parse_label(order, arg):
+def parse_label(arg):
     """
     Check whether Argument is valid label name.
 
-    Return name of label if valid, otherwise exit program.
-    # type: (int, Argument) -> str
+    Return name of label if valid, otherwise raise InterpretError.
+    # type: (Argument) -> str
     """
     if arg.type != "label":
-        error(order, 53, 'Ocekavan argument typu "label", uveden: "' + arg.type + '"')
-    if arg.value is None or re.fullmatch("[a-zA-Z_\-$&%*][\w_\-$&%*]*", arg.value) is None:
-        error(order, 53, 'Argument "' + str(arg.value) + '" typu "label" nesplnuje pozadovany tvar')
+        raise OperandTypeError('Ocekavan argument typu "label", uveden: "' + arg.type + '"')
+    if arg.value is None or LABEL_RE.fullmatch(arg.value) is None:
+        raise OperandTypeError('Argument "' + str(arg.value) + '" typu "label" nesplnuje pozadovany tvar')
     return arg.value
 
 
-def parse_var(order, arg):
+def parse_var(arg):
     """
     Check whether Argument is valid variable identificator.
 
-    Return variable identificator splitted into parts if valid, otherwise exit program.
-    [0]=origin string, [1]=scope (LF/TF/GF), [2]=variable name
-    # type: (int, Argument) -> list
+    Return VarRef if valid, otherwise raise InterpretError.
+    # type: (Argument) -> VarRef
     """
     if arg.type != "var":
-        error(order, 53, 'Ocekavan argument typu "var", uveden: "' + arg.type + '"')
+        raise OperandTypeError('Ocekavan argument typu "var", uveden: "' + arg.type + '"')
+    match = None
     if arg.value is not None:
-        match = re.fullmatch("(LF|TF|GF)@([a-zA-Z_\-$&%*][\w_\-$&%*]*)", arg.value)
-    if arg.value is None or match is None:
-        error(order, 53, 'Argument "' + str(arg.value) + '" typu "var" nesplnuje pozadovany tvar')
-    return match
-
-
-def get_var(enviroment, order, match, write=False):
-    """
-    Get link to existing Variable from parsed variable identification gain from parse_var function.
-
-    If trying to write into undefined variable or define already defined variable, exit program.
-    # type: (Enviroment, int, list, bool) -> Variable
-    """
-    var = None
-    if match[1] == "GF":
-        var = enviroment.gf.get(match[2])
-    elif match[1] == "TF":
-        if enviroment.tf is None:
-            error(order, 55, "Docasny ramec neni definovan")  # exit(55)
-        var = enviroment.tf.get(match[2])
-    elif match[1] == "LF":
-        if enviroment.lf is None:
-            error(order, 55, "Lokalni ramec neni nedefinovan")  # exit(55)
-        var = enviroment.lf[-1].get(match[2])
-    if var is not None and write:
-        error(ip, 59, 'Pokus o redefinovani promenne "' + match[0])  # exit(59)
-    if var is None and not write:
-        error(ip, 54, 'Pristup k neexistujici promenne "' + match[0] + '"')  # exit(54)
-    return var
+        match = VAR_RE.fullmatch(arg.value)
+    if match is None:
+        raise OperandTypeError('Argument "' + str(arg.value) + '" typu "var" nesplnuje pozadovany tvar')
+    return VarRef(("GF", "LF", "TF").index(match.group(1)), match.group(2), arg.value)
 
 
-def get_symb(enviroment, order, arg, undefined=False):
+def parse_symb(arg):
     """
-    Parse and Get new virtual Variable object from Argument.
+    Decode Argument of kind symb. Literals are converted into constant Variable, variables into VarRef.
 
-    # type: (Enviroment, int, Argument, bool) -> Variable
+    Raise InterpretError when literal does not match its type.
+    # type: (Argument) -> Variable|VarRef
     """
-    var = Variable(arg.type)
     if arg.type == "int":
         try:
-            var.value = int(arg.value)
+            return Variable("int", int(arg.value))
         except (ValueError, TypeError):
-            error(order, 53, 'Hodnota "' + str(arg.value) + '" neni typu int')  # exit(55)
+            raise OperandTypeError('Hodnota "' + str(arg.value) + '" neni typu int')
     elif arg.type == "bool":
         if arg.value == "true":
-            var.value = True
+            return Variable("bool", True)
         elif arg.value == "false":
-            var.value = False
-        else:
-            error(order, 53, 'Hodnota "' + str(arg.value) + '" neni typu bool')  # exit(55)
+            return Variable("bool", False)
+        raise OperandTypeError('Hodnota "' + str(arg.value) + '" neni typu bool')
     elif arg.type == "string":
         if arg.value is None:
-            var.value = ""
-        else:
-            if re.fullmatch("([^\s#\\\\]|\\\\\d{3})+", arg.value) is None:
-                error(order, 53, 'Argument "' + arg.value + '" typu "string" nesplnuje pozadovany tvar')
-            occurences = re.findall("\\\\\d{3}", arg.value)
-            for repl in occurences:
-                try:
-                    arg.value = arg.value.replace(repl, chr(int(repl[1:])), 1)
-                except ValueError:
-                    error(ip, 58, "Escape hodnota v retezci neodpovida kodu Unicode")  # exit(58)
-            var.value = arg.value
+            return Variable("string", "")
+        if STRING_RE.fullmatch(arg.value) is None:
+            raise OperandTypeError('Argument "' + arg.value + '" typu "string" nesplnuje pozadovany tvar')
+        return Variable("string", ESCAPE_RE.sub(lambda esc: chr(int(esc.group(1))), arg.value))
     elif arg.type == "float":
         try:
-            var.value = float.fromhex(arg.value)
+            return Variable("float", float.fromhex(arg.value))
         except (ValueError, TypeError):
-            error(order, 53, 'Hodnota "' + str(arg.value) + '" neni typu float')  # exit(55)
+            raise OperandTypeError('Hodnota "' + str(arg.value) + '" neni typu float')
     elif arg.type == "var":
-        match = parse_var(order, arg)
-        var = get_var(enviroment, order, match)
-        if var.type is None or var.value is None:
-            if undefined:
-                return None
-            error(order, 56, 'Promenne "' + arg.value + '" nebyla dosud prirazena hodnota')  # exit(56)
-    else:
-        error(order, 53, 'Ocekavan argument typu int/bool/string/float nebo var, uveden: "' + arg.type + '"')
-    return var
+        return parse_var(arg)
+    raise OperandTypeError('Ocekavan argument typu int/bool/string/float nebo var, uveden: "' + arg.type + '"')
 
 
-def write_stats(statpath, stati, i_count, v_count):
+def decode_instruction(child, order, operands):
     """
-    Write statistics if statpath is set according to STATI arguments.
-    # type: (str, list, int, int) -> None
-    """
-    if statpath != "":
-        try:
-            with open(statpath, 'w') as file:
-                for st in stati:
-                    if st == "insts":
-                        file.write(str(i_count) + "\n")
-                    else:
-                        file.write(str(v_count) + "\n")
-        except (PermissionError, FileNotFoundError):
-            sys.stderr.write('Chyba pri otevirani souboru "' + statpath + ' pro zapis statistik"\n')
-            sys.exit(11)
+    Decode instruction xml element into Instruction.
 
+    Equal operands are decoded once and shared through operands dictionary, they are never modified.
+    Errors are not reported here, instruction becomes INVALID and reports the error when executed.
+    # type: (etree.Element, int, dict) -> Instruction
+    """
+    opcode = child.get("opcode").upper()
+    kinds = SIGNATURES.get(opcode, ())
+    if opcode not in SIGNATURES:
+        ins = Instruction(order, "INVALID", [], (32, 'Neznama instrukce: "' + opcode + '"'))
+        ins.kinds = ()
+        return ins
+    if kinds is None:
+        return Instruction(order, opcode, [])  # Arguments of STACK instructions are ignored
 
-if __name__ == "__main__":
-    # Parse CLI arguments
+    decoded = []
     try:
-        (opts, args) = getopt.getopt(sys.argv[1:], "hs:", ["help", "source=", "stats=", "insts", "vars"])
-    except getopt.GetoptError as err:
-        if err.opt != "":
-            sys.stderr.write("Nespravne pouziti parametru: " + err.opt + "\n")
-            help_print()
-        sys.exit(10)
+        args = parse_args(child, len(kinds))  # exit(31/32)
+        for kind, arg in zip(kinds, args):
+            key = (kind, arg.type, arg.value)
+            operand = operands.get(key)
+            if operand is None:
+                if kind == "var":
+                    operand = parse_var(arg)
+                elif kind == "symb":
+                    operand = parse_symb(arg)
+                elif kind == "label":
+                    operand = parse_label(arg)
+                else:
+                    operand = parse_type(arg)
+                operands[key] = operand
+            decoded.append(operand)
+    except InterpretError as err:
+        ins = Instruction(order, "INVALID", decoded, (err.errno, err.msg))
+        ins.kinds = kinds[:len(decoded)]
+        return ins
+    return Instruction(order, opcode, decoded)
 
-    filepath = ""
-    statpath = ""
-    stati = []
 
-    for option, value in opts:
-        if option in ("-h", "--help"):
-            help_print()
-            sys.exit(0)
-        elif option in ("-s", "--source"):
-            filepath = value
-        elif option == "--stats":
-            statpath = value
-        elif option == "--insts":
-            if len(stati) != 0 and stati[0] == "insts":
-                sys.stderr.write("Argument 'insts' byl pouzit dvakrat.\n")
-                help_print()
-                sys.exit(10)
-            stati.append("insts")
-        elif option == "--vars":
-            if len(stati) != 0 and stati[0] == "vars":
-                sys.stderr.write("Argument 'vars' byl pouzit dvakrat.\n")
-                help_print()
-                sys.exit(10)
-            stati.append("vars")
-        else:
-            sys.stderr.write("Neznamy parametr: " + option + "\n")
-            help_print()
-            sys.exit(10)
+def check_instruction(child, ip, instructions):
+    """
+    Check attributes of ip-th child element of program.
 
-    if len(stati) > 0 and statpath == "":
-        sys.stderr.write("Parametry --insts ci --vars musi byt pouzity spolu se --stats\n")
-        help_print()
-        sys.exit(10)
+    Return order of the instruction, raise InterpretError when structure is not valid.
+    # type: (etree.Element, int, dict) -> int
+    """
+    if child.tag != "instruction":
+        raise XMLFormatError('Ocekavan element "instruction", nalezen "' + child.tag + '"')
 
-    if filepath == "":
-        sys.stderr.write("Chyby povinny parametr: --source=<file>\n")
-        help_print()
-        sys.exit(10)
+    if child.get("order") is None:
+        raise XMLFormatError(str(ip) + '. element "instruction" neobsahuje atribut order')
 
-    # Load and parse XML
-    root = load_xml(filepath)
+    try:
+        order = int(child.get("order"))
+        if order <= 0:
+            raise ValueError
+    except ValueError:
+        raise XMLFormatError('Atribut order musi obsahovat cele cislo, predano: "' + child.get("order") + '"')
+    if order in instructions:
+        raise XMLFormatError("Program obsahuje dve instrukce s poradim " + str(order))
 
-    # Check for syntax errors and find index of all LABELs, order instructions
-    enviroment = Enviroment()
-    instructions = {}
-    i_count = 0
-    ip = 1
-    while ip < len(root)+1:
-        child = root[ip-1]
+    if child.get("opcode") is None:
+        raise XMLFormatError(str(ip) + '. element "instruction" neobsahuje atribut opcode')
+    return order
 
-        if child.tag != "instruction":
-            sys.stderr.write('Ocekavan element "instruction", nalezen "' + child.tag + '"\n')
-            sys.exit(31)
 
-        if child.get("order") is None:
-            sys.stderr.write(str(ip) + '. element "instruction" neobsahuje atribut order\n')
-            sys.exit(31)
+def load_program(filepath):
+    """
+    Read program from specified file, check its structure, decode all instructions, resolve jump targets
+    and variable slots.
 
-        try:
-            order = int(child.get("order"))
-            if order <= 0:
-                raise ValueError
-        except ValueError:
-            sys.stderr.write('Atribut order musi obsahovat cele cislo, predano: "' + child.get("order") + '"\n')
-            sys.exit(31)
-        if order in instructions:
-            sys.stderr.write("Program obsahuje dve instrukce s poradim " + str(order) + "\n")
-            sys.exit(31)
-        instructions[order] = child
-
-        if child.get("opcode").upper() == "LABEL":
-            args = parse_args(child, ip, 1)  # exit(32)
-            label = parse_label(ip, args[0])
-            if label in enviroment.label:
-                error(ip, 56, 'Pokus o redefinovani navesti "' + label + '"')  # exit(56)
-            enviroment.label[label] = ip
-        ip += 1
+    The file is parsed as a stream, every instruction element is decoded and dropped as soon as it is complete,
+    so only decoded program is kept in memory. First error in structure is reported after the rest of file
+    is parsed, so file which is not valid XML is reported the same way as before.
+    Program can be read also from binary file object. Return Program, raise InterpretError if file
+    or structure is not valid.
+    # type: (str|BinaryIO) -> Program
+    """
+    program = Program()
+    instructions = {}
+    operands = {}
+    failure = None  # first InterpretError in structure
+    name = filepath if isinstance(filepath, str) else str(getattr(filepath, "name", "<stream>"))
+    depth = 0
+    root = None
+    ip = 0
+    try:
+        for event, elem in etree.iterparse(filepath, ("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = elem
+                    if root.tag != "program" or root.get("language") != "IPPcode18":
+                        failure = XMLFormatError('Chybi korenovy element "program" s atributem "language=IPPcode18"')
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+
+            ip += 1
+            if failure is None:
+                try:
+                    order = check_instruction(elem, ip, instructions)
+                except InterpretError as err:
+                    failure = err
+                else:
+                    ins = decode_instruction(elem, order, operands)
+                    instructions[order] = ins
+                    if elem.get("opcode").upper() == "LABEL":
+                        if ins.error is not None:
+                            failure = ERROR_TYPES[ins.error[0]](ins.error[1], order)
+                        elif ins.args[0] in program.label:
+                            failure = MissingValueError('Pokus o redefinovani navesti "' + ins.args[0] + '"', order)
+                        else:
+                            program.label[ins.args[0]] = order
+            root.clear()  # instruction is decoded, drop its element
+    except FileNotFoundError:
+        raise InputFileError('Soubor "' + name + '" neexistuje')
+    except OSError:
+        raise InputFileError('Soubor "' + name + '" nelze cist')
+    except etree.ParseError as err:
+        raise XMLFormatError('Soubor "' + name + '" neobsahuje platny XML soubor\n' + err.msg)
+
+    if failure is not None:
+        raise failure  # exit(31/32/53/56)
 
     # Check continuity of order number
-    for i in range(1, len(root)+1):
+    for i in range(1, ip+1):
         if i not in instructions:
-            sys.stderr.write("Chybi instrukce s poradovym cislem " + str(i) + "\n")
-            sys.exit(31)
-
-    # Browse instruction elements
-    i_count = 0
-    v_count = 0
-    ip = 1
-    while ip < len(root)+1:
-        child = instructions.get(ip)
-
-        opcode = child.get("opcode").upper()
-
-        # PARSING INSTRUCTION #
-        if opcode == "CREATEFRAME":
-            parse_args(child, ip, 0)  # exit(32)
-            enviroment.tf = {}
-
-        elif opcode == "PUSHFRAME":
-            parse_args(child, ip, 0)  # exit(32)
-            if enviroment.tf is None:
-                error(ip, 55, "Docasny ramec nedefinovan, neni co vlozit na zasobnik ramcu")  # exit(55)
-            if enviroment.lf is None:
-                enviroment.lf = []
-            enviroment.lf.append(enviroment.tf)
-            enviroment.tf = None
-
-        elif opcode == "POPFRAME":
-            parse_args(child, ip, 0)  # exit(32)
-            if enviroment.lf is None:
-                error(ip, 55, "Seznam lokalnich ramcu je prazdny, neni co vybrat")  # exit(55)
-            enviroment.tf = enviroment.lf.pop()
-            if len(enviroment.lf) == 0:
-                enviroment.lf = None
-
-        elif opcode == "RETURN":
-            parse_args(child, ip, 0)  # exit(32)
-            if len(enviroment.call) == 0:
-                error(ip, 56, "Cteni z prazdneho zasobniku volani")  # exit(56)
-            ip = enviroment.call.pop()
-
-        elif opcode == "BREAK":
-            parse_args(child, ip, 0)  # exit(32)
-            sys.stderr.write("Instrukce: " + str(ip) + "\n"
-                             "Vykonano instrukci: " + str(i_count) + "\n"
-                             "Zasobnik volani: " + str(enviroment.call) + "\n"
-                             "Zasobnik navesti: " + str(enviroment.label) + "\n"
-                             "Datovy zasobnik: " + str(enviroment.stack) + "\n"
-                             "Globalni ramec: " + str(enviroment.gf) + "\n"
-                             "Lokalni ramce: " + str(enviroment.lf) + "\n"
-                             "Docasny ramec: " + str(enviroment.tf) + "\n"
-                             )
-
-        elif opcode == "CALL":
-            args = parse_args(child, ip, 1)  # exit(32)
-            label = parse_label(ip, args[0])
-            if label not in enviroment.label:
-                error(ip, 52, 'Navesti "' + label + '" nenalezeno')  # exit(52)
-            enviroment.call.append(ip)
-            ip = enviroment.label.get(label)
-
-        elif opcode == "JUMP":
-            args = parse_args(child, ip, 1)  # exit(32)
-            label = parse_label(ip, args[0])
-            if label not in enviroment.label:
-                error(ip, 52, 'Navesti "' + label + '" nenalezeno')  # exit(52)
-            ip = enviroment.label.get(label)
-
-        elif opcode == "DEFVAR":
-            args = parse_args(child, ip, 1)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match, True)
-            if match[1] == "GF":
-                enviroment.gf[match[2]] = Variable()
-            elif match[1] == "TF":
-                enviroment.tf[match[2]] = Variable()
-            elif match[1] == "LF":
-                enviroment.lf[-1][match[2]] = Variable()
-            # Compute variables for STATI:
-            actual_count = len(enviroment.gf)
-            if enviroment.tf is not None:
-                actual_count += len(enviroment.tf)
-            if enviroment.lf is not None:
-                for lf in enviroment.lf:
-                    actual_count += len(lf)
-            if actual_count > v_count:
-                v_count = actual_count
-
-        elif opcode == "POPS":
-            args = parse_args(child, ip, 1)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            if len(enviroment.stack) == 0:
-                error(ip, 56, 'Datovy zasovnik je prazdny "' + match[2])  # exit(56)
-            src = enviroment.stack.pop()
-            var.type = src.type
-            var.value = src.value
+            raise XMLFormatError("Chybi instrukce s poradovym cislem " + str(i))
 
-        elif opcode == "PUSHS":
-            args = parse_args(child, ip, 1)  # exit(32)
-            symb = get_symb(enviroment, ip, args[0])  # exit(55/54)
-            enviroment.stack.append(symb)
-
-        elif opcode == "WRITE":
-            args = parse_args(child, ip, 1)  # exit(32)
-            symb = get_symb(enviroment, ip, args[0])  # exit(55/54)
-            if symb.type == "bool":
-                print(str(symb.value).lower())
-            else:
-                print(symb.value)
+    program.code = [instructions[i] for i in range(1, ip+1)]
+    resolve_targets(program)
+    assign_slots(program)
+    return program
 
-        elif opcode == "DPRINT":
-            args = parse_args(child, ip, 1)  # exit(32)
-            symb = get_symb(enviroment, ip, args[0])  # exit(55/54)
-            if symb.type == "bool":
-                sys.stderr.write(str(symb.value).lower() + "\n")
-            else:
-                sys.stderr.write(symb.value + "\n")
 
-        elif opcode == "MOVE":
-            args = parse_args(child, ip, 2)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            var.type = symb.type
-            var.value = symb.value
-
-        elif opcode == "TYPE":
-            args = parse_args(child, ip, 2)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb = get_symb(enviroment, ip, args[1], True)  # exit(54/55/56)
-            var.type = "string"
-            if symb is not None:
-                var.value = symb.type
-            else:
-                var.value = ""
-
-        elif opcode == "STRLEN":
-            args = parse_args(child, ip, 2)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb = get_symb(enviroment, ip, args[1], True)  # exit(54/55/56)
-            if symb.type != "string":
-                error(ip, 53, "arg2 instrukce STRLEN musi byt retezec")
-            var.type = "int"
-            var.value = len(symb.value)
-
-        elif opcode == "INT2CHAR":
-            args = parse_args(child, ip, 2)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            try:
-                if symb.type != "int":
-                    raise ValueError
-                var.value = chr(symb.value)
-            except ValueError:
-                error(ip, 58, "arg2 instrukce INT2CHAR musi byt hodnota Unicode")  # exit(58)
-            var.type = "string"
-
-        elif opcode in ["ADD", "SUB", "MUL", "IDIV"]:
-            args = parse_args(child, ip, 3)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if symb1.type != symb2.type or (symb1.type != "int" and symb1.type != "float"):
-                error(ip, 53, opcode + ': arg2 a arg3 musi byt typu int a int nebo typu float a float')  # exit(53)
-            var.type = symb1.type
-            if opcode == "ADD":
-                var.value = symb1.value + symb2.value
-            elif opcode == "SUB":
-                var.value = symb1.value - symb2.value
-            elif opcode == "MUL":
-                var.value = symb1.value * symb2.value
-            elif opcode == "IDIV":
-                if symb2.value == 0:
-                    error(ip, 57, "IDIV: Deleni nulou")  # exit(57)
-                var.value = symb1.value // symb2.value
-
-        elif opcode == "CONCAT":
-            args = parse_args(child, ip, 3)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if symb1.type != "string" or symb2.type != "string":
-                error(ip, 53, 'CONCAT: arg2 a arg3 instrukce musi byt retezec')  # exit(53)
-            var.type = "string"
-            var.value = symb1.value + symb2.value
-
-        elif opcode == "STRI2INT":
-            args = parse_args(child, ip, 3)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if symb1.type != "string" or symb2.type != "int":
-                error(ip, 53, 'STRI2INT: arg2 musi byt retezec a arg3 cele cislo')  # exit(53)
-            if symb2.value < 0 or symb2.value >= len(symb1.value):
-                error(ip, 58, 'STRI2INT: pristup mimo rozsah retezce')  # exit(58)
-            var.type = "int"
-            var.value = ord(symb1.value[symb2.value])
-
-        elif opcode == "GETCHAR":
-            args = parse_args(child, ip, 3)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if symb1.type != "string" or symb2.type != "int":
-                error(ip, 53, 'GETCHAR: arg2 musi byt retezec a arg3 cele cislo')  # exit(53)
-            if symb2.value < 0 or symb2.value >= len(symb1.value):
-                error(ip, 58, 'GETCHAR: pristup mimo rozsah retezce')  # exit(58)
-            var.type = "string"
-            var.value = symb1.value[symb2.value]
-
-        elif opcode == "SETCHAR":
-            args = parse_args(child, ip, 3)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if symb1.type != "int" or symb2.type != "string":
-                error(ip, 53, 'SETCHAR: arg2 musi byt retezec a arg3 cele cislo')  # exit(53)
-            if symb1.value < 0 or symb1.value >= len(var.value):
-                error(ip, 58, 'SETCHAR: pristup mimo rozsah retezce')  # exit(58)
-            if len(symb2.value) <= 0:
-                error(ip, 58, 'SETCHAR: symb2 musi byt neprazdny rezetec')  # exit(58)
-            var.value = var.value[:symb1.value] + symb2.value[0] + var.value[symb1.value+1:]
-
-        elif opcode in ["JUMPIFEQ", "JUMPIFNEQ"]:
-            args = parse_args(child, ip, 3)  # exit(32)
-            label = parse_label(ip, args[0])
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if label not in enviroment.label:
-                error(ip, 52, 'Navesti "' + label + '" nenalezeno')  # exit(52)
-            if symb1.type != symb2.type:
-                error(ip, 53, opcode + ': arg2 a arg3 museji byt stejneho typu')  # exit(53)
-            if opcode == "JUMPIFEQ" and symb1.value == symb2.value:
-                ip = enviroment.label.get(label)
-            elif opcode == "JUMPIFNEQ" and symb1.value != symb2.value:
-                ip = enviroment.label.get(label)
-
-        elif opcode in ["AND", "OR"]:
-            args = parse_args(child, ip, 3)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if symb1.type != "bool" or symb2.type != "bool":
-                error(ip, 53, opcode + ': arg2 a arg3 musi byt typu bool')  # exit(53)
-            var.type = "bool"
-            if opcode == "AND":
-                var.value = symb1.value and symb2.value
-            else:
-                var.value = symb1.value or symb2.value
-
-        elif opcode == "NOT":
-            args = parse_args(child, ip, 2)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            if symb.type != "bool":
-                error(ip, 53, 'NOT: arg2 musi byt typu bool')  # exit(53)
-            var.type = "bool"
-            var.value = not symb.value
-
-        elif opcode in ["LT", "GT", "EQ"]:
-            args = parse_args(child, ip, 3)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb1 = get_symb(enviroment, ip, args[1])  # exit(54/55/56)
-            symb2 = get_symb(enviroment, ip, args[2])  # exit(54/55/56)
-            if symb1.type != symb2.type:
-                error(ip, 53, opcode + ': arg2 a arg3 museji byt stejneho typu')  # exit(53)
-            var.type = "bool"
-            if opcode == "LT":
-                var.value = symb1.value < symb2.value
-            if opcode == "GT":
-                var.value = symb1.value > symb2.value
-            if opcode == "EQ":
-                var.value = symb1.value == symb2.value
+def resolve_targets(program):
+    """
+    Resolve jump targets, unknown label is reported when the jump is executed.
+    # type: (Program) -> None
+    """
+    for ins in program.code:
+        if ins.opcode in ("CALL", "JUMP", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS"):
+            ins.target = program.label.get(ins.args[0])
 
-        elif opcode == "READ":
-            args = parse_args(child, ip, 2)  # exit(32)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            typ = parse_type(ip, args[1])
-            try:
-                inp = input()
-            except Exception:
-                inp = None
-            var.type = typ
-            if typ == "int":
-                try:
-                    var.value = int(inp)
-                except (ValueError, TypeError):
-                    var.value = 0
-            elif typ == "string":
-                if inp is not None:
-                    var.value = inp
-                else:
-                    var.value = ""
-            elif typ == "bool":
-                var.value = inp == "true"
-            elif typ == "float":
-                try:
-                    var.value = float.fromhex(inp)
-                except (ValueError, TypeError):
-                    error(ip, 53, 'Hodnota "' + str(var.value) + '" neni typu float')  # exit(53)
-
-        elif opcode == "INT2FLOAT":
-            args = parse_args(child, ip, 2)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb = get_symb(enviroment, ip, args[1])
-            if symb.type == "int":
-                var.type = "float"
-                var.value = float(symb.value)
-            else:
-                error(ip, 53, 'Hodnota "' + str(var.value) + '" neni typu int')  # exit(53)
-
-        elif opcode == "FLOAT2INT":
-            args = parse_args(child, ip, 2)
-            match = parse_var(ip, args[0])
-            var = get_var(enviroment, ip, match)
-            symb = get_symb(enviroment, ip, args[1])
-            if symb.type == "float":
-                var.type = "int"
-                var.value = int(symb.value)
-            else:
-                error(ip, 53, 'Hodnota "' + str(var.value) + '" neni typu float')  # exit(53)
-
-        elif opcode == "CLEARS":
-            enviroment.stack.clear()
-
-        elif opcode in ["ADDS", "SUBS", "MULS", "IDIVS"]:
-            if len(enviroment.stack) < 2:
-                error(ip, 56, 'Na datovem zasobniku musi byt alespon 2 hodnoty!')  # exit(56)
-            symb2 = enviroment.stack.pop()
-            symb1 = enviroment.stack.pop()
-            if symb1.type != symb2.type or (symb1.type != "int" and symb1.type != "float"):
-                error(ip, 53, opcode + ': arg2 a arg3 musi byt typu int a int nebo typu float a float')  # exit(53)
-            var = Variable(symb1.type)
-            if opcode == "ADDS":
-                var.value = symb1.value + symb2.value
-            elif opcode == "SUBS":
-                var.value = symb1.value - symb2.value
-            elif opcode == "MULS":
-                var.value = symb1.value * symb2.value
-            elif opcode == "IDIVS":
-                if symb2.value == 0:
-                    error(ip, 57, "IDIV: Deleni nulou")  # exit(57)
-                var.value = symb1.value // symb2.value
-            enviroment.stack.append(var)
-
-        elif opcode in ["LTS", "GTS", "EQS"]:
-            if len(enviroment.stack) < 2:
-                error(ip, 56, 'Na datovem zasobniku musi byt alespon 2 hodnoty!')  # exit(56)
-            symb2 = enviroment.stack.pop()
-            symb1 = enviroment.stack.pop()
-            if symb1.type != symb2.type:
-                error(ip, 53, opcode + ': arg2 a arg3 museji byt stejneho typu')  # exit(53)
-            var = Variable(symb1.type)
-            if opcode == "LTS":
-                var.value = symb1.value < symb2.value
-            if opcode == "GTS":
-                var.value = symb1.value > symb2.value
-            if opcode == "EQS":
-                var.value = symb1.value == symb2.value
-            enviroment.stack.append(var)
-
-        elif opcode in ["ANDS", "ORS"]:
-            if len(enviroment.stack) < 2:
-                error(ip, 56, 'Na datovem zasobniku musi byt alespon 2 hodnoty!')  # exit(56)
-            symb2 = enviroment.stack.pop()
-            symb1 = enviroment.stack.pop()
-            if symb1.type != "bool" or symb2.type != "bool":
-                error(ip, 53, opcode + ': arg2 a arg3 musi byt typu bool')  # exit(53)
-            var = Variable("bool")
-            if opcode == "ANDS":
-                var.value = symb1.value and symb2.value
-            else:
-                var.value = symb1.value or symb2.value
-            enviroment.stack.append(var)
-
-        elif opcode == "NOTS":
-            if len(enviroment.stack) < 1:
-                error(ip, 56, 'Na datovem zasobniku musi byt alespon 1 hodnota!')  # exit(56)
-            symb = enviroment.stack.pop()
-            if symb.type != "bool":
-                error(ip, 53, 'NOT: arg2 musi byt typu bool')  # exit(53)
-            var = Variable("bool")
-            var.value = not symb.value
-            enviroment.stack.append(var)
-
-        elif opcode == "INT2CHARS":
-            if len(enviroment.stack) < 1:
-                error(ip, 56, 'Na datovem zasobniku musi byt alespon 1 hodnota!')  # exit(56)
-            symb = enviroment.stack.pop()
-            var = Variable("string")
-            try:
-                if symb.type != "int":
-                    raise ValueError
-                var.value = chr(symb.value)
-            except ValueError:
-                error(ip, 58, "Hodnota na datovem zasobniku pro instrukci INT2CHAR musi byt hodnotou Unicode")  # exit(58)
-            enviroment.stack.append(var)
-
-        elif opcode == "STRI2INTS":
-            if len(enviroment.stack) < 2:
-                error(ip, 56, 'Na datovem zasobniku musi byt alespon 2 hodnoty!')  # exit(56)
-            symb2 = enviroment.stack.pop()
-            symb1 = enviroment.stack.pop()
-            if symb1.type != "string" or symb2.type != "int":
-                error(ip, 53, 'STRI2INT: arg2 musi byt retezec a arg3 cele cislo')  # exit(53)
-            if symb2.value < 0 or symb2.value >= len(symb1.value):
-                error(ip, 58, 'STRI2INT: pristup mimo rozsah retezce')  # exit(58)
-            var = Variable("int")
-            var.value = ord(symb1.value[symb2.value])
-            enviroment.stack.append(var)
-
-        elif opcode in ["JUMPIFEQS", "JUMPIFNEQS"]:
-            args = parse_args(child, ip, 1)  # exit(32)
-            label = parse_label(ip, args[0])
-            if label not in enviroment.label:
-                error(ip, 52, 'Navesti "' + label + '" nenalezeno')  # exit(52)
-            if len(enviroment.stack) < 2:
-                error(ip, 56, 'Na datovem zasobniku musi byt alespon 2 hodnoty!')  # exit(56)
-            symb2 = enviroment.stack.pop()
-            symb1 = enviroment.stack.pop()
-            if symb1.type != symb2.type:
-                error(ip, 53, opcode + ': arg2 a arg3 museji byt stejneho typu')  # exit(53)
-            if opcode == "JUMPIFEQS" and symb1.value == symb2.value:
-                ip = enviroment.label.get(label)
-            elif opcode == "JUMPIFNEQS" and symb1.value != symb2.value:
-                ip = enviroment.label.get(label)
 
-        else:
-            if opcode != "LABEL":  # Labels are already preprocessed
-                sys.stderr.write('Neznama instrukce: "' + opcode + '"\n')
-                sys.exit(32)
+def assign_slots(program):
+    """
+    Assign slot in frame to every variable operand.
+    # type: (Program) -> None
+    """
+    gf_slots = {}
+    lf_slots = {}
+    for ins in program.code:
+        for arg in ins.args:
+            if arg.__class__ is not VarRef:
+                continue
+            slots, names = (gf_slots, program.gf_names) if arg.frame == GF else (lf_slots, program.lf_names)
+            if arg.name not in slots:
+                names.append(arg.name)
+                slots[arg.name] = len(names)
+            arg.slot = slots[arg.name]
+
+
+def source_digest(filepath):
+    """
+    Get key of compiled program in cache: sha256 of interpreter, Python version and source file.
+
+    Return None if any of the files cannot be read.
+    # type: (str) -> str|None
+    """
+    digest = hashlib.sha256()
+    digest.update((sys.version + "\0" + __name__ + "\0").encode())
+    try:
+        for path in (__file__, filepath):
+            with open(path, "rb") as file:
+                for block in iter(lambda: file.read(BLOCK_SIZE), b""):
+                    digest.update(block)
+            digest.update(b"\0")
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def restore_program(ops, counts, operands, invalid, label, gf_names, lf_names):
+    """
+    Build Program from columns made by Program.__reduce__.
+    # type: (bytes, bytes, list, dict, dict, list, list) -> Program
+    """
+    program = Program()
+    code = program.code
+    start = 0
+    for i, op in enumerate(ops):
+        end = start + counts[i]
+        code.append(Instruction(i+1, OPCODES[op], operands[start:end]))
+        start = end
+    for i, (err, kinds) in invalid.items():
+        code[i].error = err
+        code[i].kinds = kinds
+    program.label = label
+    program.gf_names = gf_names
+    program.lf_names = lf_names
+    resolve_targets(program)
+    return program
+
 
-        ip += 1
-        i_count += 1
+def trusted_cache(stat):
+    """
+    Check that cache directory or entry belongs to current user (or root) and nobody else can write to it.
+    # type: (os.stat_result) -> bool
+    """
+    return stat.st_uid in (os.geteuid(), 0) and not stat.st_mode & 0o022  # group and others write bits
+
+
+def load_cached(filepath, cachedir):
+    """
+    Get Program from cache directory, load it from source file and store it to the cache if it is not there.
+
+    Damaged or unreadable cache entry is ignored and replaced, entry is written atomically. Program which
+    failed to load is never stored, so errors are always reported from source file. Entries are pickles, so
+    loading one runs whatever code its author put there: directory and entry which are not trusted_cache
+    are not used, new directory is created accessible only to its owner.
+    # type: (str, str) -> Program
+    """
+    if not os.path.isfile(filepath):
+        return load_program(filepath)  # exit(11/31/32/53/56), pipe can be read only once
+    stat = os.stat(filepath)
+    digest = source_digest(filepath)
+    if digest is None:
+        return load_program(filepath)  # exit(11/31/32/53/56)
+    cachepath = os.path.join(cachedir, digest + ".pickle")
+    try:
+        with open(cachepath, "rb") as file:
+            if trusted_cache(os.stat(cachedir)) and trusted_cache(os.fstat(file.fileno())):
+                program = pickle.load(file)
+                if program.__class__ is Program:
+                    return program
+    except Exception:  # missing or damaged entry
+        pass
+
+    program = load_program(filepath)  # exit(11/31/32/53/56)
+    try:
+        current = os.stat(filepath)
+        if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            return program  # source changed while it was loaded, digest does not belong to program
+        os.makedirs(cachedir, 0o700, exist_ok=True)
+        if not trusted_cache(os.stat(cachedir)):
+            return program
+        (fd, temppath) = tempfile.mkstemp(".tmp", digest, cachedir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(program, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temppath, cachepath)
+        except BaseException:
+            os.unlink(temppath)
+            raise
+    except (OSError, pickle.PicklingError):
+        pass  # cache is optional
+    return program
+
+
+def mark_tail_calls(code):
+    """
+    Turn CALL followed by RETURN, or by POPFRAME and RETURN, into TAILCALL.
+
+    Recursion in tail position then runs with constant call stack. Local frames are not reused, every level
+    keeps its frame until the skipped POPFRAMEs run, because POPFRAME in callee can still expose the frame
+    below its own (benchmarks/recursion_memory.py shows which patterns are bounded).
+    # type: (list) -> None
+    """
+    for i, ins in enumerate(code):
+        if ins.opcode != "CALL" or ins.target is None:
+            continue
+        following = [nxt.opcode for nxt in code[i+1:i+3]]
+        if following[:1] == ["RETURN"]:
+            ins.pops = 0
+        elif following == ["POPFRAME", "RETURN"]:
+            ins.pops = 1
+        else:
+            continue
+        ins.op = OPCODE_ID["TAILCALL"]
+
+
+def same_var(symb, ref):
+    """
+    Check whether decoded operand is the variable ref.
+    # type: (Variable|VarRef, VarRef) -> bool
+    """
+    return symb.__class__ is VarRef and symb.frame == ref.frame and symb.name == ref.name
+
+
+def fuse(code, i, opcode, count, args):
+    """
+    Replace count instructions starting at index i by superinstruction.
+    # type: (list, int, str, int, list) -> None
+    """
+    ins = Instruction(code[i].order, opcode, args)
+    ins.fused = code[i:i+count]
+    code[i] = ins
+
+
+def peephole(code):
+    """
+    Fuse common instruction sequences into superinstructions executed by single handler.
+
+    CMPJUMP is LT/GT/EQ into variable followed by JUMPIFEQ/JUMPIFNEQ comparing the variable with bool constant,
+    STACKOP is PUSHS, PUSHS, binary stack instruction and POPS, MOVEOP is MOVE into variable followed
+    by instruction reading the variable. Sequences contain no LABEL or CALL, so no jump or return leads
+    inside them. Fused instructions stay in the program, superinstruction continues after the last one.
+    # type: (list) -> None
+    """
+    opcodes = [ins.opcode for ins in code]
+    inside = set()  # indexes of fused instructions following the first one
+    for i, opcode in enumerate(opcodes):
+        if i in inside:
+            continue
+        if opcode in FUSED_COMPARE and opcodes[i+1:i+2] in (["JUMPIFEQ"], ["JUMPIFNEQ"]):
+            var, jump = code[i].args[0], code[i+1]
+            operands = jump.args[1:]
+            if jump.target is None or not any(same_var(symb, var) for symb in operands):
+                continue
+            constant = operands[1] if same_var(operands[0], var) else operands[0]
+            if constant.__class__ is not Variable or constant.type != "bool":
+                continue
+            fuse(code, i, "CMPJUMP", 2, [FUSED_COMPARE[opcode], constant.value == (jump.opcode == "JUMPIFEQ")])
+            code[i].target = jump.target
+            inside.add(i+1)
+        elif opcodes[i:i+2] == ["PUSHS", "PUSHS"] and opcodes[i+2:i+3] and opcodes[i+2] in FUSED_STACK \
+                and opcodes[i+3:i+4] == ["POPS"]:
+            fuse(code, i, "STACKOP", 4, list(FUSED_STACK[opcodes[i+2]]))
+            inside.update((i+1, i+2, i+3))
+
+    for i, opcode in enumerate(opcodes[:-1]):
+        if opcode != "MOVE" or i in inside or i+1 in inside:
+            continue
+        consumer = code[i+1] if code[i+1].fused is None else code[i+1].fused[0]
+        reads = consumer.args if consumer.opcode in ("WRITE", "PUSHS", "DPRINT") else consumer.args[1:]
+        if any(same_var(symb, code[i].args[0]) for symb in reads):
+            fuse(code, i, "MOVEOP", 2, [])
+            inside.add(i+1)
+
+
+# TYPE INFERENCE #
+# Before the program runs, states of global variables are inferred by forward dataflow over basic blocks.
+# State of variable is bit mask of possible types, T_UNSET (defined without value) and T_MISSING (not defined).
+# States are joined at the entry of every block until they do not change. CALL continues at its label,
+# RETURN at the instruction following any CALL. Local and temporary frames are not tracked, their variables
+# may be in any state.
+
+T_INT = 1
+T_BOOL = 2
+T_STRING = 4
+T_FLOAT = 8
+T_NUMBER = T_INT | T_FLOAT
+T_VALUE = T_INT | T_BOOL | T_STRING | T_FLOAT  # variable has value of any type
+T_UNSET = 16
+T_MISSING = 32
+T_ANY = T_VALUE | T_UNSET | T_MISSING
+TYPE_BITS = {"int": T_INT, "bool": T_BOOL, "string": T_STRING, "float": T_FLOAT}
+TYPE_NAMES = {bit: name for name, bit in TYPE_BITS.items()}
+
+OPERAND_TYPES = {  # opcode: (allowed types of every operand or 0 if not checked, operands 2 and 3 have same type)
+    # INT2CHAR is missing, it reports operand of other type than int as error 58
+    "ADD": ((0, T_NUMBER, T_NUMBER), True),
+    "SUB": ((0, T_NUMBER, T_NUMBER), True),
+    "MUL": ((0, T_NUMBER, T_NUMBER), True),
+    "IDIV": ((0, T_NUMBER, T_NUMBER), True),
+    "LT": ((0, T_VALUE, T_VALUE), True),
+    "GT": ((0, T_VALUE, T_VALUE), True),
+    "EQ": ((0, T_VALUE, T_VALUE), True),
+    "JUMPIFEQ": ((0, T_VALUE, T_VALUE), True),
+    "JUMPIFNEQ": ((0, T_VALUE, T_VALUE), True),
+    "AND": ((0, T_BOOL, T_BOOL), False),
+    "OR": ((0, T_BOOL, T_BOOL), False),
+    "NOT": ((0, T_BOOL), False),
+    "STRI2INT": ((0, T_STRING, T_INT), False),
+    "CONCAT": ((0, T_STRING, T_STRING), False),
+    "STRLEN": ((0, T_STRING), False),
+    "GETCHAR": ((0, T_STRING, T_INT), False),
+    "SETCHAR": ((T_STRING, T_INT, T_STRING), False),
+    "INT2FLOAT": ((0, T_INT), False),
+    "FLOAT2INT": ((0, T_FLOAT), False),
+}
+RESULT_TYPES = {  # opcode: state of variable written by the instruction (arithmetic, MOVE and READ are computed)
+    "DEFVAR": T_UNSET,
+    "POPS": T_VALUE,
+    "LT": T_BOOL,
+    "GT": T_BOOL,
+    "EQ": T_BOOL,
+    "AND": T_BOOL,
+    "OR": T_BOOL,
+    "NOT": T_BOOL,
+    "INT2CHAR": T_STRING,
+    "STRI2INT": T_INT,
+    "CONCAT": T_STRING,
+    "STRLEN": T_INT,
+    "GETCHAR": T_STRING,
+    "SETCHAR": T_STRING,
+    "TYPE": T_STRING,
+    "INT2FLOAT": T_FLOAT,
+    "FLOAT2INT": T_INT,
+}
+BRANCHES = ("JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS")
+
+
+def narrowing(opcode):
+    """
+    Get mask of states possible after successful instruction for every operand, None if it is not narrowed.
+    Read variable had value of allowed type, written variable was defined (DEFVAR does not narrow).
+    # type: (str) -> tuple
+    """
+    masks = OPERAND_TYPES.get(opcode, ((),))[0]
+    result = []
+    for i, kind in enumerate(SIGNATURES.get(opcode) or ()):
+        mask = masks[i] if i < len(masks) and masks[i] else T_ANY
+        if kind == "symb":
+            result.append(T_ANY & ~T_MISSING if opcode == "TYPE" else T_VALUE & mask)
+        elif kind == "var" and opcode != "DEFVAR":
+            result.append(T_ANY & ~T_MISSING & mask)
+        else:
+            result.append(None)
+    return tuple(result)
+
+
+NARROWING = {opcode: narrowing(opcode) for opcode in SIGNATURES}
+WRITES = {opcode for opcode, kinds in SIGNATURES.items() if kinds and kinds[0] == "var"}
+
+
+def original(ins):
+    """
+    Get instruction at the same index before peephole(), superinstruction keeps it as the first fused one.
+    # type: (Instruction) -> Instruction
+    """
+    while ins.fused is not None:
+        ins = ins.fused[0]
+    return ins
+
+
+def operand_states(ins, state):
+    """
+    Get state of every operand: state of global variable, any state of other variables, type of constant
+    and 0 for label or type.
+    # type: (Instruction, list) -> tuple
+    """
+    return tuple([(state[arg.slot] if arg.frame == GF else T_ANY) if arg.__class__ is VarRef else
+                  TYPE_BITS.get(arg.type, T_ANY) if arg.__class__ is Variable else 0 for arg in ins.args])
+
+
+def definite_error(ins, states):
+    """
+    Get InterpretError (53, 54 or 56) which the instruction raises whenever it is executed with operands
+    in given states, None when it may succeed or fail with another error.
+    # type: (Instruction, tuple) -> InterpretError|None
+    """
+    opcode = ins.opcode
+    kinds = SIGNATURES.get(opcode)
+    if not kinds or opcode == "DEFVAR":
+        return None
+    for arg, kind, state in zip(ins.args, kinds, states):
+        if arg.__class__ is not VarRef:
+            continue
+        if arg.frame != GF:
+            return None  # frame may not exist
+        if state == T_MISSING:
+            return UndefinedVariableError('Pristup k neexistujici promenne "' + arg.text + '"', ins.order)
+        if kind == "symb" and opcode != "TYPE":
+            if state == T_UNSET:
+                return MissingValueError('Promenne "' + arg.text + '" nebyla dosud prirazena hodnota', ins.order)
+            if state & ~T_VALUE:
+                return None
+        elif state & T_MISSING:
+            return None
+    if opcode in OPERAND_TYPES:
+        masks, same = OPERAND_TYPES[opcode]
+        if any(mask and not state & mask for mask, state in zip(masks, states)) or \
+                (same and not states[1] & states[2] & masks[1]):
+            return OperandTypeError(opcode + ": operandy nemohou mit pozadovane typy", ins.order)
+    return None
+
+
+def transfer(ins, states, state):
+    """
+    Update states of global variables after the instruction succeeded. Return False when some variable
+    cannot be in any state after it, so the instruction always fails.
+    # type: (Instruction, tuple, list) -> bool
+    """
+    opcode = ins.opcode
+    args = ins.args
+    for arg, mask in zip(args, NARROWING[opcode]):
+        if mask is not None and arg.__class__ is VarRef and arg.frame == GF:
+            narrowed = state[arg.slot] & mask
+            if not narrowed:
+                return False
+            state[arg.slot] = narrowed
+    if opcode in WRITES and args[0].frame == GF:
+        if opcode in ARITHMETIC:
+            result = states[1] & states[2] & T_NUMBER
+        elif opcode == "MOVE":
+            result = states[1] & T_VALUE
+        elif opcode == "READ":
+            result = TYPE_BITS.get(args[1], T_VALUE)
+        else:
+            result = RESULT_TYPES.get(opcode, T_VALUE)
+        if not result:
+            return False
+        state[args[0].slot] = result
+    return True
+
+
+def infer_block(code, start, end, state, returns, types):
+    """
+    Apply instructions code[start:end] to state and store operand states of every instruction to types.
+    Return indexes of instructions which may follow the block, instruction which always fails ends it.
+    # type: (list, int, int, list, list, list) -> list
+    """
+    for i in range(start, end):
+        ins = code[i]
+        states = operand_states(ins, state)
+        types[i] = states
+        if ins.opcode == "INVALID" or definite_error(ins, states) is not None or not transfer(ins, states, state):
+            types[i+1:end] = [None] * (end-i-1)
+            return []
+    opcode = code[end-1].opcode
+    target = code[end-1].target
+    if opcode in ("JUMP", "CALL") or opcode in BRANCHES:
+        if target is None:
+            return []  # unknown label
+        return [target, end] if opcode in BRANCHES else [target]
+    if opcode == "RETURN":
+        return returns
+    return [end]
+
+
+def infer_types(program):
+    """
+    Infer states of operands of every instruction by dataflow over basic blocks of the program.
+
+    Return list indexed like program.code, item is tuple of operand states (see operand_states) or None
+    for instruction which is never reached.
+    # type: (Program) -> list
+    """
+    code = [original(ins) for ins in program.code]
+    end = len(code)
+    leaders = {0}
+    for i, ins in enumerate(code):
+        if ins.opcode in ("JUMP", "CALL", "RETURN", "INVALID") or ins.opcode in BRANCHES:
+            leaders.add(i+1)
+        if ins.target is not None:
+            leaders.add(ins.target)
+    leaders = sorted(leader for leader in leaders if leader < end)
+    block_end = dict(zip(leaders, leaders[1:] + [end]))
+    returns = [i+1 for i, ins in enumerate(code) if ins.opcode == "CALL" and ins.target is not None]
+
+    # Block is applied again whenever states at its entry grow, the last time with the final states
+    types = [None] * end
+    entry = {}  # {first index of block: states of global variables}
+    if end:
+        entry[0] = [0] + [T_MISSING] * len(program.gf_names)
+    work = list(entry)
+    queued = set(work)
+    while work:
+        start = work.pop()
+        queued.discard(start)
+        state = list(entry[start])
+        for following in infer_block(code, start, block_end[start], state, returns, types):
+            if following >= end:
+                continue
+            old = entry.get(following)
+            new = state if old is None else [a | b for a, b in zip(old, state)]
+            if new != old:
+                entry[following] = list(new)
+                if following not in queued:
+                    queued.add(following)
+                    work.append(following)
+    return types
+
+
+def check_program(program):
+    """
+    Find instructions which fail with error 53, 54 or 56 whenever they are reached, without running the program.
+    Return InterpretError of every such instruction in order of instructions.
+    # type: (Program) -> list
+    """
+    errors = []
+    for ins, states in zip(program.code, infer_types(program)):
+        if states is not None:
+            err = definite_error(original(ins), states)
+            if err is not None:
+                errors.append(err)
+    return errors
+
+
+UNCHECKED_OPERATORS = {  # opcode: (Python operator, allowed type of both operands)
+    "ADD": ("+", T_NUMBER),
+    "SUB": ("-", T_NUMBER),
+    "MUL": ("*", T_NUMBER),
+    "LT": ("<", T_VALUE),
+    "GT": (">", T_VALUE),
+    "EQ": ("==", T_VALUE),
+    "AND": ("and", T_BOOL),
+    "OR": ("or", T_BOOL),
+    "CONCAT": ("+", T_STRING),
+    "JUMPIFEQ": ("==", T_VALUE),
+    "JUMPIFNEQ": ("!=", T_VALUE),
+}
+UNCHECKED_OPS = {}  # {(opcode, operands are constants): opcode id of generated handler}
+
+
+def unchecked_op(opcode, constants):
+    """
+    Get opcode id of UNCHECKED handler of opcode with constant operands as flagged in constants. The handler
+    is generated once for all instructions of the same shape and appended to HANDLERS, it takes operands
+    (dst, a, b, typ) from Instruction.unchecked (constant value or slot of global variable).
+    # type: (str, tuple) -> int
+    """
+    op = UNCHECKED_OPS.get((opcode, constants))
+    if op is not None:
+        return op
+    values = ["ab"[i] if constant else "gf[" + "ab"[i] + "].value" for i, constant in enumerate(constants)]
+    if opcode == "MOVE":
+        lines = ["var = gf[dst]", "var.type = typ", "var.value = a"] if constants[0] else \
+            ["var = gf[dst]", "symb = gf[a]", "var.type = symb.type", "var.value = symb.value"]
+    elif opcode in BRANCHES:
+        lines = ["if " + values[0] + " " + UNCHECKED_OPERATORS[opcode][0] + " " + values[1] + ":",
+                 "    return ins.target"]
+    elif opcode == "CONCAT":
+        lines = ["v = " + values[0] + " + " + values[1], "if len(v) > enviroment.max_string:",
+                 "    string_limit(enviroment, ins)", "var = gf[dst]", "var.value = v", "var.type = typ"]
+    else:
+        lines = ["var = gf[dst]", "var.value = " + values[0] + " " + UNCHECKED_OPERATORS[opcode][0] + " " + values[1],
+                 "var.type = typ"]
+    lines = ["gf = enviroment.gf", "dst, a, b, typ = ins.unchecked"] + lines
+    source = "def handler(enviroment, ins):\n" + "".join("    " + line + "\n" for line in lines)
+    namespace = {"string_limit": string_limit}
+    exec(compile(source, "<IPPcode18 unchecked " + opcode + ">", "exec"), namespace)
+    op = UNCHECKED_OPS[(opcode, constants)] = len(HANDLERS)
+    HANDLERS.append(namespace["handler"])
+    OPCODES.append("UNCHECKED")
+    return op
+
+
+def make_unchecked(ins, states):
+    """
+    Get opcode id of handler executing the instruction without any checks and its operands, when operand states
+    from infer_types prove the instruction succeeds. Return None otherwise. Operands have to be constants
+    or global variables (slot is passed instead of the variable).
+    # type: (Instruction, tuple) -> tuple|None
+    """
+    opcode = ins.opcode
+    args = ins.args
+    for arg in args:
+        if arg.__class__ is VarRef and arg.frame != GF:
+            return None
+    jump = opcode in BRANCHES
+    if (ins.target is None) if jump else states[0] & T_MISSING:
+        return None
+    symbs = args[1:]
+    constants = tuple(arg.__class__ is Variable for arg in symbs)
+    operands = [arg.value if arg.__class__ is Variable else arg.slot for arg in symbs]
+    if opcode == "MOVE":
+        if not states[1] or states[1] & ~T_VALUE:
+            return None
+        typ = symbs[0].type if constants[0] else None
+        return unchecked_op(opcode, constants), (args[0].slot, operands[0], None, typ)
+
+    allowed = UNCHECKED_OPERATORS[opcode][1]
+    if states[1] not in TYPE_NAMES or states[1] != states[2] or not states[1] & allowed:
+        return None
+    if opcode == "CONCAT" and same_var(symbs[0], args[0]):
+        return None  # appending to itself may edit StringBuffer
+    if jump:
+        return unchecked_op(opcode, constants), (None, operands[0], operands[1], None)
+    typ = TYPE_NAMES[RESULT_TYPES.get(opcode, states[1])]
+    return unchecked_op(opcode, constants), (args[0].slot, operands[0], operands[1], typ)
+
+
+def specialize(code, types):
+    """
+    Let instructions whose operand types are proven by infer_types run by UNCHECKED handlers without checks.
+
+    Instructions already replaced (TAILCALL, superinstructions) are kept, fused instructions following
+    the first one are specialized, so they run unchecked also inside MOVEOP.
+    # type: (list, list) -> None
+    """
+    for ins, states in zip(code, types):
+        if states is None or ins.fused is not None or ins.op != OPCODE_ID[ins.opcode] or \
+                ins.opcode not in UNCHECKED_OPERATORS and ins.opcode != "MOVE":
+            continue
+        unchecked = make_unchecked(ins, states)
+        if unchecked is not None:
+            ins.op, ins.unchecked = unchecked
+
+
+def get_frame(enviroment, order, ref):
+    """
+    Get frame containing variable from VarRef, exit program if the frame does not exist.
+    # type: (Enviroment, int, VarRef) -> list
+    """
+    if ref.frame == GF:
+        return enviroment.gf
+    elif ref.frame == TF:
+        if enviroment.tf is None:
+            error(order, 55, "Docasny ramec neni definovan")  # exit(55)
+        return enviroment.tf
+    if enviroment.lf is None:
+        error(order, 55, "Lokalni ramec neni nedefinovan")  # exit(55)
+    return enviroment.lf[-1]
+
+
+def get_var(enviroment, order, ref):
+    """
+    Get link to existing Variable from VarRef.
+
+    If trying to access undefined variable, exit program.
+    # type: (Enviroment, int, VarRef) -> Variable
+    """
+    frame = ref.frame
+    if frame == GF:
+        var = enviroment.gf[ref.slot]
+    elif frame == LF and enviroment.lf is not None:
+        var = enviroment.lf[-1][ref.slot]
+    else:
+        var = get_frame(enviroment, order, ref)[ref.slot]  # exit(55)
+    if var is None:
+        error(order, 54, 'Pristup k neexistujici promenne "' + ref.text + '"')  # exit(54)
+    return var
+
+
+def get_symb(enviroment, order, symb, undefined=False):
+    """
+    Get Variable from decoded symb operand, constants are returned directly.
+
+    Return None for variable without value if undefined is set, otherwise exit program.
+    # type: (Enviroment, int, Variable|VarRef, bool) -> Variable
+    """
+    if symb.__class__ is Variable:
+        return symb
+    frame = symb.frame
+    if frame == GF:
+        var = enviroment.gf[symb.slot]
+    elif frame == LF and enviroment.lf is not None:
+        var = enviroment.lf[-1][symb.slot]
+    else:
+        var = get_frame(enviroment, order, symb)[symb.slot]  # exit(55)
+    if var is None:
+        error(order, 54, 'Pristup k neexistujici promenne "' + symb.text + '"')  # exit(54)
+    if var.type is None or (var.__class__ is Variable and var.value is None):  # StringBuffer is not joined
+        if undefined:
+            return None
+        error(order, 56, 'Promenne "' + symb.text + '" nebyla dosud prirazena hodnota')  # exit(56)
+    return var
+
+
+def get_chars(symb):
+    """
+    Get string value of Variable as sequence of characters for len() and indexing, edited StringBuffer
+    is not joined.
+    # type: (Variable) -> str|list
+    """
+    if symb.__class__ is StringBuffer and symb.text is None:
+        return symb.chars
+    return symb.value
+
+
+def get_buffer(enviroment, ins, var):
+    """
+    Get StringBuffer of variable operand arg1, Variable holding string is replaced by it in its frame.
+    # type: (Enviroment, Instruction, Variable) -> StringBuffer
+    """
+    if var.__class__ is StringBuffer:
+        return var
+    buffer = StringBuffer(var.value)
+    get_frame(enviroment, ins.order, ins.args[0])[ins.args[0].slot] = buffer  # frame exists, var was found in it
+    return buffer
+
+
+def stack_limit(enviroment, ins):
+    """
+    Report data stack exceeding --max-stack, grown by PUSHS ins.
+    # type: (Enviroment, Instruction) -> None
+    """
+    error(ins.order, 61, "Prekrocen limit hloubky datoveho zasobniku " + str(enviroment.max_stack))  # exit(61)
+
+
+def string_limit(enviroment, ins):
+    """
+    Report string made by CONCAT ins exceeding --max-string-len.
+    # type: (Enviroment, Instruction) -> None
+    """
+    error(ins.order, 63, "Prekrocen limit delky retezce " + str(enviroment.max_string))  # exit(63)
+
+
+def report_invalid(enviroment, ins):
+    """
+    Report deferred decode error of INVALID instruction.
+
+    Operands preceding the invalid one are accessed first, so errors are reported in the same order as before.
+    # type: (Enviroment, Instruction) -> None
+    """
+    for kind, arg in zip(ins.kinds, ins.args):
+        if kind == "var":
+            get_var(enviroment, ins.order, arg)  # exit(54/55)
+        elif kind == "symb":
+            get_symb(enviroment, ins.order, arg)  # exit(54/55/56)
+    error(ins.order, ins.error[0], ins.error[1])
+
+
+# INSTRUCTION HANDLERS #
+# Every handler gets Enviroment and decoded Instruction. Handler returns index of next instruction when it jumps,
+# otherwise None and execution continues with the following instruction.
+
+def new_frame(enviroment):
+    """
+    Get empty frame, released frames are reused.
+    # type: (Enviroment) -> list
+    """
+    if enviroment.pool:
+        return enviroment.pool.pop()
+    if enviroment.blank is None:
+        return SparseFrame({0: 0})
+    return enviroment.blank[:]
+
+
+def release_frame(enviroment, frame):
+    """
+    Clear no longer reachable frame and return it to pool.
+    # type: (Enviroment, list) -> None
+    """
+    if enviroment.blank is None:
+        frame.clear()
+        frame[0] = 0
+    else:
+        frame[:] = enviroment.blank
+    enviroment.pool.append(frame)
+
+
+def dump_frame(frame, names):
+    """
+    Get frame as dictionary of defined variables, used for debug output.
+    # type: (list, list) -> dict
+    """
+    slots = range(1, len(frame)) if frame.__class__ is list else sorted(frame)[1:]
+    return {names[slot-1]: frame[slot] for slot in slots if frame[slot] is not None}
+
+
+def op_createframe(enviroment, ins):
+    """CREATEFRAME"""
+    if enviroment.tf is not None:
+        enviroment.vars -= enviroment.tf[0]
+        release_frame(enviroment, enviroment.tf)
+    else:
+        enviroment.frames += 1
+        if enviroment.frames > enviroment.frame_peak:
+            enviroment.frame_peak = enviroment.frames
+    enviroment.tf = new_frame(enviroment)
+
+
+def op_pushframe(enviroment, ins):
+    """PUSHFRAME"""
+    if enviroment.tf is None:
+        error(ins.order, 55, "Docasny ramec nedefinovan, neni co vlozit na zasobnik ramcu")  # exit(55)
+    if enviroment.lf is None:
+        enviroment.lf = []
+    enviroment.lf.append(enviroment.tf)
+    enviroment.tf = None
+
+
+def op_popframe(enviroment, ins):
+    """POPFRAME"""
+    if enviroment.lf is None:
+        error(ins.order, 55, "Seznam lokalnich ramcu je prazdny, neni co vybrat")  # exit(55)
+    if enviroment.tf is not None:
+        enviroment.vars -= enviroment.tf[0]
+        enviroment.frames -= 1
+        release_frame(enviroment, enviroment.tf)
+    enviroment.tf = enviroment.lf.pop()
+    if len(enviroment.lf) == 0:
+        enviroment.lf = None
+
+
+def op_return(enviroment, ins):
+    """RETURN, also finishes POPFRAME and RETURN instructions skipped by tail calls"""
+    if len(enviroment.call) == 0:
+        error(ins.order, 56, "Cteni z prazdneho zasobniku volani")  # exit(56)
+    if enviroment.call_tail:
+        skipped = enviroment.call_tail.pop(len(enviroment.call), None)
+        if skipped is not None:
+            enviroment.i_count += skipped[0]
+            for _ in range(skipped[1]):
+                op_popframe(enviroment, ins)  # exit(55)
+    return enviroment.call.pop()
+
+
+def op_break(enviroment, ins):
+    """BREAK"""
+    program = enviroment.program
+    lf = None if enviroment.lf is None else [dump_frame(frame, program.lf_names) for frame in enviroment.lf]
+    tf = None if enviroment.tf is None else dump_frame(enviroment.tf, program.lf_names)
+    stack = [Variable(typ, value) for typ, value in zip(enviroment.stack_types, enviroment.stack_values)]
+    enviroment.stderr.write("Instrukce: " + str(ins.order) + "\n"
+                            "Vykonano instrukci: " + str(enviroment.i_count) + "\n"
+                            "Zasobnik volani: " + str(enviroment.call.tolist()) + "\n"
+                            "Zasobnik navesti: " + str(program.label) + "\n"
+                            "Datovy zasobnik: " + str(stack) + "\n"
+                            "Globalni ramec: " + str(dump_frame(enviroment.gf, program.gf_names)) + "\n"
+                            "Lokalni ramce: " + str(lf) + "\n"
+                            "Docasny ramec: " + str(tf) + "\n"
+                            )
+
+
+def op_call(enviroment, ins):
+    """CALL <label>"""
+    if ins.target is None:
+        error(ins.order, 52, 'Navesti "' + ins.args[0] + '" nenalezeno')  # exit(52)
+    enviroment.call.append(ins.order)  # order is index of the following instruction
+    if len(enviroment.call) > enviroment.call_peak:
+        enviroment.call_peak = len(enviroment.call)
+        if enviroment.call_peak > enviroment.max_call:
+            error(ins.order, 62, "Prekrocen limit hloubky zasobniku volani " + str(enviroment.max_call))  # exit(62)
+    return ins.target
+
+
+def op_tailcall(enviroment, ins):
+    """
+    CALL <label> followed by RETURN or by POPFRAME and RETURN.
+
+    The return address would only lead to RETURN, so callee returns directly to our caller. Skipped instructions
+    are recorded in caller's call stack entry and performed by the RETURN of callee. Call stack does not grow,
+    frame stack grows by the frames pushed by callees until their skipped POPFRAMEs are performed.
+    """
+    depth = len(enviroment.call)
+    if depth == 0:
+        return op_call(enviroment, ins)  # RETURN would fail, keep the address for error reporting
+    skipped = enviroment.call_tail.get(depth)
+    if skipped is None:
+        enviroment.call_tail[depth] = [1 + ins.pops, ins.pops]
+    else:
+        skipped[0] += 1 + ins.pops
+        skipped[1] += ins.pops
+    return ins.target
+
+
+def op_jump(enviroment, ins):
+    """JUMP <label>"""
+    if ins.target is None:
+        error(ins.order, 52, 'Navesti "' + ins.args[0] + '" nenalezeno')  # exit(52)
+    return ins.target
+
+
+def op_label(enviroment, ins):
+    """LABEL <label>, already preprocessed"""
+
+
+def op_defvar(enviroment, ins):
+    """DEFVAR <var>"""
+    ref = ins.args[0]
+    frame = get_frame(enviroment, ins.order, ref)  # exit(55)
+    if frame[ref.slot] is not None:
+        error(ins.order, 59, 'Pokus o redefinovani promenne "' + ref.text)  # exit(59)
+    frame[ref.slot] = Variable()
+    frame[0] += 1
+    enviroment.vars += 1
+    if enviroment.vars > enviroment.v_count:
+        enviroment.v_count = enviroment.vars
+
+
+def op_pops(enviroment, ins):
+    """POPS <var>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    if len(enviroment.stack_types) == 0:
+        error(ins.order, 56, 'Datovy zasovnik je prazdny "' + ins.args[0].name)  # exit(56)
+    var.type = enviroment.stack_types.pop()
+    var.value = enviroment.stack_values.pop()
+
+
+def op_pushs(enviroment, ins):
+    """PUSHS <symb>"""
+    symb = get_symb(enviroment, ins.order, ins.args[0])  # exit(54/55/56)
+    enviroment.stack_types.append(symb.type)
+    enviroment.stack_values.append(symb.value)
+    if len(enviroment.stack_types) > enviroment.stack_peak:
+        enviroment.stack_peak = len(enviroment.stack_types)
+        if enviroment.stack_peak > enviroment.max_stack:
+            stack_limit(enviroment, ins)  # exit(61)
+
+
+def op_write(enviroment, ins):
+    """WRITE <symb>"""
+    symb = get_symb(enviroment, ins.order, ins.args[0])  # exit(54/55/56)
+    if symb.type == "bool":
+        enviroment.writer.write("true\n" if symb.value else "false\n")
+    else:
+        enviroment.writer.write(str(symb.value) + "\n")
+
+
+def op_dprint(enviroment, ins):
+    """DPRINT <symb>"""
+    symb = get_symb(enviroment, ins.order, ins.args[0])  # exit(54/55/56)
+    if symb.type == "bool":
+        enviroment.stderr.write(str(symb.value).lower() + "\n")
+    else:
+        enviroment.stderr.write(str(symb.value) + "\n")
+
+
+def op_move(enviroment, ins):
+    """MOVE <var> <symb>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    var.type = symb.type
+    var.value = symb.value
+
+
+def op_type(enviroment, ins):
+    """TYPE <var> <symb>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, ins.order, ins.args[1], True)  # exit(54/55)
+    var.type = "string"
+    if symb is not None:
+        var.value = symb.type
+    else:
+        var.value = ""
+
+
+def op_strlen(enviroment, ins):
+    """STRLEN <var> <symb>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    if symb.type != "string":
+        error(ins.order, 53, "arg2 instrukce STRLEN musi byt retezec")  # exit(53)
+    var.type = "int"
+    var.value = len(get_chars(symb))
+
+
+def op_int2char(enviroment, ins):
+    """INT2CHAR <var> <symb>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    try:
+        if symb.type != "int":
+            raise ValueError
+        var.value = chr(symb.value)
+    except ValueError:
+        error(ins.order, 58, "arg2 instrukce INT2CHAR musi byt hodnota Unicode")  # exit(58)
+    var.type = "string"
+
+
+def get_numbers(enviroment, ins):
+    """
+    Get target Variable and both numeric operands of ADD/SUB/MUL/IDIV.
+    # type: (Enviroment, Instruction) -> tuple
+    """
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if symb1.type != symb2.type or (symb1.type != "int" and symb1.type != "float"):
+        error(ins.order, 53, ins.opcode + ': arg2 a arg3 musi byt typu int a int nebo typu float a float')  # exit(53)
+    return var, symb1, symb2
+
+
+def op_add(enviroment, ins):
+    """ADD <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_numbers(enviroment, ins)  # exit(53/54/55/56)
+    var.type = symb1.type
+    var.value = symb1.value + symb2.value
+
+
+def op_sub(enviroment, ins):
+    """SUB <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_numbers(enviroment, ins)  # exit(53/54/55/56)
+    var.type = symb1.type
+    var.value = symb1.value - symb2.value
+
+
+def op_mul(enviroment, ins):
+    """MUL <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_numbers(enviroment, ins)  # exit(53/54/55/56)
+    var.type = symb1.type
+    var.value = symb1.value * symb2.value
+
+
+def op_idiv(enviroment, ins):
+    """IDIV <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_numbers(enviroment, ins)  # exit(53/54/55/56)
+    if symb2.value == 0:
+        error(ins.order, 57, "IDIV: Deleni nulou")  # exit(57)
+    var.type = symb1.type
+    var.value = symb1.value // symb2.value
+
+
+def op_concat(enviroment, ins):
+    """CONCAT <var> <symb1> <symb2>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if symb1.type != "string" or symb2.type != "string":
+        error(ins.order, 53, 'CONCAT: arg2 a arg3 instrukce musi byt retezec')  # exit(53)
+    if symb1 is var and (var.__class__ is StringBuffer or len(var.value) >= ROPE_MIN):  # appending to itself
+        tail = symb2.value
+        if len(get_chars(var)) + len(tail) > enviroment.max_string:
+            string_limit(enviroment, ins)  # exit(63)
+        get_buffer(enviroment, ins, var).edit().extend(tail)
+    else:
+        value = symb1.value + symb2.value
+        if len(value) > enviroment.max_string:
+            string_limit(enviroment, ins)  # exit(63)
+        var.type = "string"
+        var.value = value
+
+
+def op_stri2int(enviroment, ins):
+    """STRI2INT <var> <symb1> <symb2>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if symb1.type != "string" or symb2.type != "int":
+        error(ins.order, 53, 'STRI2INT: arg2 musi byt retezec a arg3 cele cislo')  # exit(53)
+    chars = get_chars(symb1)
+    if symb2.value < 0 or symb2.value >= len(chars):
+        error(ins.order, 58, 'STRI2INT: pristup mimo rozsah retezce')  # exit(58)
+    var.type = "int"
+    var.value = ord(chars[symb2.value])
+
+
+def op_getchar(enviroment, ins):
+    """GETCHAR <var> <symb1> <symb2>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if symb1.type != "string" or symb2.type != "int":
+        error(ins.order, 53, 'GETCHAR: arg2 musi byt retezec a arg3 cele cislo')  # exit(53)
+    chars = get_chars(symb1)
+    if symb2.value < 0 or symb2.value >= len(chars):
+        error(ins.order, 58, 'GETCHAR: pristup mimo rozsah retezce')  # exit(58)
+    var.type = "string"
+    var.value = chars[symb2.value]
+
+
+def op_setchar(enviroment, ins):
+    """SETCHAR <var> <symb1> <symb2>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if symb1.type != "int" or symb2.type != "string" or var.type != "string":
+        error(ins.order, 53, 'SETCHAR: arg1 musi byt retezec, arg2 cele cislo a arg3 retezec')  # exit(53)
+    chars = get_chars(var)
+    if symb1.value < 0 or symb1.value >= len(chars):
+        error(ins.order, 58, 'SETCHAR: pristup mimo rozsah retezce')  # exit(58)
+    if len(symb2.value) <= 0:
+        error(ins.order, 58, 'SETCHAR: symb2 musi byt neprazdny rezetec')  # exit(58)
+    if var.__class__ is StringBuffer or len(chars) >= ROPE_MIN:
+        get_buffer(enviroment, ins, var).edit()[symb1.value] = symb2.value[0]
+    else:
+        var.value = chars[:symb1.value] + symb2.value[0] + chars[symb1.value+1:]
+
+
+def get_comparable(enviroment, ins):
+    """
+    Get both operands of JUMPIFEQ/JUMPIFNEQ, check label and types.
+    # type: (Enviroment, Instruction) -> tuple
+    """
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if ins.target is None:
+        error(ins.order, 52, 'Navesti "' + ins.args[0] + '" nenalezeno')  # exit(52)
+    if symb1.type != symb2.type:
+        error(ins.order, 53, ins.opcode + ': arg2 a arg3 museji byt stejneho typu')  # exit(53)
+    return symb1, symb2
+
+
+def op_jumpifeq(enviroment, ins):
+    """JUMPIFEQ <label> <symb1> <symb2>"""
+    symb1, symb2 = get_comparable(enviroment, ins)  # exit(52/53/54/55/56)
+    if symb1.value == symb2.value:
+        return ins.target
+
+
+def op_jumpifneq(enviroment, ins):
+    """JUMPIFNEQ <label> <symb1> <symb2>"""
+    symb1, symb2 = get_comparable(enviroment, ins)  # exit(52/53/54/55/56)
+    if symb1.value != symb2.value:
+        return ins.target
+
+
+def get_bools(enviroment, ins):
+    """
+    Get target Variable and both bool operands of AND/OR.
+    # type: (Enviroment, Instruction) -> tuple
+    """
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if symb1.type != "bool" or symb2.type != "bool":
+        error(ins.order, 53, ins.opcode + ': arg2 a arg3 musi byt typu bool')  # exit(53)
+    return var, symb1, symb2
+
+
+def op_and(enviroment, ins):
+    """AND <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_bools(enviroment, ins)  # exit(53/54/55/56)
+    var.type = "bool"
+    var.value = symb1.value and symb2.value
+
+
+def op_or(enviroment, ins):
+    """OR <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_bools(enviroment, ins)  # exit(53/54/55/56)
+    var.type = "bool"
+    var.value = symb1.value or symb2.value
+
+
+def op_not(enviroment, ins):
+    """NOT <var> <symb>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    if symb.type != "bool":
+        error(ins.order, 53, 'NOT: arg2 musi byt typu bool')  # exit(53)
+    var.type = "bool"
+    var.value = not symb.value
+
+
+def get_relational(enviroment, ins):
+    """
+    Get target Variable and both operands of LT/GT/EQ, they have to be the same type.
+    # type: (Enviroment, Instruction) -> tuple
+    """
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb1 = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    symb2 = get_symb(enviroment, ins.order, ins.args[2])  # exit(54/55/56)
+    if symb1.type != symb2.type:
+        error(ins.order, 53, ins.opcode + ': arg2 a arg3 museji byt stejneho typu')  # exit(53)
+    return var, symb1, symb2
+
+
+def op_lt(enviroment, ins):
+    """LT <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_relational(enviroment, ins)  # exit(53/54/55/56)
+    var.type = "bool"
+    var.value = symb1.value < symb2.value
+
+
+def op_gt(enviroment, ins):
+    """GT <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_relational(enviroment, ins)  # exit(53/54/55/56)
+    var.type = "bool"
+    var.value = symb1.value > symb2.value
+
+
+def op_eq(enviroment, ins):
+    """EQ <var> <symb1> <symb2>"""
+    var, symb1, symb2 = get_relational(enviroment, ins)  # exit(53/54/55/56)
+    var.type = "bool"
+    var.value = symb1.value == symb2.value
+
+
+def op_read(enviroment, ins):
+    """READ <var> <type>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    typ = ins.args[1]
+    try:
+        inp = enviroment.reader.readline()
+    except (OSError, UnicodeDecodeError):
+        inp = None
+    var.type = typ
+    if typ == "int":
+        try:
+            var.value = int(inp)
+        except (ValueError, TypeError):
+            var.value = 0
+    elif typ == "string":
+        if inp is not None:
+            var.value = inp
+        else:
+            var.value = ""
+    elif typ == "bool":
+        var.value = inp == "true"
+    elif typ == "float":
+        try:
+            var.value = float.fromhex(inp)
+        except (ValueError, TypeError):
+            error(ins.order, 53, 'Hodnota "' + str(var.value) + '" neni typu float')  # exit(53)
+
+
+def op_int2float(enviroment, ins):
+    """INT2FLOAT <var> <symb>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    if symb.type != "int":
+        error(ins.order, 53, 'Hodnota "' + str(symb.value) + '" neni typu int')  # exit(53)
+    var.type = "float"
+    var.value = float(symb.value)
+
+
+def op_float2int(enviroment, ins):
+    """FLOAT2INT <var> <symb>"""
+    var = get_var(enviroment, ins.order, ins.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, ins.order, ins.args[1])  # exit(54/55/56)
+    if symb.type != "float":
+        error(ins.order, 53, 'Hodnota "' + str(symb.value) + '" neni typu float')  # exit(53)
+    var.type = "int"
+    var.value = int(symb.value)
+
+
+def op_clears(enviroment, ins):
+    """CLEARS"""
+    enviroment.stack_types.clear()
+    enviroment.stack_values.clear()
+
+
+# Stack instructions replace their operands directly in stack_types and stack_values: the second operand is
+# popped, the first one is overwritten by the result.
+
+def stack_underflow(ins, count):
+    """
+    Exit program because data stack does not contain enough values.
+    # type: (Instruction, int) -> None
+    """
+    if count == 1:
+        error(ins.order, 56, 'Na datovem zasobniku musi byt alespon 1 hodnota!')  # exit(56)
+    error(ins.order, 56, 'Na datovem zasobniku musi byt alespon 2 hodnoty!')  # exit(56)
+
+
+def pop_number(enviroment, ins):
+    """
+    Pop second operand of ADDS/SUBS/MULS/IDIVS, both operands have to be int or both float.
+    # type: (Enviroment, Instruction) -> int|float
+    """
+    types = enviroment.stack_types
+    if len(types) < 2:
+        stack_underflow(ins, 2)  # exit(56)
+    type2 = types.pop()
+    if type2 != types[-1] or (type2 != "int" and type2 != "float"):
+        error(ins.order, 53, ins.opcode + ': arg2 a arg3 musi byt typu int a int nebo typu float a float')  # exit(53)
+    return enviroment.stack_values.pop()
+
+
+def op_adds(enviroment, ins):
+    """ADDS"""
+    value2 = pop_number(enviroment, ins)  # exit(53/56)
+    enviroment.stack_values[-1] += value2
+
+
+def op_subs(enviroment, ins):
+    """SUBS"""
+    value2 = pop_number(enviroment, ins)  # exit(53/56)
+    enviroment.stack_values[-1] -= value2
+
+
+def op_muls(enviroment, ins):
+    """MULS"""
+    value2 = pop_number(enviroment, ins)  # exit(53/56)
+    enviroment.stack_values[-1] *= value2
+
+
+def op_idivs(enviroment, ins):
+    """IDIVS"""
+    value2 = pop_number(enviroment, ins)  # exit(53/56)
+    if value2 == 0:
+        error(ins.order, 57, "IDIV: Deleni nulou")  # exit(57)
+    enviroment.stack_values[-1] //= value2
+
+
+def pop_relational(enviroment, ins):
+    """
+    Pop second operand of LTS/GTS/EQS/JUMPIFEQS/JUMPIFNEQS, both operands have to be the same type.
+    # type: (Enviroment, Instruction) -> object
+    """
+    types = enviroment.stack_types
+    if len(types) < 2:
+        stack_underflow(ins, 2)  # exit(56)
+    if types.pop() != types[-1]:
+        error(ins.order, 53, ins.opcode + ': arg2 a arg3 museji byt stejneho typu')  # exit(53)
+    return enviroment.stack_values.pop()
+
+
+def op_lts(enviroment, ins):
+    """LTS"""
+    value2 = pop_relational(enviroment, ins)  # exit(53/56)
+    enviroment.stack_types[-1] = "bool"
+    enviroment.stack_values[-1] = enviroment.stack_values[-1] < value2
+
+
+def op_gts(enviroment, ins):
+    """GTS"""
+    value2 = pop_relational(enviroment, ins)  # exit(53/56)
+    enviroment.stack_types[-1] = "bool"
+    enviroment.stack_values[-1] = enviroment.stack_values[-1] > value2
+
+
+def op_eqs(enviroment, ins):
+    """EQS"""
+    value2 = pop_relational(enviroment, ins)  # exit(53/56)
+    enviroment.stack_types[-1] = "bool"
+    enviroment.stack_values[-1] = enviroment.stack_values[-1] == value2
+
+
+def pop_bool(enviroment, ins):
+    """
+    Pop second operand of ANDS/ORS, both operands have to be bool.
+    # type: (Enviroment, Instruction) -> bool
+    """
+    types = enviroment.stack_types
+    if len(types) < 2:
+        stack_underflow(ins, 2)  # exit(56)
+    if types.pop() != "bool" or types[-1] != "bool":
+        error(ins.order, 53, ins.opcode + ': arg2 a arg3 musi byt typu bool')  # exit(53)
+    return enviroment.stack_values.pop()
+
+
+def op_ands(enviroment, ins):
+    """ANDS"""
+    value2 = pop_bool(enviroment, ins)  # exit(53/56)
+    enviroment.stack_values[-1] = enviroment.stack_values[-1] and value2
+
+
+def op_ors(enviroment, ins):
+    """ORS"""
+    value2 = pop_bool(enviroment, ins)  # exit(53/56)
+    enviroment.stack_values[-1] = enviroment.stack_values[-1] or value2
+
+
+def op_nots(enviroment, ins):
+    """NOTS"""
+    if len(enviroment.stack_types) < 1:
+        stack_underflow(ins, 1)  # exit(56)
+    if enviroment.stack_types[-1] != "bool":
+        error(ins.order, 53, 'NOT: arg2 musi byt typu bool')  # exit(53)
+    enviroment.stack_values[-1] = not enviroment.stack_values[-1]
+
+
+def op_int2chars(enviroment, ins):
+    """INT2CHARS"""
+    types = enviroment.stack_types
+    if len(types) < 1:
+        stack_underflow(ins, 1)  # exit(56)
+    try:
+        if types[-1] != "int":
+            raise ValueError
+        enviroment.stack_values[-1] = chr(enviroment.stack_values[-1])
+    except ValueError:
+        error(ins.order, 58,
+              "Hodnota na datovem zasobniku pro instrukci INT2CHAR musi byt hodnotou Unicode")  # exit(58)
+    types[-1] = "string"
+
+
+def op_stri2ints(enviroment, ins):
+    """STRI2INTS"""
+    types = enviroment.stack_types
+    values = enviroment.stack_values
+    if len(types) < 2:
+        stack_underflow(ins, 2)  # exit(56)
+    if types.pop() != "int" or types[-1] != "string":
+        error(ins.order, 53, 'STRI2INT: arg2 musi byt retezec a arg3 cele cislo')  # exit(53)
+    index = values.pop()
+    if index < 0 or index >= len(values[-1]):
+        error(ins.order, 58, 'STRI2INT: pristup mimo rozsah retezce')  # exit(58)
+    types[-1] = "int"
+    values[-1] = ord(values[-1][index])
+
+
+def op_jumpifeqs(enviroment, ins):
+    """JUMPIFEQS <label>"""
+    if ins.target is None:
+        error(ins.order, 52, 'Navesti "' + ins.args[0] + '" nenalezeno')  # exit(52)
+    value2 = pop_relational(enviroment, ins)  # exit(53/56)
+    enviroment.stack_types.pop()
+    if enviroment.stack_values.pop() == value2:
+        return ins.target
+
+
+def op_jumpifneqs(enviroment, ins):
+    """JUMPIFNEQS <label>"""
+    if ins.target is None:
+        error(ins.order, 52, 'Navesti "' + ins.args[0] + '" nenalezeno')  # exit(52)
+    value2 = pop_relational(enviroment, ins)  # exit(53/56)
+    enviroment.stack_types.pop()
+    if enviroment.stack_values.pop() != value2:
+        return ins.target
+
+
+# Superinstructions made by peephole(). They add fused instructions to i_count except the last one (added by
+# execute) and return index of the next instruction. When the fast path cannot be used, fused instructions are
+# executed one by one, so errors are reported by their own handlers.
+
+FUSED_COMPARE = {"LT": operator.lt, "GT": operator.gt, "EQ": operator.eq}
+FUSED_STACK = {  # opcode: (allowed types of operands or None for any type, operation, type of result or None)
+    "ADDS": (("int", "float"), operator.add, None),
+    "SUBS": (("int", "float"), operator.sub, None),
+    "MULS": (("int", "float"), operator.mul, None),
+    "IDIVS": (("int", "float"), operator.floordiv, None),
+    "LTS": (None, operator.lt, "bool"),
+    "GTS": (None, operator.gt, "bool"),
+    "EQS": (None, operator.eq, "bool"),
+    "ANDS": (("bool",), operator.and_, "bool"),
+    "ORS": (("bool",), operator.or_, "bool"),
+}
+
+
+def run_fused(enviroment, ins):
+    """
+    Execute instructions fused into superinstruction one by one.
+    # type: (Enviroment, Instruction) -> int
+    """
+    for original in ins.fused[:-1]:
+        HANDLERS[original.op](enviroment, original)
+        enviroment.i_count += 1
+    last = ins.fused[-1]
+    target = HANDLERS[last.op](enviroment, last)
+    return last.order if target is None else target
+
+
+def op_cmpjump(enviroment, ins):
+    """LT/GT/EQ <var> <symb1> <symb2> followed by JUMPIFEQ/JUMPIFNEQ <label> <var> bool@..."""
+    ins.hits += 1
+    compare, jump = ins.fused
+    var, symb1, symb2 = get_relational(enviroment, compare)  # exit(53/54/55/56)
+    var.type = "bool"
+    var.value = ins.args[0](symb1.value, symb2.value)
+    enviroment.i_count += 1
+    if var.value == ins.args[1]:
+        return ins.target
+    return jump.order
+
+
+def op_stackop(enviroment, ins):
+    """PUSHS <symb1>, PUSHS <symb2>, binary stack instruction and POPS <var>"""
+    ins.hits += 1
+    push1, push2, _, pop = ins.fused
+    allowed, operation, result = ins.args
+    depth = len(enviroment.stack_types)  # operands are not pushed, but they count for the peak depth
+    symb1 = get_symb(enviroment, push1.order, push1.args[0])  # exit(54/55/56)
+    if depth + 1 > enviroment.stack_peak:
+        enviroment.stack_peak = depth + 1
+        if depth + 1 > enviroment.max_stack:
+            stack_limit(enviroment, push1)  # exit(61)
+    enviroment.i_count += 1  # instructions are counted as they succeed, like unfused ones when one fails
+    symb2 = get_symb(enviroment, push2.order, push2.args[0])  # exit(54/55/56)
+    if depth + 2 > enviroment.stack_peak:
+        enviroment.stack_peak = depth + 2
+        if depth + 2 > enviroment.max_stack:
+            stack_limit(enviroment, push2)  # exit(61)
+    enviroment.i_count += 1
+    typ = symb1.type
+    if typ != symb2.type or (allowed is not None and typ not in allowed) or \
+            (operation is operator.floordiv and symb2.value == 0):
+        enviroment.i_count -= 2  # run_fused pushes the operands again and counts them
+        return run_fused(enviroment, ins)  # exit(53/57)
+    enviroment.i_count += 1
+    var = get_var(enviroment, pop.order, pop.args[0])  # exit(54/55)
+    var.value = operation(symb1.value, symb2.value)
+    var.type = typ if result is None else result
+    return pop.order
+
+
+def op_moveop(enviroment, ins):
+    """MOVE <var> <symb> followed by instruction reading the var"""
+    ins.hits += 1
+    move, consumer = ins.fused
+    var = get_var(enviroment, move.order, move.args[0])  # exit(54/55)
+    symb = get_symb(enviroment, move.order, move.args[1])  # exit(54/55/56)
+    var.type = symb.type
+    var.value = symb.value
+    enviroment.i_count += 1
+    target = HANDLERS[consumer.op](enviroment, consumer)
+    return consumer.order if target is None else target
+
+
+def op_invalid(enviroment, ins):
+    """Instruction which failed to decode"""
+    report_invalid(enviroment, ins)  # exit(31/32/53/54/55/56)
+
+
+# Handler of every opcode, HANDLERS is indexed by opcode id (index in OPCODES)
+HANDLER_BY_NAME = {
+    "MOVE": op_move,
+    "CREATEFRAME": op_createframe,
+    "PUSHFRAME": op_pushframe,
+    "POPFRAME": op_popframe,
+    "DEFVAR": op_defvar,
+    "CALL": op_call,
+    "RETURN": op_return,
+    "PUSHS": op_pushs,
+    "POPS": op_pops,
+    "ADD": op_add,
+    "SUB": op_sub,
+    "MUL": op_mul,
+    "IDIV": op_idiv,
+    "LT": op_lt,
+    "GT": op_gt,
+    "EQ": op_eq,
+    "AND": op_and,
+    "OR": op_or,
+    "NOT": op_not,
+    "INT2CHAR": op_int2char,
+    "STRI2INT": op_stri2int,
+    "READ": op_read,
+    "WRITE": op_write,
+    "CONCAT": op_concat,
+    "STRLEN": op_strlen,
+    "GETCHAR": op_getchar,
+    "SETCHAR": op_setchar,
+    "TYPE": op_type,
+    "LABEL": op_label,
+    "JUMP": op_jump,
+    "JUMPIFEQ": op_jumpifeq,
+    "JUMPIFNEQ": op_jumpifneq,
+    "DPRINT": op_dprint,
+    "BREAK": op_break,
+    "INT2FLOAT": op_int2float,
+    "FLOAT2INT": op_float2int,
+    "CLEARS": op_clears,
+    "ADDS": op_adds,
+    "SUBS": op_subs,
+    "MULS": op_muls,
+    "IDIVS": op_idivs,
+    "LTS": op_lts,
+    "GTS": op_gts,
+    "EQS": op_eqs,
+    "ANDS": op_ands,
+    "ORS": op_ors,
+    "NOTS": op_nots,
+    "INT2CHARS": op_int2chars,
+    "STRI2INTS": op_stri2ints,
+    "JUMPIFEQS": op_jumpifeqs,
+    "JUMPIFNEQS": op_jumpifneqs,
+    "INVALID": op_invalid,
+    "TAILCALL": op_tailcall,
+    "CMPJUMP": op_cmpjump,
+    "STACKOP": op_stackop,
+    "MOVEOP": op_moveop,
+}
+HANDLERS = [HANDLER_BY_NAME[name] for name in OPCODES]
+
+
+def ends_block(ins):
+    """
+    Check whether the instruction may continue elsewhere than at the following instruction.
+    # type: (Instruction) -> bool
+    """
+    if ins.opcode in JUMPS or ins.opcode == "CMPJUMP":
+        return True
+    return ins.fused is not None and ends_block(ins.fused[-1])  # MOVEOP followed by jump
+
+
+def make_block(code, blocks, start):
+    """
+    Make Block of instructions from index start to the next jump or to the next block in blocks.
+    # type: (list, list, int) -> Block
+    """
+    block = []
+    i = start
+    while True:
+        ins = code[i]
+        block.append(ins)
+        i += 1 if ins.fused is None else len(ins.fused)  # superinstruction continues after the fused ones
+        if i >= len(code) or blocks[i] is not None or ends_block(ins):
+            return Block(block)
+
+
+def split_blocks(code):
+    """
+    Split program into basic blocks at jump targets, after jumps, calls and returns and before BREAK (it prints
+    number of executed instructions). Return list of Blocks indexed by index of their first instruction
+    (None elsewhere), it has one more item for the end of program.
+    # type: (list) -> list
+    """
+    leaders = {0}
+    for i, ins in enumerate(code):
+        if ins.target is not None:
+            leaders.add(ins.target)
+        if ends_block(ins):
+            leaders.add(i + (1 if ins.fused is None else len(ins.fused)))
+        if ins.opcode == "BREAK":
+            leaders.add(i)
+    blocks = [None] * (len(code) + 1)
+    for i in leaders:
+        if i < len(code):
+            blocks[i] = True  # placeholder, blocks end before it
+    for i in sorted(leaders, reverse=True):
+        if i < len(code):
+            blocks[i] = make_block(code, blocks, i)
+    for block in blocks:
+        if block is not None:
+            following = block.last.order if block.last.fused is None else block.last.fused[-1].order
+            block.next = blocks[following]
+    return blocks
+
+
+def save_frame(frame):
+    """
+    Get frame as plain list for checkpoint: number of variables and (type, value) or None of every slot,
+    SparseFrame as plain dict {0: number of variables, slot: (type, value)}.
+    # type: (list|SparseFrame) -> list|dict
+    """
+    if frame.__class__ is SparseFrame:
+        return {slot: (var.type, var.value) if slot else var for slot, var in frame.items()}
+    return [frame[0]] + [None if var is None else (var.type, var.value) for var in frame[1:]]
+
+
+def load_frame(frame):
+    """
+    Get frame from list or dict made by save_frame.
+    # type: (list|dict) -> list|SparseFrame
+    """
+    if frame.__class__ is dict:
+        return SparseFrame((slot, Variable(var[0], var[1]) if slot else var) for slot, var in frame.items())
+    return [frame[0]] + [None if var is None else Variable(var[0], var[1]) for var in frame[1:]]
+
+
+def write_checkpoint(enviroment):
+    """
+    Write state of run to checkpoint file: frames, stacks, next instruction, statistics and lines of input
+    read so far. State is pickled and compressed into temporary file, which then replaces the checkpoint.
+    # type: (Enviroment) -> None
+    """
+    checkpoint = enviroment.checkpoint
+    state = {
+        "digest": checkpoint.digest,
+        "ip": enviroment.ip,
+        "gf": save_frame(enviroment.gf),
+        "lf": None if enviroment.lf is None else [save_frame(frame) for frame in enviroment.lf],
+        "tf": None if enviroment.tf is None else save_frame(enviroment.tf),
+        "stack": (enviroment.stack_types, enviroment.stack_values),
+        "call": (enviroment.call.tobytes(), enviroment.call_tail),
+        "stats": (enviroment.i_count, enviroment.vars, enviroment.v_count, enviroment.frames,
+                  enviroment.frame_peak, enviroment.stack_peak, enviroment.call_peak),
+        "input": enviroment.reader.count,
+    }
+    data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+    directory = os.path.dirname(os.path.abspath(checkpoint.path))
+    (fd, temppath) = tempfile.mkstemp(".tmp", os.path.basename(checkpoint.path), directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temppath, checkpoint.path)
+    except BaseException:
+        os.unlink(temppath)
+        raise
+
+
+def save_checkpoint(enviroment, background=True):
+    """
+    Write checkpoint of enviroment at the start of instruction enviroment.ip, output is flushed before.
+
+    In background the checkpoint is written by forked process from its copy of memory, so the program goes on
+    immediately. Checkpoint is skipped when the previous one is still being written.
+    # type: (Enviroment, bool) -> None
+    """
+    checkpoint = enviroment.checkpoint
+    enviroment.writer.flush()
+    if checkpoint.pid is not None:
+        pid, status = os.waitpid(checkpoint.pid, os.WNOHANG if background else 0)
+        if pid == 0:
+            return
+        checkpoint.pid = None
+        if status != 0:
+            raise InputFileError('Chyba pri zapisu checkpointu "' + checkpoint.path + '"')
+    if background and hasattr(os, "fork"):
+        pid = os.fork()
+        if pid != 0:
+            checkpoint.pid = pid
+            return
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            write_checkpoint(enviroment)
+        except BaseException:
+            os._exit(1)
+        os._exit(0)
+    try:
+        write_checkpoint(enviroment)
+    except OSError:
+        raise InputFileError('Chyba pri zapisu checkpointu "' + checkpoint.path + '"')
+
+
+def load_checkpoint(filepath, digest):
+    """
+    Read state of run from checkpoint file written for program source with digest.
+    # type: (str, str) -> dict
+    """
+    try:
+        with open(filepath, "rb") as file:
+            state = pickle.loads(zlib.decompress(file.read()))
+    except Exception:  # missing or damaged file
+        raise InputFileError('Checkpoint "' + filepath + '" nelze nacist')
+    if state.get("digest") != digest:
+        raise InputFileError('Checkpoint "' + filepath + '" nepatri k programu nebo verzi interpretu')
+    return state
+
+
+def restore_state(enviroment, state):
+    """
+    Restore state of run from checkpoint into new enviroment, lines of input read before are skipped.
+    # type: (Enviroment, dict) -> None
+    """
+    enviroment.ip = state["ip"]
+    enviroment.gf = load_frame(state["gf"])
+    enviroment.lf = None if state["lf"] is None else [load_frame(frame) for frame in state["lf"]]
+    enviroment.tf = None if state["tf"] is None else load_frame(state["tf"])
+    enviroment.stack_types, enviroment.stack_values = state["stack"]
+    enviroment.call.frombytes(state["call"][0])
+    enviroment.call_tail = state["call"][1]
+    (enviroment.i_count, enviroment.vars, enviroment.v_count, enviroment.frames, enviroment.frame_peak,
+     enviroment.stack_peak, enviroment.call_peak) = state["stats"]
+    try:
+        for _ in range(state["input"]):
+            enviroment.reader.readline()
+    except (OSError, UnicodeDecodeError):
+        pass  # READ gets no more input, as it would without checkpoint
+    if enviroment.checkpoint is not None:
+        enviroment.checkpoint.due = enviroment.i_count + enviroment.checkpoint.interval
+    enviroment.check_at = next_check(enviroment)
+
+
+def next_check(enviroment):
+    """
+    Get number of executed instructions after which limits of instructions and time are checked and checkpoint
+    is written next time.
+    # type: (Enviroment) -> int
+    """
+    limits = enviroment.limits
+    check_at = limits.insts or sys.maxsize
+    if limits.timeout or enviroment.checkpoint is not None:
+        check_at = min(check_at, enviroment.i_count + LIMIT_INTERVAL)
+    if enviroment.quantum_end is not None:
+        check_at = min(check_at, enviroment.quantum_end)
+    return check_at
+
+
+def check_run(enviroment):
+    """
+    Check limits of executed instructions and time of run, raise LimitError when one of them is exceeded.
+    Write checkpoint when it is due, or write it and raise StoppedError when the program has to stop. Raise
+    Preempted when the quantum of session is used. Return number of executed instructions after which the run
+    is checked next time.
+    # type: (Enviroment) -> int
+    """
+    limits = enviroment.limits
+    if limits.insts and enviroment.i_count > limits.insts:
+        raise InstructionLimitError("Prekrocen limit " + str(limits.insts) + " vykonanych instrukci")  # exit(60)
+    if enviroment.deadline is not None and time.monotonic() > enviroment.deadline:
+        raise TimeLimitError("Prekrocen casovy limit " + str(limits.timeout) + " s")  # exit(64)
+    checkpoint = enviroment.checkpoint
+    if checkpoint is not None:
+        if checkpoint.stop:
+            save_checkpoint(enviroment, False)  # exit(11)
+            raise StoppedError('Program zastaven, stav ulozen do "' + checkpoint.path + '"')  # exit(65)
+        if checkpoint.interval and enviroment.i_count >= checkpoint.due:
+            save_checkpoint(enviroment)  # exit(11)
+            checkpoint.due = enviroment.i_count + checkpoint.interval
+    if enviroment.quantum_end is not None and enviroment.i_count > enviroment.quantum_end:
+        raise Preempted
+    enviroment.check_at = next_check(enviroment)
+    return enviroment.check_at
+
+
+def execute(enviroment):
+    """
+    Execute decoded program from enviroment.ip until the end of program.
+
+    Program runs by basic blocks: handlers of the block are called one after another and number of executed
+    instructions is updated once per block, limits of instructions and time are checked then too. Handler
+    is found by opcode id, so the dispatch cost does not depend on the opcode. When an instruction fails,
+    the instructions of its block executed before it are counted. Buffered output is written also when
+    the program exits with error.
+    # type: (Enviroment) -> None
+    """
+    program = enviroment.program
+    if program.blocks is None:
+        program.blocks = split_blocks(program.code)
+    blocks = program.blocks
+    handlers = HANDLERS
+    block = blocks[enviroment.ip]
+    if block is None and enviroment.ip < len(program.code):
+        block = make_block(program.code, blocks, enviroment.ip)  # start inside a block
+        block.next = blocks[block.last.order if block.last.fused is None else block.last.fused[-1].order]
+    check_at = enviroment.check_at
+    ins = None
+    try:
+        while block is not None:
+            for ins in block.body:
+                handlers[ins.op](enviroment, ins)  # returns None or index of the following instruction
+            ins = block.last
+            target = handlers[ins.op](enviroment, ins)
+            enviroment.i_count += block.length
+            block = block.next if target is None else blocks[target]
+            if enviroment.i_count > check_at:
+                ins = None  # no instruction of the block failed
+                enviroment.ip = len(program.code) if block is None else block.start
+                check_at = check_run(enviroment)  # exit(11/60/64/65)
+    except BaseException:
+        if block is not None and (ins is block.last or ins in block.body):
+            enviroment.i_count += block.length - 1 if ins is block.last else block.body.index(ins)
+            enviroment.ip = ins.order - 1
+        raise
+    finally:
+        enviroment.writer.flush()
+    enviroment.ip = len(program.code)
+
+
+def execute_profiled(enviroment, profile):
+    """
+    Execute program like execute() and measure every instruction into profile.
+
+    Clock is read once per instruction, so the time of instruction includes the dispatch of it.
+    # type: (Enviroment, Profile) -> None
+    """
+    code = enviroment.program.code
+    handlers = HANDLERS
+    end = len(code)
+    ip = enviroment.ip
+    counts = profile.counts
+    times = profile.times
+    back = profile.back
+    clock = time.perf_counter
+    check_at = enviroment.check_at
+    try:
+        last = clock()
+        while ip < end:
+            ins = code[ip]
+            target = handlers[ins.op](enviroment, ins)
+            now = clock()
+            counts[ip] += 1
+            times[ip] += now - last
+            last = now
+            if target is None:
+                ip = ins.order
+            else:
+                if target <= ip and ins.opcode in LOOP_JUMPS:
+                    back[ip] = back.get(ip, 0) + 1
+                ip = target
+            enviroment.i_count += 1
+            if enviroment.i_count > check_at:
+                enviroment.ip = ip
+                check_at = check_run(enviroment)  # exit(11/60/64/65)
+    finally:
+        enviroment.writer.flush()
+    enviroment.ip = ip
+
+
+def execute_sampled(enviroment, samples):
+    """
+    Execute program like execute() and sample call stack before every interval-th instruction.
+    # type: (Enviroment, Samples) -> None
+    """
+    code = enviroment.program.code
+    handlers = HANDLERS
+    end = len(code)
+    ip = enviroment.ip
+    call = OPCODE_ID["CALL"]
+    ret = OPCODE_ID["RETURN"]
+    interval = samples.interval
+    left = interval
+    check_at = enviroment.check_at
+    try:
+        while ip < end:
+            left -= 1
+            if left == 0:
+                left = interval
+                samples.sample()
+            ins = code[ip]
+            target = handlers[ins.op](enviroment, ins)
+            if target is None:
+                ip = ins.order
+            else:
+                if ins.op == call:
+                    samples.enter(ins.args[0])
+                elif ins.op == ret:
+                    samples.leave()
+                ip = target
+            enviroment.i_count += 1
+            if enviroment.i_count > check_at:
+                enviroment.ip = ip
+                check_at = check_run(enviroment)  # exit(11/60/64/65)
+    finally:
+        enviroment.writer.flush()
+    enviroment.ip = ip
+
+
+def trace_operand(value):
+    """
+    Get kind and 64-bit value of recorded value for trace record.
+    # type: (object) -> tuple
+    """
+    cls = value.__class__
+    if cls is tuple:
+        return value
+    if value is None:
+        return TRACE_UNSET, 0
+    if cls is str:
+        return TRACE_KINDS["string"], len(value)
+    if cls is float:
+        return TRACE_KINDS["float"], TRACE_FLOAT_BITS.unpack(TRACE_FLOAT.pack(value))[0]
+    if cls is bool:
+        return TRACE_KINDS["bool"], int(value)
+    if not TRACE_INT_MIN <= value <= TRACE_INT_MAX:
+        return TRACE_KINDS["int"] | TRACE_CLIPPED, TRACE_INT_MAX if value > 0 else TRACE_INT_MIN
+    return TRACE_KINDS["int"], value
+
+
+TRACE_FLOAT = struct.Struct("<d")
+TRACE_FLOAT_BITS = struct.Struct("<q")
+TRACE_INT_MIN = -(1 << 63)
+TRACE_INT_MAX = (1 << 63) - 1
+TRACE_NONE = (0, 0)  # recorded missing operand
+TRACE_MISSING = (TRACE_UNDEFINED, 0)  # recorded undefined variable
+TRACE_STACK_OPS = {OPCODE_ID[name] for name in SIGNATURES if name.endswith("S") and name != "PUSHS"}
+
+
+def trace_plans(code):
+    """
+    Get operands recorded for every instruction: tuple of (item of record, frame, slot) of its variable operands
+    and number of its free operands taken from data stack (stack instructions except PUSHS).
+    # type: (list) -> list
+    """
+    plans = []
+    for ins in code:
+        refs = tuple((k, arg.frame, arg.slot) for k, arg in enumerate(ins.args, 1) if arg.__class__ is VarRef)
+        plans.append((refs, 3 - len(ins.args) if ins.op in TRACE_STACK_OPS else 0))
+    return plans
+
+
+def trace_var(enviroment, frame, slot):
+    """
+    Get variable of local or temporary frame for trace record, None when the frame does not exist.
+    # type: (Enviroment, int, int) -> Variable|None
+    """
+    if frame == LF:
+        return None if enviroment.lf is None else enviroment.lf[-1][slot]
+    return None if enviroment.tf is None else enviroment.tf[slot]
+
+
+def trace_stack(enviroment, records, index, free):
+    """
+    Record values from the top of data stack as the last free operands of record starting at index.
+    # type: (Enviroment, list, int, int) -> None
+    """
+    stack_values = enviroment.stack_values
+    index += 4 - free
+    for depth in range(1, free + 1):
+        records[index] = stack_values[-depth] if depth <= len(stack_values) else TRACE_NONE
+        index += 1
+
+
+def trace_special(var):
+    """
+    Get recorded value of variable which is not plain Variable: undefined one or edited string.
+    # type: (Variable|None) -> tuple|str
+    """
+    if var is None:
+        return TRACE_MISSING
+    if var.__class__ is StringBuffer:
+        return TRACE_KINDS["string"], len(get_chars(var))
+    return var.value
+
+
+def execute_traced(enviroment, trace):
+    """
+    Execute program by basic blocks like execute() and record every instruction into trace before it is
+    executed, so the last record of failed program is the failing instruction. Only index of instruction
+    and values of its variables are stored for every instruction, records are built when the trace is written.
+    # type: (Enviroment, Trace) -> None
+    """
+    program = enviroment.program
+    if program.blocks is None:
+        program.blocks = split_blocks(program.code)
+    blocks = program.blocks
+    handlers = HANDLERS
+    block = blocks[enviroment.ip]
+    if block is None and enviroment.ip < len(program.code):
+        block = make_block(program.code, blocks, enviroment.ip)  # start inside a block
+        block.next = blocks[block.last.order if block.last.fused is None else block.last.fused[-1].order]
+    plans = trace_plans(program.code)
+    runs = {}  # {Block: [(instruction, its index, its plan)]}
+    trace.code = program.code
+    records = trace.records
+    end = len(records)
+    gf = enviroment.gf
+    count = trace.count
+    pos = count % trace.size * 4
+    check_at = enviroment.check_at
+    ins = None
+    try:
+        while block is not None:
+            run = runs.get(block)
+            if run is None:
+                run = runs[block] = [(ins, ins.order - 1) + plans[ins.order - 1] for ins in block.body + [block.last]]
+            first = count  # records before the block
+            for ins, ip, refs, free in run:
+                records[pos] = ip
+                for k, frame, slot in refs:
+                    var = gf[slot] if frame == GF else trace_var(enviroment, frame, slot)
+                    records[pos + k] = var.value if var.__class__ is Variable else trace_special(var)
+                if free:
+                    trace_stack(enviroment, records, pos, free)
+                count += 1
+                pos += 4
+                if pos == end:
+                    pos = 0
+                target = handlers[ins.op](enviroment, ins)  # only the last instruction of block jumps
+            trace.count = count
+            enviroment.i_count += block.length
+            block = block.next if target is None else blocks[target]
+            if enviroment.i_count > check_at:
+                ins = None  # no instruction of the block failed
+                enviroment.ip = len(program.code) if block is None else block.start
+                check_at = check_run(enviroment)  # exit(11/60/64/65)
+    except BaseException:
+        trace.count = count
+        if ins is not None:
+            enviroment.i_count += count - first - 1  # instructions of the block before the failing one
+            enviroment.ip = ins.order - 1
+        raise
+    finally:
+        enviroment.writer.flush()
+    enviroment.ip = len(program.code)
+
+
+# COMPILER #
+# Hot basic blocks are translated into Python source, every block becomes a function returning index of the next
+# instruction. Instruction runs a fast path which only reads operands and checks them, its result is stored when
+# all checks passed. Otherwise the handler of the instruction is called, it executes the instruction again from
+# the beginning and reports the same errors in the same order as the interpreter. Instructions without fast path
+# (frames, calls, READ, stack instructions...) always call their handler.
+
+class SlowPath(Exception):
+    """The exception leaves fast path of compiled instruction, the instruction is then executed by its handler"""
+
+
+SLOW_PATH = (SlowPath, AttributeError, TypeError)  # operand is None or frame does not exist
+JUMPS = ("JUMP", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS", "CALL", "TAILCALL", "RETURN")
+ARITHMETIC = {"ADD": "+", "SUB": "-", "MUL": "*", "IDIV": "//"}
+RELATIONAL = {"LT": "<", "GT": ">", "EQ": "=="}
+
+
+def gen_var(ref, name):
+    """
+    Generate line loading Variable of VarRef into local name, missing frame raises TypeError.
+    # type: (VarRef, str) -> str
+    """
+    frame = ("gf", "env.lf[-1]", "env.tf")[ref.frame]
+    return name + " = " + frame + "[" + str(ref.slot) + "]"
+
+
+def gen_symb(symb, name, constants):
+    """
+    Generate access to decoded symb operand.
+
+    Return lines loading the operand, expression of its type, expression of its value and type known
+    at compile time (None for variable).
+    # type: (Variable|VarRef, str, list) -> tuple
+    """
+    if symb.__class__ is VarRef:
+        return [gen_var(symb, name)], name + ".type", name + ".value", None
+    if symb.type == "float":
+        constants.append(symb.value)
+        value = "C[" + str(len(constants)-1) + "]"
+    else:
+        value = repr(symb.value)
+    return [], repr(symb.type), value, symb.type
+
+
+def gen_check(types, static, allowed):
+    """
+    Generate checks that operands have the same type from allowed (None = any type).
+
+    Return (lines, type expression), lines are None when the check fails at compile time.
+    # type: (list, list, tuple|None) -> tuple
+    """
+    known = [t for t in static if t is not None]
+    if known:
+        if any(t != known[0] for t in known) or (allowed is not None and known[0] not in allowed):
+            return None, None
+        checks = [typ + " != " + repr(known[0]) for typ, t in zip(types, static) if t is None]
+        lines = ["if " + " or ".join(checks) + ": raise Slow"] if checks else []
+        return lines, repr(known[0])
+    lines = ["t = " + types[0]]
+    checks = ["t != " + typ for typ in types[1:]]
+    if allowed is None:
+        checks.append("t is None")
+    else:
+        checks.append("(" + " and ".join("t != " + repr(t) for t in allowed) + ")")
+    return lines + ["if " + " or ".join(checks) + ": raise Slow"], "t"
+
+
+def gen_fast(ins, constants):
+    """
+    Generate fast path of instruction.
+
+    Return (lines reading and checking operands, lines storing result) or None if the instruction has no fast
+    path or it would always fail.
+    # type: (Instruction, list) -> tuple|None
+    """
+    opcode = OPCODES[ins.op]
+    args = ins.args
+    if opcode in ("MOVE", "TYPE", "STRLEN", "NOT", "INT2CHAR", "ADD", "SUB", "MUL", "IDIV", "LT", "GT", "EQ",
+                  "AND", "OR", "CONCAT", "GETCHAR", "STRI2INT", "SETCHAR", "POPS"):
+        read = [gen_var(args[0], "d")]
+        if opcode != "SETCHAR":
+            read.append("if d is None: raise Slow")
+        symbs = [gen_symb(symb, "s" + str(i), constants) for i, symb in enumerate(args[1:], 1)]
+        for lines, _, _, _ in symbs:
+            read += lines
+        types = [typ for _, typ, _, _ in symbs]
+        values = [value for _, _, value, _ in symbs]
+        static = [t for _, _, _, t in symbs]
+    elif opcode in ("WRITE", "PUSHS"):
+        read, types, values, static = gen_symb(args[0], "s", constants)
+        types, values, static = [types], [values], [static]
+        if opcode == "PUSHS":
+            read.append("if len(ST) >= env.max_stack: raise Slow")  # limit is reported by handler
+    elif opcode == "LABEL" or (opcode == "JUMP" and ins.target is not None):
+        return [], []
+    elif opcode in ("JUMPIFEQ", "JUMPIFNEQ"):
+        if ins.target is None:
+            return None
+        symbs = [gen_symb(symb, "s" + str(i), constants) for i, symb in enumerate(args[1:], 1)]
+        read = symbs[0][0] + symbs[1][0]
+        types = [symbs[0][1], symbs[1][1]]
+        values = [symbs[0][2], symbs[1][2]]
+        static = [symbs[0][3], symbs[1][3]]
+    else:
+        return None
+
+    if opcode in ("MOVE", "WRITE", "PUSHS"):
+        check, typ = gen_check(types, static, None)
+        read += check
+        read.append("v = " + values[0])
+        if opcode == "MOVE":
+            return read, ["d.type = " + typ, "d.value = v"]
+        elif opcode == "PUSHS":
+            return read, ["ST.append(" + typ + ")", "SV.append(v)",
+                          "if len(ST) > env.stack_peak: env.stack_peak = len(ST)"]
+        if static[0] == "bool":
+            read.append('v = "true\\n" if v else "false\\n"')
+        elif static[0] is not None:
+            read.append('v = str(v) + "\\n"')
+        else:
+            read.append('v = ("true\\n" if v else "false\\n") if t == "bool" else str(v) + "\\n"')
+        return read, ["write(v)"]
+    elif opcode == "TYPE":
+        if static[0] is not None:
+            return read, ['d.type = "string"', "d.value = " + repr(static[0])]
+        read.append("if s1 is None or s1.__class__ is StringBuffer: raise Slow")  # undefined variable
+        read.append('v = s1.type if s1.type is not None and s1.value is not None else ""')
+        return read, ['d.type = "string"', "d.value = v"]
+    elif opcode == "POPS":
+        return read + ["if not ST: raise Slow"], ["d.type = ST.pop()", "d.value = SV.pop()"]
+    elif opcode in ("JUMPIFEQ", "JUMPIFNEQ"):
+        check, typ = gen_check(types, static, None)
+        if check is None:
+            return None
+        operator = " == " if opcode == "JUMPIFEQ" else " != "
+        return read + check + ["c = " + values[0] + operator + values[1]], []
+
+    allowed = {"STRLEN": ("string",), "NOT": ("bool",), "INT2CHAR": ("int",), "AND": ("bool",), "OR": ("bool",),
+               "CONCAT": ("string",)}.get(opcode, ("int", "float"))
+    if opcode in RELATIONAL:
+        allowed = None
+    if opcode in ("GETCHAR", "STRI2INT", "SETCHAR"):
+        first, second = ("int", "string") if opcode == "SETCHAR" else ("string", "int")
+        check1, _ = gen_check(types[:1], static[:1], (first,))
+        check2, _ = gen_check(types[1:], static[1:], (second,))
+        if check1 is None or check2 is None:
+            return None
+        read += check1 + check2
+    else:
+        check, typ = gen_check(types, static, allowed)
+        if check is None:
+            return None
+        read += check
+
+    if opcode in ARITHMETIC:
+        if opcode == "IDIV":
+            read.append("if " + values[1] + " == 0: raise Slow")
+        read.append("v = " + values[0] + " " + ARITHMETIC[opcode] + " " + values[1])
+        return read, ["d.type = " + typ, "d.value = v"]
+    elif opcode in RELATIONAL:
+        read.append("v = " + values[0] + " " + RELATIONAL[opcode] + " " + values[1])
+        return read, ['d.type = "bool"', "d.value = v"]
+    elif opcode in ("AND", "OR"):
+        read.append("v = " + values[0] + " " + opcode.lower() + " " + values[1])
+        return read, ['d.type = "bool"', "d.value = v"]
+    elif opcode == "NOT":
+        return read + ["v = not " + values[0]], ['d.type = "bool"', "d.value = v"]
+    elif opcode == "CONCAT":  # appending to itself and StringBuffer are left to handler
+        read.append("if d.__class__ is StringBuffer: raise Slow")
+        if same_var(args[1], args[0]):
+            read.append("if len(s1.value) >= " + str(ROPE_MIN) + ": raise Slow")
+        read += ["v = " + values[0] + " + " + values[1], "if len(v) > env.max_string: raise Slow"]
+        return read, ['d.type = "string"', "d.value = v"]
+    if opcode in ("STRLEN", "GETCHAR", "STRI2INT") and args[1].__class__ is VarRef:  # StringBuffer by handler
+        read.append("if s1.__class__ is StringBuffer: raise Slow")
+    if opcode == "STRLEN":
+        return read + ["v = len(" + values[0] + ")"], ['d.type = "int"', "d.value = v"]
+    elif opcode == "INT2CHAR":
+        read += ["v = " + values[0], "if v < 0 or v > 0x10FFFF: raise Slow", "v = chr(v)"]
+        return read, ['d.type = "string"', "d.value = v"]
+    elif opcode in ("GETCHAR", "STRI2INT"):
+        read += ["v = " + values[0], "i = " + values[1], "if i < 0 or i >= len(v): raise Slow"]
+        read.append("v = v[i]" if opcode == "GETCHAR" else "v = ord(v[i])")
+        return read, ['d.type = "' + ("string" if opcode == "GETCHAR" else "int") + '"', "d.value = v"]
+    # SETCHAR
+    read += ['if d.type != "string" or d.__class__ is StringBuffer: raise Slow', "v = d.value", "i = " + values[0],
+             "c = " + values[1],
+             "if i < 0 or i >= len(v) or len(c) <= 0 or len(v) >= " + str(ROPE_MIN) + ": raise Slow"]
+    return read, ["d.value = v[:i] + c[0] + v[i+1:]"]
+
+
+def find_leaders(code):
+    """
+    Get indexes of instructions starting basic block: jump targets, return addresses and instructions following
+    a jump. Long blocks are split, so generated functions stay small.
+    # type: (list) -> list
+    """
+    leaders = {0}
+    length = 0
+    for i, ins in enumerate(code):
+        length += 1
+        if OPCODES[ins.op] in JUMPS or length == BLOCK_LENGTH:
+            leaders.add(i+1)
+        if ins.target is not None:
+            leaders.add(ins.target)
+        if i+1 in leaders:
+            length = 0
+    return sorted(leader for leader in leaders if leader < len(code))
+
+
+def generate_block(code, start, end):
+    """
+    Generate Python source of function make(env, H, I, C, P, Slow, SLOW) returning function of block
+    of instructions code[start:end]. H is list of handlers and I list of instructions of the block, C is list
+    of float constants, P is list of instructions executed before the failing one (and not yet added
+    to i_count) by line of the source. Block function returns index of next instruction.
+    Return source, constants and P.
+    # type: (list, int, int) -> tuple
+    """
+    constants = []
+    out = ["def make(env, H, I, C, P, Slow, SLOW):",
+           "    gf = env.gf",
+           "    ST = env.stack_types",
+           "    SV = env.stack_values",
+           "    write = env.writer.write",
+           "    def block():"]
+    head = len(out)
+    marks = []  # (index of line in out, instructions executed before it and not yet added to i_count)
+    count = 0  # instructions not added to i_count yet
+    for k in range(start, end):
+        ins = code[k] if code[k].fused is None else code[k].fused[0]  # fused instructions are compiled one by one
+        opcode = OPCODES[ins.op]
+        out.append("        # " + str(ins.order) + " " + opcode)
+        marks.append((len(out), count))
+        count += 1
+        slow = "H[" + str(k-start) + "](env, I[" + str(k-start) + "])"
+        fast = gen_fast(ins, constants)
+        if opcode == "JUMP" and fast is not None:
+            out.append("        env.i_count += " + str(count))
+            out.append("        return " + str(ins.target))
+            count = 0
+            break
+        if fast is None:
+            if opcode == "BREAK" and count > 1:
+                out.append("        env.i_count += " + str(count-1))
+                count = 1
+                marks.append((len(out), 0))
+            if opcode in JUMPS:
+                out.append("        t = " + slow)
+                out.append("        env.i_count += " + str(count))
+                out.append("        return " + str(k+1) + " if t is None else t")
+                count = 0
+                break
+            out.append("        " + slow)
+            continue
+        read, store = fast
+        if read:
+            out.append("        try:")
+            out += ["            " + line for line in read]
+            out.append("        except SLOW:")
+            if opcode in ("JUMPIFEQ", "JUMPIFNEQ"):
+                out.append("            c = " + slow + " is not None")
+            else:
+                out.append("            " + slow)
+            if store:
+                out.append("        else:")
+                out += ["            " + line for line in store]
+        else:
+            out += ["        " + line for line in store]
+        if opcode in ("JUMPIFEQ", "JUMPIFNEQ"):
+            out.append("        if c:")
+            out.append("            env.i_count += " + str(count))
+            out.append("            return " + str(ins.target))
+    if count:
+        out.append("        env.i_count += " + str(count))
+        out.append("        return " + str(end))
+
+    # Instructions of the block executed before the failing one are counted as by execute()
+    pending = [0] * (len(out) + 4)  # indexed by line of source (from 1), the body moves one line down
+    for (line, before), (following, _) in zip(marks, marks[1:] + [(len(out), 0)]):
+        pending[line + 2:following + 2] = [before] * (following - line)
+    out[head:] = ["        try:"] + ["    " + line for line in out[head:]] + [
+        "        except BaseException as e:",
+        "            env.i_count += P[e.__traceback__.tb_lineno]",
+        "            raise"]
+    out.append("    return block")
+    return "\n".join(out) + "\n", constants, pending
+
+
+def compile_block(enviroment, start, end):
+    """
+    Translate instructions with indexes from start to end into block function.
+
+    Return None when the block cannot be compiled and has to be interpreted.
+    # type: (Enviroment, int, int) -> function|None
+    """
+    code = enviroment.program.code
+    try:
+        source, constants, pending = generate_block(code, start, end)
+        namespace = {"StringBuffer": StringBuffer}
+        exec(compile(source, "<IPPcode18 " + str(start+1) + ">", "exec"), namespace)
+    except (MemoryError, RecursionError, SyntaxError, ValueError):
+        return None
+    block = [ins if ins.fused is None else ins.fused[0] for ins in code[start:end]]
+    handlers = [HANDLERS[ins.op] for ins in block]
+    return namespace["make"](enviroment, handlers, block, constants, pending, SlowPath, SLOW_PATH)
+
+
+def execute_compiled(enviroment):
+    """
+    Execute program from enviroment.ip until the end of program, hot blocks are compiled.
+
+    Instructions are interpreted until their block is entered HOT_BLOCK times, then the block is compiled by
+    compile_block and the block function is called instead. Cold code does not pay for compilation.
+    # type: (Enviroment) -> None
+    """
+    code = enviroment.program.code
+    handlers = HANDLERS
+    end = len(code)
+    leaders = find_leaders(code)
+    block_end = dict(zip(leaders, leaders[1:] + [end]))  # {first index: end index}
+    blocks = [None] * end
+    heat = {}  # {first index: number of entries}
+    ip = enviroment.ip
+    check_at = enviroment.check_at
+    try:
+        while True:
+            if enviroment.i_count > check_at:
+                enviroment.ip = ip
+                check_at = check_run(enviroment)  # exit(11/60/64/65)
+            if ip >= end:
+                break
+            block = blocks[ip]
+            if block is not None:
+                ip = block()
+                continue
+            if ip in block_end:
+                entries = heat.get(ip, 0) + 1
+                heat[ip] = entries
+                if entries == HOT_BLOCK:
+                    blocks[ip] = compile_block(enviroment, ip, block_end[ip])
+                    continue  # block which failed to compile stays interpreted, it is not hot again
+            ins = code[ip]
+            target = handlers[ins.op](enviroment, ins)
+            ip = ins.order if target is None else target  # order is index of the following instruction
+            enviroment.i_count += 1
+    finally:
+        enviroment.writer.flush()
+    enviroment.ip = ip
+
+
+def write_fusions(filepath, code):
+    """
+    Write report of superinstructions: fused sequence, number of places in program and number of executions.
+    # type: (str, list) -> None
+    """
+    report = {}
+    for ins in code:
+        if ins.fused is not None:
+            name = "+".join(original.opcode if original.fused is None else
+                            "+".join(fused.opcode for fused in original.fused) for original in ins.fused)
+            places, hits = report.get(name, (0, 0))
+            report[name] = (places + 1, hits + ins.hits)
+    try:
+        with open(filepath, "w") as file:
+            file.write("%-36s %8s %12s\n" % ("sekvence", "mista", "provedeni"))
+            for name, (places, hits) in sorted(report.items(), key=lambda item: (-item[1][1], item[0])):
+                file.write("%-36s %8d %12d\n" % (name, places, hits))
+    except OSError:
+        raise InputFileError('Chyba pri otevirani souboru "' + filepath + '" pro zapis fuzi')
+
+
+def write_profile(filepath, profile, code, i_count):
+    """
+    Write profile as JSON: totals, opcodes and instructions by time and loops closed by backward jumps.
+    Loop spans from its LABEL to the jump, its time is the time of instructions inside the span.
+    # type: (str, Profile, list, int) -> None
+    """
+    counts = profile.counts
+    times = profile.times
+    opcodes = {}
+    instructions = []
+    for i, ins in enumerate(code):
+        if counts[i] != 0:
+            count, total = opcodes.get(ins.opcode, (0, 0.0))
+            opcodes[ins.opcode] = (count + counts[i], total + times[i])
+            instructions.append({"order": ins.order, "opcode": ins.opcode, "count": counts[i], "time": times[i]})
+    loops = []
+    for i, iterations in profile.back.items():
+        start = code[i].target - 1  # LABEL of the loop
+        loops.append({"label": code[i].args[0], "start": start + 1, "end": i + 1, "iterations": iterations,
+                      "instructions": sum(counts[start:i + 1]), "time": sum(times[start:i + 1])})
+    report = {
+        "instructions": i_count,
+        "time": sum(times),
+        "opcodes": sorted(({"opcode": opcode, "count": count, "time": total}
+                           for opcode, (count, total) in opcodes.items()), key=lambda item: -item["time"]),
+        "orders": sorted(instructions, key=lambda item: -item["time"]),
+        "loops": sorted(loops, key=lambda item: -item["time"]),
+    }
+    try:
+        with open(filepath, "w") as file:
+            json.dump(report, file, indent=1)
+            file.write("\n")
+    except OSError:
+        raise InputFileError('Chyba pri otevirani souboru "' + filepath + '" pro zapis profilu')
+
+
+def write_trace(filepath, trace):
+    """
+    Write records of trace from the oldest one with header and opcode names, see TRACE_HEADER.
+    # type: (str, Trace) -> None
+    """
+    records = min(trace.count, trace.size)
+    data = []
+    for i in range(trace.count - records, trace.count):
+        pos = i % trace.size * 4
+        ins = trace.code[trace.records[pos]]
+        operands = []
+        for k in range(3):
+            if k < len(ins.args):
+                arg = ins.args[k]
+                if arg.__class__ is VarRef:
+                    operands.append(trace_operand(trace.records[pos + 1 + k]))
+                elif arg.__class__ is Variable:
+                    operands.append(trace_operand(arg.value))
+                else:
+                    operands.append((TRACE_NAME, 0))
+            elif ins.op in TRACE_STACK_OPS:
+                kind, value = trace_operand(trace.records[pos + 1 + k])
+                operands.append((kind | TRACE_STACK if kind else 0, value))
+            else:
+                operands.append(TRACE_NONE)
+        (kind1, value1), (kind2, value2), (kind3, value3) = operands
+        data.append(TRACE_RECORD.pack(ins.order, ins.op, kind1, kind2, kind3, value1, value2, value3))
+    names = "\n".join(OPCODES).encode()
+    try:
+        with open(filepath, "wb") as file:
+            file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, TRACE_RECORD.size, records, trace.count))
+            file.write(struct.pack("<I", len(names)) + names)
+            file.write(b"".join(data))
+    except OSError:
+        raise InputFileError('Chyba pri otevirani souboru "' + filepath + '" pro zapis stopy')
+
+
+def dump_trace(filepath, trace):
+    """
+    Write trace on request (SIGUSR1) while program runs, error is only reported, so the program goes on.
+    # type: (str, Trace) -> None
+    """
+    try:
+        write_trace(filepath, trace)
+    except InputFileError as err:
+        sys.stderr.write(str(err) + "\n")
+
+
+def write_samples(filepath, labelpath, samples):
+    """
+    Write sampled call stacks in folded format ("<main>;label;label instructions" per line) and if labelpath
+    is set, table of instructions executed in every label (exclusive) and in its calls too (inclusive).
+    Number of instructions is estimated as samples * interval.
+    # type: (str, str, Samples) -> None
+    """
+    interval = samples.interval
+    lines = []
+    for node, count in samples.counts.items():
+        names = []
+        while node is not None:
+            names.append(samples.label[node])
+            node = samples.parent[node]
+        lines.append((";".join(reversed(names)), count * interval))
+    inclusive = samples.inclusive
+    try:
+        with open(filepath, "w") as file:
+            for line, count in sorted(lines):
+                file.write(line + " " + str(count) + "\n")
+        if labelpath != "":
+            with open(labelpath, "w") as file:
+                file.write("%-36s %12s %12s\n" % ("navesti", "vlastni", "celkem"))
+                for name in sorted(inclusive, key=lambda name: (-inclusive[name], name)):
+                    file.write("%-36s %12d %12d\n" % (name, samples.exclusive.get(name, 0) * interval,
+                                                       inclusive[name] * interval))
+    except OSError:
+        raise InputFileError('Chyba pri zapisu vzorku zasobniku volani')
+
+
+def stream_reader(stream, writer):
+    """
+    Get Reader of program input from stream. Text stream is decoded by its encoding, binary stream as UTF-8
+    with surrogateescape (as standard input in C locale).
+    Output of writer is flushed before waiting for input, as input() does it.
+    # type: (IO, Writer) -> Reader
+    """
+    if isinstance(stream, io.TextIOBase):
+        buffer = getattr(stream, "buffer", None)
+        if buffer is None:  # io.StringIO
+            return Reader(lambda size: stream.read(size).encode("utf-8", "surrogatepass"), "utf-8", "surrogatepass")
+        return Reader(getattr(buffer, "read1", buffer.read), stream.encoding, stream.errors, writer.flush)
+    return Reader(getattr(stream, "read1", stream.read), "utf-8", "surrogateescape", writer.flush)
+
+
+def open_input(filepath):
+    """
+    Get Reader of program input from specified file.
+
+    File is decoded the same way as standard input. Large file is mapped to memory instead of being read,
+    raise InputFileError if the file cannot be opened.
+    # type: (str) -> Reader
+    """
+    encoding, errors = sys.stdin.encoding, sys.stdin.errors
+    try:
+        with open(filepath, "rb") as file:
+            if os.fstat(file.fileno()).st_size < BLOCK_SIZE:
+                return Reader(io.BytesIO(file.read()).read, encoding, errors)
+            return Reader(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ).read, encoding, errors)
+    except OSError:
+        raise InputFileError('Soubor "' + filepath + '" nelze otevrit')
+
+
+def write_stats(statpath, stati, stats):
+    """
+    Write statistics if statpath is set according to STATI arguments, stats are values of all STATS.
+    # type: (str, list, dict) -> None
+    """
+    if statpath != "":
+        try:
+            with open(statpath, 'w') as file:
+                for st in stati:
+                    file.write(str(stats[st]) + "\n")
+        except (PermissionError, FileNotFoundError):
+            raise InputFileError('Chyba pri otevirani souboru "' + statpath + ' pro zapis statistik"')
+
+
+class Result:
+    """The class represents finished run of program. Contains return code, statistics and error (None if ok)"""
+    def __init__(self, code, enviroment, error=None):
+        self.code = code  # 0 or return code of error
+        self.i_count = enviroment.i_count  # executed instructions
+        self.v_count = enviroment.v_count  # maximal number of defined variables
+        self.stack_peak = enviroment.stack_peak  # maximal depth of data stack
+        self.call_peak = enviroment.call_peak  # maximal depth of call stack
+        self.frame_peak = enviroment.frame_peak  # maximal number of existing frames
+        self.error = error  # InterpretError or None
+
+    def stats(self):
+        """
+        Get all statistics by their names in STATS.
+        # type: () -> dict
+        """
+        return {"insts": self.i_count, "vars": self.v_count, "stack-depth": self.stack_peak,
+                "call-depth": self.call_peak, "frames": self.frame_peak}
+
+
+class Interpreter:
+    """
+    The class interprets programs inside the calling process, so one process can run many programs.
+
+    Loaded program can be run any number of times, every run gets new frames and stacks and is stopped when
+    it exceeds limits. Errors are raised as subclasses of InterpretError, which carry the return code
+    (11, 31, 32, 52-59, 60-64 for limits).
+    """
+    def __init__(self, cachedir="", tail_calls=True, optimize=True, compiled=False, buffer_size=BUFFER_SIZE,
+                 limits=None):
+        self.cachedir = cachedir  # directory of cached programs, "" = no cache
+        self.tail_calls = tail_calls  # mark tail calls
+        self.optimize = optimize  # fuse instructions into superinstructions, skip checks of proven types
+        self.compiled = compiled  # compile hot blocks
+        self.buffer_size = buffer_size  # buffered characters of output
+        self.limits = Limits() if limits is None else limits  # limits of every run
+        self.program = None
+
+    def load(self, source):
+        """
+        Load program from file path or binary file object and keep it for run(). Return Program.
+        # type: (str|BinaryIO) -> Program
+        """
+        if self.cachedir != "" and isinstance(source, str):
+            program = load_cached(source, self.cachedir)  # exit(11/31/32/53/56)
+        else:
+            program = load_program(source)  # exit(11/31/32/53/56)
+        if self.tail_calls:
+            mark_tail_calls(program.code)
+        if self.optimize:
+            peephole(program.code)
+            if not self.compiled:  # compiled blocks have their own fast paths
+                specialize(program.code, infer_types(program))
+        if not self.compiled:
+            program.blocks = split_blocks(program.code)
+        self.program = program
+        return program
+
+    def run(self, stdin=None, stdout=None, stderr=None, check=True, profile=None, samples=None, checkpoint=None,
+            resume=None, trace=None):
+        """
+        Run loaded program with input from stdin (text or binary stream or Reader) and output to stdout
+        (text stream), standard streams are used by default. Output is flushed also when program fails.
+
+        Error of program is raised, with check=False it is returned in Result together with statistics.
+        Program is measured into profile or samples or recorded into trace when one of them is given. State of run
+        is saved to checkpoint when it is given, run continues from state loaded by load_checkpoint when resume
+        is given.
+        # type: (IO|Reader, IO, IO, bool, Profile, Samples, Checkpoint, dict, Trace) -> Result
+        """
+        writer = Writer(sys.stdout if stdout is None else stdout, self.buffer_size)
+        reader = stdin if isinstance(stdin, Reader) else stream_reader(sys.stdin if stdin is None else stdin, writer)
+        enviroment = Enviroment(self.program, reader, writer, stderr, self.limits, checkpoint)
+        try:
+            if resume is not None:
+                restore_state(enviroment, resume)
+            if profile is not None:
+                execute_profiled(enviroment, profile)
+            elif samples is not None:
+                execute_sampled(enviroment, samples)
+            elif trace is not None:
+                execute_traced(enviroment, trace)
+            elif self.compiled:
+                execute_compiled(enviroment)
+            else:
+                execute(enviroment)
+        except InterpretError as err:
+            if check:
+                raise
+            return Result(err.errno, enviroment, err)
+        return Result(0, enviroment)
+
+
+# SERVER #
+# Server keeps warm worker processes which accept connections on one Unix socket, every worker handles one
+# request at a time. Message is 4 bytes of big-endian length followed by UTF-8 JSON. Request contains "source"
+# (path of XML file) or "xml" (text of XML file) and "stdin" (text of program input), response contains "code",
+# "stdout", "stderr" and "stats" ({name: int} of all STATS).
+
+def send_message(conn, message):
+    """
+    Send message as length-prefixed JSON.
+    # type: (socket.socket, dict) -> None
+    """
+    data = json.dumps(message).encode("utf-8", "surrogatepass")
+    conn.sendall(struct.pack("!I", len(data)) + data)
+
+
+def recv_exact(conn, size):
+    """
+    Receive exactly size bytes, return None when connection is closed before.
+    # type: (socket.socket, int) -> bytes|None
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(min(size - len(data), BLOCK_SIZE))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_message(conn):
+    """
+    Receive length-prefixed JSON message, return None when connection is closed.
+    # type: (socket.socket) -> dict|None
+    """
+    header = recv_exact(conn, 4)
+    if header is None:
+        return None
+    data = recv_exact(conn, struct.unpack("!I", header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8", "surrogatepass"))
+
+
+def serve_request(interpreter, programs, request):
+    """
+    Load (or find already loaded) program of request and run it, return response.
+    # type: (Interpreter, dict, dict) -> dict
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    try:
+        if "xml" in request:
+            source = request["xml"].encode("utf-8", "surrogatepass")
+            key = hashlib.sha256(source).digest()
+            source = io.BytesIO(source)
+        else:
+            source = request["source"]
+            if not isinstance(source, str):
+                raise TypeError
+            try:
+                stat = os.stat(source)
+                key = (source, stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                key = None  # reported by load
+        program = programs.pop(key, None)
+        if program is None:
+            program = interpreter.load(source)  # exit(11/31/32/53/56)
+            if len(programs) >= PROGRAM_CACHE:
+                del programs[next(iter(programs))]  # the least recently used
+        programs[key] = program
+        interpreter.program = program
+        result = interpreter.run(io.StringIO(request.get("stdin", "")), stdout, stderr, check=False)
+        if result.error is not None:
+            stderr.write(str(result.error) + "\n")
+        code, stats = result.code, result.stats()
+    except InterpretError as err:
+        stderr.write(str(err) + "\n")
+        code, stats = err.errno, dict.fromkeys(STATS, 0)
+    except (KeyError, TypeError, AttributeError):
+        stderr.write("Chybny pozadavek, chybi source nebo xml\n")
+        code, stats = 10, dict.fromkeys(STATS, 0)
+    except Exception as err:  # error of interpret.py itself must not kill the worker
+        stderr.write("Chyba interpretu: " + repr(err) + "\n")
+        code, stats = 1, dict.fromkeys(STATS, 0)
+    return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "stats": stats}
+
+
+def serve_worker(listener, interpreter):
+    """
+    Accept connections and handle their requests until the process is killed.
+    # type: (socket.socket, Interpreter) -> None
+    """
+    programs = {}  # {(path, size, mtime) or digest of XML: Program} in order of use
+    while True:
+        conn, _ = listener.accept()
+        try:
+            with conn:
+                request = recv_message(conn)
+                while request is not None:
+                    send_message(conn, serve_request(interpreter, programs, request))
+                    request = recv_message(conn)
+        except (OSError, ValueError):  # client disconnected or sent invalid message
+            pass
+
+
+def kill_workers(children):
+    """
+    Send SIGTERM to worker processes which were not waited for yet.
+    # type: (set) -> None
+    """
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass  # already waited for, not yet removed from children
+
+
+def serve(socketpath, workers, backlog, interpreter):
+    """
+    Listen on Unix socket, keep workers processes handling requests and restart them when they die.
+    At most workers programs run at once, at most backlog connections wait for them. SIGTERM stops the workers
+    and then the server returns.
+    # type: (str, int, int, Interpreter) -> None
+    """
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if os.path.exists(socketpath):
+            os.unlink(socketpath)  # left by server which was killed
+        listener.bind(socketpath)
+        listener.listen(backlog)
+    except OSError as err:
+        raise InputFileError('Na socketu "' + socketpath + '" nelze naslouchat: ' + str(err.strerror))
+    children = set()
+    stopped = []  # SIGTERM received
+
+    def terminate(signum, frame):
+        stopped.append(signum)
+        kill_workers(children)  # os.wait below returns when the first one dies
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        while not stopped:
+            while len(children) < workers and not stopped:
+                signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGTERM])  # new worker is in children when it comes
+                pid = os.fork()
+                if pid == 0:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGTERM])
+                    try:
+                        serve_worker(listener, interpreter)
+                    finally:
+                        os._exit(0)
+                children.add(pid)
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGTERM])
+            pid, _ = os.wait()
+            children.discard(pid)
+    finally:
+        kill_workers(children)
+        listener.close()
+        os.unlink(socketpath)
+
+
+def request(socketpath, source=None, xml=None, stdin=""):
+    """
+    Run program on server listening on socketpath, program is given by path of XML file or by text of it.
+    Return response: {"code": int, "stdout": str, "stderr": str, "stats": {name: int}}.
+    # type: (str, str, str, str) -> dict
+    """
+    message = {"stdin": stdin}
+    if xml is not None:
+        message["xml"] = xml
+    else:
+        message["source"] = os.path.abspath(source)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socketpath)
+        send_message(conn, message)
+        response = recv_message(conn)
+    if response is None:
+        raise ConnectionError("Server ukoncil spojeni")
+    return response
+
+
+# FAN-OUT #
+# One loaded program runs over every file of input directory. Worker processes are forked from the process which
+# loaded the program, so they share it copy-on-write, and every input runs in its own worker with fresh Enviroment.
+# Output and error output of input go to files in output directory, return codes, statistics and times of all
+# inputs to manifest.json there.
+
+def input_files(inputdir):
+    """
+    Get names of input files in directory (regular files, not hidden) in sorted order.
+    # type: (str) -> list
+    """
+    try:
+        names = sorted(os.listdir(inputdir))
+    except OSError:
+        raise InputFileError('Adresar "' + inputdir + '" nelze cist')
+    return [name for name in names if not name.startswith(".") and os.path.isfile(os.path.join(inputdir, name))]
+
+
+def run_input(interpreter, inputpath, outpath, errpath):
+    """
+    Run loaded program on one input file with output to files, return result record without names of files.
+    # type: (Interpreter, str, str, str) -> dict
+    """
+    start = time.perf_counter()
+    with open(outpath, "w", encoding=sys.stdout.encoding, errors=sys.stdout.errors) as stdout, \
+            open(errpath, "w", encoding=sys.stderr.encoding, errors=sys.stderr.errors) as stderr:
+        try:
+            result = interpreter.run(open_input(inputpath), stdout, stderr, check=False)  # exit(11)
+            if result.error is not None:
+                stderr.write(str(result.error) + "\n")
+            code, stats = result.code, result.stats()
+        except InterpretError as err:
+            stderr.write(str(err) + "\n")
+            code, stats = err.errno, dict.fromkeys(STATS, 0)
+    return {"code": code, "stats": stats, "time": round(time.perf_counter() - start, 6)}
+
+
+def run_inputs(interpreter, inputdir, outputdir, workers):
+    """
+    Run loaded program on every file of inputdir in at most workers processes at once and write manifest.
+
+    Input "name.in" (or "name") writes "name.out" and "name.err" to outputdir, inputs "name.in" and "name"
+    together are refused before anything runs, they would overwrite each other's files. Worker sends its result
+    record through pipe, worker which died without it gets return code 1 (error of interpret.py itself), its
+    traceback is appended to the error output of the input.
+    Return list of result records in order of inputs.
+    # type: (Interpreter, str, str, int) -> list
+    """
+    names = input_files(inputdir)  # exit(11)
+    results = []
+    bases = {}  # {name of output without suffix: input}
+    for name in names:
+        base = name[:-3] if name.endswith(".in") else name
+        if base in bases:
+            raise InputFileError('Vstupy "' + bases[base] + '" a "' + name + '" by zapsaly stejny vystup "' +
+                                 base + '.out"')
+        bases[base] = name
+        results.append({"input": name, "output": base + ".out", "errors": base + ".err"})
+    try:
+        os.makedirs(outputdir, exist_ok=True)
+    except OSError:
+        raise InputFileError('Adresar "' + outputdir + '" nelze vytvorit')
+    if hasattr(gc, "freeze"):  # Python 3.7+
+        gc.freeze()  # garbage collector of workers does not touch (and copy) objects of loaded program
+    running = {}  # {pid: (index of input, pipe)}
+    pending = 0
+    while pending < len(results) or running:
+        while pending < len(results) and len(running) < workers:
+            record = results[pending]
+            (read, write) = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read)
+                status = 1
+                try:
+                    data = run_input(interpreter, os.path.join(inputdir, record["input"]),
+                                     os.path.join(outputdir, record["output"]),
+                                     os.path.join(outputdir, record["errors"]))
+                    os.write(write, json.dumps(data).encode())
+                    status = 0
+                except BaseException:  # error of interpret.py itself, reported to error output of the input
+                    with open(os.path.join(outputdir, record["errors"]), "a") as file:
+                        traceback.print_exc(file=file)
+                finally:
+                    os._exit(status)
+            os.close(write)
+            running[pid] = (pending, read)
+            pending += 1
+        pid, _ = os.wait()
+        if pid not in running:
+            continue
+        index, read = running.pop(pid)
+        with os.fdopen(read, "rb") as pipe:
+            data = pipe.read()
+        try:
+            results[index].update(json.loads(data.decode()))
+        except ValueError:
+            results[index].update({"code": 1, "stats": dict.fromkeys(STATS, 0), "time": None})
+    try:
+        with open(os.path.join(outputdir, "manifest.json"), "w") as file:
+            json.dump({"inputs": os.path.abspath(inputdir), "results": results}, file, indent=1)
+            file.write("\n")
+    except OSError:
+        raise InputFileError('Chyba pri zapisu souboru "' + os.path.join(outputdir, "manifest.json") + '"')
+    return results
+
+
+# SESSIONS #
+# Host runs many sessions of one loaded program in a single process and thread by asyncio. Every session has its own
+# Enviroment, input and output of its program are asyncio streams (Unix socket connection, pipe). Program runs
+# by quanta of instructions and yields to other sessions after each one and whenever READ waits for input, so
+# sessions waiting for their clients cost nothing and busy sessions share the process fairly.
+
+class SessionInput:
+    """
+    The class holds program input received from asyncio stream and not read yet. Reading when nothing was received
+    raises Preempted, session waits for more input and READ is executed again.
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.eof = False  # stream ended
+        self.waiting = False  # program waits for input
+
+    def read(self, size):
+        """
+        Take at most size bytes of received input, empty at the end of input.
+        # type: (int) -> bytes
+        """
+        if not self.data:
+            if self.eof:
+                return b""
+            self.waiting = True
+            raise Preempted
+        block = bytes(self.data[:size])
+        del self.data[:size]
+        return block
+
+
+class SessionOutput:
+    """The class is text stream of Writer, it passes UTF-8 output to asyncio stream which buffers it"""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        self.stream.write(text.encode("utf-8", "surrogatepass"))
+
+    def flush(self):
+        pass  # session waits for the stream after every quantum
+
+
+class Host:
+    """
+    The class runs sessions as asyncio tasks which take turns. Program of session yields after quantum executed
+    instructions (checked after basic blocks) and when READ waits for input, ready sessions run in the order
+    in which they became ready. Statistics of running sessions are available by stats().
+    """
+    def __init__(self, limits=None, quantum=QUANTUM, buffer_size=BUFFER_SIZE):
+        self.limits = Limits() if limits is None else limits  # limits of every session
+        self.quantum = quantum  # executed instructions between switches of sessions
+        self.buffer_size = buffer_size  # buffered characters of output of session
+        self.sessions = {}  # {number: Enviroment} running sessions
+
+    def stats(self):
+        """
+        Get statistics of running sessions by their numbers.
+        # type: () -> dict
+        """
+        return {number: Result(0, enviroment).stats() for number, enviroment in self.sessions.items()}
+
+    async def run(self, number, program, input_stream, output_stream, stderr=None):
+        """
+        Run program loaded without compilation as session with input from asyncio StreamReader and output
+        to StreamWriter, return Result when it ends. Closed connection ends the session with return code 11.
+        # type: (int, Program, asyncio.StreamReader, asyncio.StreamWriter, IO) -> Result
+        """
+        source = SessionInput()
+        writer = Writer(SessionOutput(output_stream), self.buffer_size)
+        enviroment = Enviroment(program, Reader(source.read, "utf-8", "surrogateescape", writer.flush), writer, stderr,
+                                self.limits)
+        self.sessions[number] = enviroment
+        try:
+            while True:
+                enviroment.quantum_end = enviroment.i_count + self.quantum
+                enviroment.check_at = next_check(enviroment)
+                try:
+                    execute(enviroment)
+                    return Result(0, enviroment)
+                except Preempted:
+                    pass
+                except InterpretError as err:
+                    return Result(err.errno, enviroment, err)
+                await output_stream.drain()  # client which does not read output stops its session
+                if source.waiting:
+                    source.waiting = False
+                    block = await input_stream.read(BLOCK_SIZE)
+                    source.data += block
+                    source.eof = not block
+                else:
+                    await asyncio.sleep(0)  # sessions which are ready run before this one continues
+        except ConnectionError as err:
+            return Result(11, enviroment, InputFileError("Spojeni ukonceno: " + str(err)))
+        finally:
+            del self.sessions[number]
+
+
+def serve_sessions(socketpath, backlog, host, program):
+    """
+    Listen on Unix socket and run program as session of host for every connection, the connection is input
+    and output of program. Write JSON line with return code, error, error output, statistics and time of every
+    finished session to standard output.
+    # type: (str, int, Host, Program) -> None
+    """
+    started = 0
+
+    async def session(reader, writer):
+        nonlocal started
+        number = started
+        started += 1
+        start = time.perf_counter()
+        stderr = io.StringIO()
+        record = {"session": number, "code": 1, "error": None, "stats": dict.fromkeys(STATS, 0)}
+        try:
+            result = await host.run(number, program, reader, writer, stderr)
+            record.update(code=result.code, error=None if result.error is None else str(result.error),
+                          stats=result.stats())
+            await writer.drain()
+        except ConnectionError:
+            pass  # output of finished program was not read
+        except Exception as err:  # error of interpret.py itself (e.g. RecursionError), python3 exits with 1
+            record["error"] = "Chyba interpretu: " + repr(err)
+        finally:
+            writer.close()
+        record["stderr"] = stderr.getvalue()
+        record["time"] = round(time.perf_counter() - start, 6)
+        sys.stdout.write(json.dumps(record) + "\n")
+        sys.stdout.flush()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        if os.path.exists(socketpath):
+            os.unlink(socketpath)  # left by server which was killed
+        server = loop.run_until_complete(asyncio.start_unix_server(session, socketpath, backlog=backlog))
+    except OSError as err:
+        loop.close()
+        raise InputFileError('Na socketu "' + socketpath + '" nelze naslouchat: ' + str(err.strerror))
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        os.unlink(socketpath)
+        loop.close()
+
+
+if __name__ == "__main__":
+    # Parse CLI arguments
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "hs:", ["help", "source=", "input=", "buffer=", "cache-dir=",
+                                                            "no-cache", "no-peephole", "no-tail-calls", "fusions=",
+                                                            "compile", "profile=", "samples=", "sample-labels=",
+                                                            "sample-interval=", "serve=", "workers=", "backlog=",
+                                                            "connect=", "check", "stats=", "insts", "vars",
+                                                            "stack-depth", "call-depth", "frames", "max-insts=",
+                                                            "max-stack=", "max-call-depth=", "max-string-len=",
+                                                            "timeout=", "checkpoint=", "checkpoint-interval=",
+                                                            "resume=", "trace=", "trace-size=", "inputs=",
+                                                            "outputs=", "sessions=", "quantum="])
+    except getopt.GetoptError as err:
+        if err.opt != "":
+            sys.stderr.write("Nespravne pouziti parametru: " + err.opt + "\n")
+            help_print()
+        sys.exit(10)
+
+    filepath = ""
+    inputpath = ""
+    buffer_size = 0 if sys.stdout.isatty() else BUFFER_SIZE
+    cachedir = os.environ.get("IPP_CACHE_DIR", "")
+    use_cache = True
+    compiled = False
+    optimize = True
+    tail_calls = True
+    fusionpath = ""
+    profilepath = ""
+    samplepath = ""
+    labelpath = ""
+    interval = 100
+    servepath = ""
+    workers = os.cpu_count() or 1
+    backlog = 128
+    connectpath = ""
+    check = False
+    statpath = ""
+    stati = []
+    limits = Limits()
+    checkpointpath = ""
+    checkpoint_interval = 0
+    resumepath = ""
+    tracepath = ""
+    trace_size = TRACE_SIZE
+    inputdir = ""
+    outputdir = ""
+    sessionpath = ""
+    quantum = QUANTUM
+
+    for option, value in opts:
+        if option in ("-h", "--help"):
+            help_print()
+            sys.exit(0)
+        elif option in ("-s", "--source"):
+            filepath = value
+        elif option == "--input":
+            inputpath = value
+        elif option == "--buffer":
+            try:
+                buffer_size = int(value)
+                if buffer_size < 0:
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write("Parametr --buffer musi byt nezaporne cele cislo, predano: " + value + "\n")
+                help_print()
+                sys.exit(10)
+        elif option == "--cache-dir":
+            cachedir = value
+        elif option == "--no-cache":
+            use_cache = False
+        elif option == "--no-peephole":
+            optimize = False
+        elif option == "--no-tail-calls":
+            tail_calls = False
+        elif option == "--fusions":
+            fusionpath = value
+        elif option == "--compile":
+            compiled = True
+        elif option == "--profile":
+            profilepath = value
+        elif option == "--samples":
+            samplepath = value
+        elif option == "--sample-labels":
+            labelpath = value
+        elif option == "--sample-interval":
+            try:
+                interval = int(value)
+                if interval <= 0:
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write("Parametr --sample-interval musi byt kladne cele cislo, predano: " + value + "\n")
+                help_print()
+                sys.exit(10)
+        elif option == "--serve":
+            servepath = value
+        elif option == "--sessions":
+            sessionpath = value
+        elif option in ("--workers", "--backlog", "--max-insts", "--max-stack", "--max-call-depth", "--max-string-len",
+                        "--checkpoint-interval", "--trace-size", "--quantum"):
+            try:
+                number = int(value)
+                if number <= 0:
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write("Parametr " + option + " musi byt kladne cele cislo, predano: " + value + "\n")
+                help_print()
+                sys.exit(10)
+            if option == "--workers":
+                workers = number
+            elif option == "--backlog":
+                backlog = number
+            elif option == "--max-insts":
+                limits.insts = number
+            elif option == "--max-stack":
+                limits.stack = number
+            elif option == "--max-call-depth":
+                limits.call_depth = number
+            elif option == "--max-string-len":
+                limits.string_len = number
+            elif option == "--checkpoint-interval":
+                checkpoint_interval = number
+            elif option == "--quantum":
+                quantum = number
+            else:
+                trace_size = number
+        elif option == "--timeout":
+            try:
+                limits.timeout = float(value)
+                if not limits.timeout > 0:
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write("Parametr --timeout musi byt kladne cislo, predano: " + value + "\n")
+                help_print()
+                sys.exit(10)
+        elif option == "--checkpoint":
+            checkpointpath = value
+        elif option == "--resume":
+            resumepath = value
+        elif option == "--trace":
+            tracepath = value
+        elif option == "--inputs":
+            inputdir = value
+        elif option == "--outputs":
+            outputdir = value
+        elif option == "--connect":
+            connectpath = value
+        elif option == "--check":
+            check = True
+        elif option == "--stats":
+            statpath = value
+        elif option[2:] in STATS:
+            if option[2:] in stati:
+                sys.stderr.write("Argument '" + option[2:] + "' byl pouzit dvakrat.\n")
+                help_print()
+                sys.exit(10)
+            stati.append(option[2:])
+        else:
+            sys.stderr.write("Neznamy parametr: " + option + "\n")
+            help_print()
+            sys.exit(10)
+
+    if len(stati) > 0 and statpath == "":
+        sys.stderr.write("Parametry --insts, --vars, --stack-depth, --call-depth ci --frames musi byt pouzity "
+                         "spolu se --stats\n")
+        help_print()
+        sys.exit(10)
+
+    if labelpath != "" and samplepath == "":
+        sys.stderr.write("Parametr --sample-labels musi byt pouzit spolu se --samples\n")
+        help_print()
+        sys.exit(10)
+
+    if checkpoint_interval != 0 and checkpointpath == "":
+        sys.stderr.write("Parametr --checkpoint-interval musi byt pouzit spolu s --checkpoint\n")
+        help_print()
+        sys.exit(10)
+
+    if trace_size != TRACE_SIZE and tracepath == "":
+        sys.stderr.write("Parametr --trace-size musi byt pouzit spolu s --trace\n")
+        help_print()
+        sys.exit(10)
+
+    if [profilepath, samplepath, tracepath].count("") < 2:
+        sys.stderr.write("Parametry --profile, --samples a --trace nelze pouzit zaroven\n")
+        help_print()
+        sys.exit(10)
+
+    if quantum != QUANTUM and sessionpath == "":
+        sys.stderr.write("Parametr --quantum musi byt pouzit spolu se --sessions\n")
+        help_print()
+        sys.exit(10)
+
+    if servepath != "":
+        if connectpath != "" or profilepath != "" or samplepath != "" or statpath != "" or fusionpath != "" or \
+                checkpointpath != "" or resumepath != "" or tracepath != "" or inputdir != "" or sessionpath != "":
+            sys.stderr.write("Parametr --serve nelze kombinovat s --connect, --profile, --samples, --stats, "
+                             "--fusions, --checkpoint, --resume, --trace, --inputs ani --sessions\n")
+            help_print()
+            sys.exit(10)
+        try:
+            serve(servepath, workers, backlog, Interpreter(cachedir if use_cache else "", tail_calls, optimize,
+                                                           compiled, limits=limits))
+        except InterpretError as err:
+            sys.stderr.write(str(err) + "\n")
+            sys.exit(err.errno)
+        sys.exit(0)
+
+    if filepath == "":
+        sys.stderr.write("Chyby povinny parametr: --source=<file>\n")
+        help_print()
+        sys.exit(10)
+
+    if check:
+        try:
+            errors = check_program(Interpreter(cachedir if use_cache else "", False, False).load(filepath))
+        except InterpretError as err:
+            sys.stderr.write(str(err) + "\n")
+            sys.exit(err.errno)
+        for err in errors:
+            sys.stderr.write(str(err) + "\n")
+        sys.exit(errors[0].errno if errors else 0)
+
+    if sessionpath != "":
+        if inputpath != "" or connectpath != "" or profilepath != "" or samplepath != "" or tracepath != "" or \
+                statpath != "" or fusionpath != "" or checkpointpath != "" or resumepath != "" or inputdir != "" or \
+                compiled:
+            sys.stderr.write("Parametr --sessions nelze kombinovat s --input, --connect, --profile, --samples, "
+                             "--trace, --stats, --fusions, --checkpoint, --resume, --inputs ani --compile\n")
+            help_print()
+            sys.exit(10)
+        try:
+            interpreter = Interpreter(cachedir if use_cache else "", tail_calls, optimize)
+            program = interpreter.load(filepath)  # exit(11/31/32/53/56)
+            serve_sessions(sessionpath, backlog, Host(limits, quantum), program)  # exit(11)
+        except InterpretError as err:
+            sys.stderr.write(str(err) + "\n")
+            sys.exit(err.errno)
+        sys.exit(0)
+
+    if inputdir != "":
+        if outputdir == "":
+            sys.stderr.write("Parametr --inputs musi byt pouzit spolu s --outputs\n")
+            help_print()
+            sys.exit(10)
+        if inputpath != "" or connectpath != "" or profilepath != "" or samplepath != "" or tracepath != "" or \
+                statpath != "" or fusionpath != "" or checkpointpath != "" or resumepath != "":
+            sys.stderr.write("Parametr --inputs nelze kombinovat s --input, --connect, --profile, --samples, "
+                             "--trace, --stats, --fusions, --checkpoint ani --resume\n")
+            help_print()
+            sys.exit(10)
+        interpreter = Interpreter(cachedir if use_cache else "", tail_calls, optimize, compiled, BUFFER_SIZE, limits)
+        try:
+            interpreter.load(filepath)  # exit(11/31/32/53/56)
+            run_inputs(interpreter, inputdir, outputdir, workers)  # exit(11)
+        except InterpretError as err:
+            sys.stderr.write(str(err) + "\n")
+            sys.exit(err.errno)
+        sys.exit(0)
+    elif outputdir != "":
+        sys.stderr.write("Parametr --outputs musi byt pouzit spolu s --inputs\n")
+        help_print()
+        sys.exit(10)
+
+    if connectpath != "":
+        if limits.insts or limits.stack or limits.call_depth or limits.string_len or limits.timeout:
+            sys.stderr.write("Parametry --max-* a --timeout nelze pouzit s --connect, limity nastavuje server\n")
+            help_print()
+            sys.exit(10)
+        if checkpointpath != "" or resumepath != "" or tracepath != "":
+            sys.stderr.write("Parametry --checkpoint, --resume a --trace nelze pouzit s --connect\n")
+            help_print()
+            sys.exit(10)
+        try:
+            if inputpath == "":
+                data = sys.stdin.read()
+            else:
+                with open(inputpath, encoding=sys.stdin.encoding, errors=sys.stdin.errors) as file:
+                    data = file.read()
+        except OSError:
+            sys.stderr.write('Soubor "' + inputpath + '" nelze otevrit\n')
+            sys.exit(11)
+        try:
+            response = request(connectpath, filepath, stdin=data)
+        except OSError as err:
+            sys.stderr.write('Nelze komunikovat se serverem "' + connectpath + '": ' + str(err) + "\n")
+            sys.exit(11)
+        sys.stdout.write(response["stdout"])
+        sys.stdout.flush()
+        sys.stderr.write(response["stderr"])
+        if response["code"] == 0 or issubclass(ERROR_TYPES.get(response["code"], InterpretError), LimitError):
+            try:
+                write_stats(statpath, stati, response["stats"])
+            except InterpretError as err:
+                sys.stderr.write(str(err) + "\n")
+                sys.exit(err.errno)
+        sys.exit(response["code"])
+
+    # Load XML, check for syntax errors, decode instructions and find all LABELs, then execute them
+    # profilers and trace need every instruction and call in the program
+    profiling = profilepath != "" or samplepath != "" or tracepath != ""
+    interpreter = Interpreter(cachedir if use_cache else "", tail_calls and not profiling, optimize and not profiling,
+                              compiled, buffer_size, limits)
+    checkpoint = None
+    if checkpointpath != "":
+        checkpoint = Checkpoint(checkpointpath, checkpoint_interval, source_digest(filepath) or "")
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(checkpoint, "stop", True))
+    trace = None
+    if tracepath != "":
+        trace = Trace(trace_size)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: dump_trace(tracepath, trace))
+    try:
+        program = interpreter.load(filepath)
+        profile = Profile(len(program.code)) if profilepath != "" else None
+        samples = Samples(interval) if samplepath != "" else None
+        resume = None
+        if resumepath != "":
+            resume = load_checkpoint(resumepath, source_digest(filepath) or "")  # exit(11)
+        result = interpreter.run(sys.stdin if inputpath == "" else open_input(inputpath), sys.stdout,
+                                 check=False, profile=profile, samples=samples, checkpoint=checkpoint,
+                                 resume=resume, trace=trace)
+        if profile is not None:  # profile of program which exited with error is written too
+            write_profile(profilepath, profile, program.code, result.i_count)
+        if samples is not None:
+            write_samples(samplepath, labelpath, samples)
+        if trace is not None and result.error is not None:
+            write_trace(tracepath, trace)
+        if result.error is not None:
+            if isinstance(result.error, LimitError):  # statistics tell how far the stopped program got
+                write_stats(statpath, stati, result.stats())
+            raise result.error
 
-    # Write statistic data
-    write_stats(statpath, stati, i_count, v_count)
+        # Write statistic data
+        write_stats(statpath, stati, result.stats())
+        if fusionpath != "":
+            write_fusions(fusionpath, program.code)
+    except InterpretError as err:
+        sys.stderr.write(str(err) + "\n")
+        sys.exit(err.errno)
 
     sys.exit(0)
@@ -0,0 +1,337 @@
+# coding=utf-8
+"""
+Parallel test runner of parse.php and interpret.py, Python version of test.php.
+
+Tests have the same layout (.src, .in, .out, .rc) and the report is the same HTML page printed to standard
+output. Tests run in a pool of processes, every process imports interpret.py once and runs the programs
+inside itself, output is compared in memory. Time of every test is reported and the slowest tests are listed.
+
+Every program is also run in the other MODES of the interpreter (without optimizations, without tail calls,
+with compiled blocks), which must give the same return code, output and number of executed instructions.
+Optional .insts file contains the expected number of executed instructions, checked also on error exit.
+"""
+
+import difflib
+import getopt
+import html
+import importlib.util
+import io
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import traceback
+
+SLOWEST = 10  # number of tests in the list of slowest tests
+MODES = [  # (name, parameters of Interpreter), the first one is checked against .rc and .out files
+    ("", {}),
+    ("optimize=False", {"optimize": False}),
+    ("tail_calls=False", {"tail_calls": False}),
+    ("compiled=True", {"compiled": True}),
+]
+
+interpret = None  # module interpret.py loaded in worker process
+config = None  # configuration of worker process
+
+
+def help_print():
+    """
+    Print description and usage and return codes of this script.
+    # type: () -> None
+    """
+    print("Skript slouzi pro automaticke paralelni testovani postupne aplikace parse.php a interpret.py\n"
+          "\n"
+          "Pouziti:\n"
+          "./test.py [--help] [--directory=<path>] [--recursive] [--parse-script=<file>] [--int-script=<file>]\n"
+          "          [--int-only] [--php=<command>] [--jobs=<n>]\n"
+          "  --help\n"
+          "    vypise na standardni vystup napovedu skriptu\n"
+          "  --directory=<path>\n"
+          "    testy bude hledat v zadanem adresari, pri neuvedeni pouzije aktualni adresar\n"
+          "  --recursive\n"
+          "    testy bude hledat i rekurzivne v podadresarich\n"
+          "  --parse-script=<file>\n"
+          "    soubor se skriptem parse.php, pri neuvedeni pouzije parse.php v aktualnim adresari\n"
+          "  --int-script=<file>\n"
+          "    soubor se skriptem interpret.py, pri neuvedeni pouzije interpret.py v aktualnim adresari\n"
+          "  --int-only\n"
+          "    soubory .src obsahuji XML reprezentaci, parse.php se nespousti\n"
+          "  --php=<command>\n"
+          "    prikaz interpretu PHP, vychozi hodnota php5.6\n"
+          "  --jobs=<n>\n"
+          "    pocet soucasne bezicich testu, vychozi hodnota je pocet procesoru\n"
+          "\n"
+          "Kazdy program se vykona i bez optimalizaci, bez koncovych volani a s prekladem bloku, navratovy kod,\n"
+          "vystup a pocet vykonanych instrukci musi byt stejne. Nepovinny soubor .insts obsahuje ocekavany pocet\n"
+          "vykonanych instrukci (kontroluje se i pri chybe).\n"
+          "\n"
+          "Navratove kody:\n"
+          "  0    ok\n"
+          "  10   chyba pri zpracovani argumentu\n"
+          "  11   chyba nacitani vstupniho souboru\n"
+          "  12   chyba pri otevrirani vystupniho souboru pro zapis\n"
+          )
+
+
+def parse_parameters(argv):
+    """
+    Parse CLI arguments and return dictionary containing configuration, exit script when they are not valid.
+    # type: (list) -> dict
+    """
+    try:
+        (opts, args) = getopt.getopt(argv, "h", ["help", "directory=", "recursive", "parse-script=", "int-script=",
+                                                 "int-only", "php=", "jobs="])
+    except getopt.GetoptError as err:
+        sys.stderr.write("Neznamy parametr: " + err.opt + "\n")
+        help_print()
+        sys.exit(10)
+    if args:
+        sys.stderr.write("Neznamy parametr: " + args[0] + "\n")
+        help_print()
+        sys.exit(10)
+
+    conf = {"parser": "parse.php", "interpret": "interpret.py", "int_only": False, "php": "php5.6",
+            "jobs": os.cpu_count() or 1}
+    directory = "."
+    recursive = False
+    for option, value in opts:
+        if option in ("-h", "--help"):
+            help_print()
+            sys.exit(0)
+        elif option == "--directory":
+            directory = value
+        elif option == "--recursive":
+            recursive = True
+        elif option == "--parse-script":
+            conf["parser"] = value
+        elif option == "--int-script":
+            conf["interpret"] = value
+        elif option == "--int-only":
+            conf["int_only"] = True
+        elif option == "--php":
+            conf["php"] = value
+        elif option == "--jobs":
+            try:
+                conf["jobs"] = int(value)
+                if conf["jobs"] <= 0:
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write("Parametr --jobs musi byt kladne cele cislo, predano: " + value + "\n")
+                help_print()
+                sys.exit(10)
+
+    # Check if parser and interpret exist
+    for path in ([] if conf["int_only"] else [conf["parser"]]) + [conf["interpret"]]:
+        if not os.path.isfile(path):
+            sys.stderr.write('Soubor "' + path + '" neexistuje\n')
+            sys.exit(11)
+
+    # Check if directory containg tests exists
+    if not os.path.isdir(directory):
+        sys.stderr.write('Adresar "' + directory + '" neexistuje, nebo z nej nelze cist\n')
+        sys.exit(11)
+
+    conf["tests"] = find_files(directory, recursive)
+    return conf
+
+
+def find_files(directory, recursive):
+    """
+    Find all tests (paths without .src) inside specified directory.
+    # type: (str, bool) -> list
+    """
+    files = []
+    for item in sorted(os.listdir(directory)):
+        path = os.path.join(directory, item)
+        if not os.path.isdir(path):
+            if item.endswith(".src"):
+                files.append(path[:-4])
+        elif recursive:
+            files += find_files(path, True)  # Search recursivelly deeper
+    return files
+
+
+def prepare_files(base):
+    """
+    Check and create non-existing .in, .out and .rc files with default values.
+    # type: (str) -> None
+    """
+    for ext, content in ((".in", ""), (".out", ""), (".rc", "0")):
+        if not os.path.isfile(base + ext):
+            try:
+                with open(base + ext, "w") as file:
+                    file.write(content)
+            except OSError:
+                sys.stderr.write("Nelze vytvorit chybejici soubor s testy: " + base + ext + "\n")
+                sys.exit(12)
+
+
+def init_worker(conf):
+    """
+    Import interpret.py in worker process.
+    # type: (dict) -> None
+    """
+    global interpret, config
+    spec = importlib.util.spec_from_file_location("interpret", conf["interpret"])
+    interpret = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(interpret)
+    config = conf
+
+
+def run_interpret(source, data, params):
+    """
+    Run program in this process, return its return code, output, error output and number of executed instructions.
+    # type: (bytes, bytes, dict) -> tuple
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    insts = 0
+    try:
+        interpreter = interpret.Interpreter(**params)
+        interpreter.load(io.BytesIO(source))
+        result = interpreter.run(io.BytesIO(data), stdout, stderr, check=False)
+        status = result.code
+        insts = result.i_count
+        if result.error is not None:
+            stderr.write(str(result.error) + "\n")
+    except interpret.InterpretError as err:
+        status = err.errno
+        stderr.write(str(err) + "\n")
+    except Exception:  # error of interpret.py itself, python3 exits with 1
+        status = 1
+        stderr.write(traceback.format_exc())
+    return status, stdout.getvalue(), stderr.getvalue(), insts
+
+
+def pre(text):
+    """
+    Format text as HTML preformatted block.
+    # type: (str) -> str
+    """
+    return "<pre>" + html.escape(text).replace("\n", "<br />\n") + "</pre>"
+
+
+def run_test(test):
+    """
+    Run one test, return test, True when it passed, HTML message and time in seconds.
+    # type: (str) -> tuple
+    """
+    start = time.perf_counter()
+    with open(test + ".rc") as file:
+        expected_status = int(file.read().strip() or "0")
+    with open(test + ".src", "rb") as file:
+        source = file.read()
+    with open(test + ".in", "rb") as file:
+        data = file.read()
+
+    # Run parser, check return code
+    if not config["int_only"]:
+        parser = subprocess.run([config["php"], config["parser"]], input=source, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        if parser.returncode != 0:
+            elapsed = time.perf_counter() - start
+            if parser.returncode != expected_status:
+                return (test, False, "Parser skončil chybou " + str(parser.returncode) + ".<br>Chybový výstup:<br>" +
+                        pre(parser.stderr.decode("utf-8", "replace")), elapsed)
+            return test, True, "Parser správně skončil chybou " + str(parser.returncode) + ".", elapsed
+        source = parser.stdout
+
+    # Run interpret, check return code and expected/actual output
+    status, output, errors, insts = run_interpret(source, data, MODES[0][1])
+    elapsed = time.perf_counter() - start
+    if status != expected_status:
+        return (test, False, "Interpret skončil s návratovou hodnotou " + str(status) + ", očekáváno: " +
+                str(expected_status) + ".<br>Chybový výstup:<br>" + pre(errors), elapsed)
+    msg = "Interpret správně skončil s kódem " + str(status) + ".<br>"
+    if status == 0:  # Diff output with .out file
+        with open(test + ".out", encoding="utf-8") as file:
+            expected = file.read()
+        if output != expected:
+            diff = difflib.unified_diff(output.splitlines(True), expected.splitlines(True), "vystup", test + ".out")
+            return test, False, msg + "Očekáván jiný výstup interpretu:<br>" + pre("".join(diff)), elapsed
+        msg += "Výstup interpretu odpovídá souboru out.<br>"
+    if os.path.isfile(test + ".insts"):
+        with open(test + ".insts") as file:
+            expected_insts = int(file.read().strip())
+        if insts != expected_insts:
+            return (test, False, msg + "Vykonáno " + str(insts) + " instrukcí, očekáváno: " + str(expected_insts) +
+                    ".", elapsed)
+        msg += "Počet vykonaných instrukcí odpovídá souboru insts.<br>"
+
+    # Run interpret in other modes, they must behave the same
+    for name, params in MODES[1:]:
+        other = run_interpret(source, data, params)
+        if (other[0], other[1], other[3]) != (status, output, insts):
+            elapsed = time.perf_counter() - start
+            return (test, False, msg + "Interpret s parametry " + name + " skončil s kódem " + str(other[0]) +
+                    " po " + str(other[3]) + " instrukcích (jinak " + str(insts) + "), výstup:<br>" +
+                    pre(other[1]) + "Chybový výstup:<br>" + pre(other[2]), elapsed)
+    elapsed = time.perf_counter() - start
+    return test, True, msg + "Ostatní režimy interpretu se chovají stejně.", elapsed
+
+
+def run_tests(conf):
+    """
+    Run all tests in pool of processes, return results in order of tests.
+    # type: (dict) -> list
+    """
+    for test in conf["tests"]:
+        prepare_files(test)
+    with multiprocessing.Pool(conf["jobs"], init_worker, (conf,)) as pool:
+        return pool.map(run_test, conf["tests"], 1)
+
+
+def show_result(results, total):
+    """
+    Generate HTML page for results, print it to stdout.
+    # type: (list, float) -> None
+    """
+    out = []
+    try:
+        with open("report-top.html", encoding="utf-8") as file:
+            out.append(file.read())
+    except OSError:
+        pass
+
+    done = [result for result in results if result[1]]
+    fail = [result for result in results if not result[1]]
+    out.append("<p><strong>Úspěšných " + str(len(done)) + " z " + str(len(results)) + ".</strong> Celkový čas " +
+               "%.2f s, součet časů testů %.2f s.</p>" % (total, sum(result[3] for result in results)))
+
+    for title, items, mark, empty in (("Neúspěšné testy", fail, "<span style='color:#f44336;'>&#10006;</span>",
+                                       "Žádné neúšpěšné testy."),
+                                      ("Úspěšné testy", done, "<span style='color:#4caf50;'>&#10004;</span>",
+                                       "Žádné úšpěšné testy.")):
+        out.append("<h2>" + title + " (" + str(len(items)) + ")</h2>")
+        if items:
+            out.append("<ul>")
+            for test, _, msg, elapsed in items:
+                out.append("<li><h3>" + mark + " " + html.escape(test) + " <small>(%.3f s)</small></h3>" % elapsed +
+                           msg + "</li>")
+            out.append("</ul>")
+        else:
+            out.append("<p>" + empty + "</p>")
+
+    out.append("<h2>Nejpomalejší testy</h2><ol>")
+    for test, _, _, elapsed in sorted(results, key=lambda result: -result[3])[:SLOWEST]:
+        out.append("<li>%.3f s %s</li>" % (elapsed, html.escape(test)))
+    out.append("</ol>")
+
+    try:
+        with open("report-bot.html", encoding="utf-8") as file:
+            out.append(file.read())
+    except OSError:
+        pass
+    sys.stdout.write("".join(out))
+
+
+def main():
+    start = time.perf_counter()
+    conf = parse_parameters(sys.argv[1:])
+    results = run_tests(conf)
+    show_result(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()